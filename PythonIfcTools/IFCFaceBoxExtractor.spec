@@ -10,7 +10,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter', 'PyQt5', 'OCC.Display', 'matplotlib', 'IPython', 'scipy', 'pandas'],
     noarchive=False,
 )
 pyz = PYZ(a.pure)
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmark import syntheticModel
+from common import metrics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the tools print "<stage> took <seconds> seconds", numbers inside the stage name are replaced by N
+STAGE_PATTERN = re.compile(r'^(.*?)\s+took\s+([0-9.eE+-]+)\s+seconds', re.IGNORECASE)
+
+TOOLS = {
+    'IFCFaceExtractor': lambda model, out: [os.path.join('faceExtraction', 'IFCFaceExtractor.py'), '-i', model, '-o', os.path.join(out, 'faces.csv')],
+    'IFCFaceBoxExtractor': lambda model, out: [os.path.join('faceExtraction', 'IFCFaceBoxExtractor.py'), '-i', model, '-faces', '-boxes',
+                                               '-faceFile', os.path.join(out, 'faceInfo.csv'), '-boxFile', os.path.join(out, 'boxInfo.csv')],
+    'contourCalculator': lambda model, out: [os.path.join('contourCalculation', 'contourCalculator.py'), '-i', model, '-o', out, '-s', '0'],
+}
+
+
+def parseStages(output):
+    stages = {}
+    for line in output.splitlines():
+        match = STAGE_PATTERN.match(line.strip())
+        if match:
+            name = re.sub(r'\d+', 'N', match.group(1)).strip()
+            stages[name] = stages.get(name, 0.0) + float(match.group(2))
+    return stages
+
+
+def runTool(command, timeout):
+    # wall time, stages and peak memory of one tool run in a separate process
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + command, cwd=ROOT, env=environment, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        output = process.stdout.read()
+        peakMB = None
+        if hasattr(os, 'wait4'):
+            # wait4 reaps the process itself and returns its resource usage, ru_maxrss is in KB on Linux.
+            # The status is decoded like subprocess does, negative for a signal
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            peakMB = usage.ru_maxrss / (1024.0 * 1024.0) if sys.platform == 'darwin' else usage.ru_maxrss / 1024.0
+        else:
+            process.wait()
+            if sys.platform == 'win32':
+                # the handle stays valid until the Popen object is released
+                peakMB = metrics.getProcessPeakRSSMB(int(process._handle))
+    finally:
+        timedOut = not timer.is_alive()
+        timer.cancel()
+        process.stdout.close()
+
+    wallTime = time.perf_counter() - start
+    if timedOut:
+        return {'error': f'timeout after {timeout} seconds'}
+
+    # the peak memory is the one of the main process, the pool workers are not included
+    result = {'wallTime': wallTime, 'stages': parseStages(output), 'peakRSSMB': peakMB, 'returnCode': process.returncode}
+    if process.returncode != 0:
+        result['error'] = output.strip().splitlines()[-1] if output.strip() else f'exit code {process.returncode}'
+    return result
+
+
+def runBenchmarks(scales, tools, repeat, timeout, workDir):
+    results = {}
+    for scale in scales:
+        modelPath = os.path.join(workDir, f'benchmark_{scale}.ifc')
+        model = syntheticModel.createModel(syntheticModel.SCALES[scale])
+        model.write(modelPath)
+        numProducts = len(model.by_type('IfcProduct'))
+        del model
+        print(f'{scale}: {numProducts} products')
+
+        results[scale] = {'products': numProducts, 'tools': {}}
+        for tool in tools:
+            outDir = os.path.join(workDir, f'{scale}_{tool}')
+            os.makedirs(outDir, exist_ok=True)
+            runs = [runTool(TOOLS[tool](modelPath, outDir), timeout) for i in range(repeat)]
+            # the fastest run is the least disturbed one
+            best = min(runs, key=lambda x: x.get('wallTime', float('inf')))
+            results[scale]['tools'][tool] = best
+            if 'error' in best:
+                print(f'  {tool}: failed ({best["error"]})')
+            else:
+                print(f'  {tool}: {best["wallTime"]:.2f} s')
+
+    return results
+
+
+def compareWithBaseline(results, baseline, tolerance):
+    # list of [scale, tool, metric, baseline value, current value] that are more than tolerance slower
+    regressions = []
+    for scale, scaleResult in results.items():
+        for tool, current in scaleResult['tools'].items():
+            previous = baseline.get('results', {}).get(scale, {}).get('tools', {}).get(tool)
+            if previous is None or 'error' in previous or 'error' in current:
+                continue
+            metrics = [('wallTime', previous.get('wallTime'), current.get('wallTime'))]
+            metrics += [('stage ' + x, previous['stages'][x], current['stages'].get(x)) for x in previous.get('stages', {})]
+            for name, before, now in metrics:
+                if before is None or now is None:
+                    continue
+                ratio = now / before if before > 0 else 1.0
+                print(f'{scale:8} {tool:20} {name:50} {before:10.3f} {now:10.3f} {ratio:6.2f}')
+                if ratio > 1.0 + tolerance:
+                    regressions.append([scale, tool, name, before, now])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the extraction tools on synthetic IFC models')
+    parser.add_argument('-scales', default='small,medium', help='Comma separated model sizes of benchmark.syntheticModel.SCALES')
+    parser.add_argument('-tools', default=','.join(TOOLS), help='Comma separated tools to run')
+    parser.add_argument('-repeat', default=1, type=int, help='Runs per tool and scale, the fastest one is kept')
+    parser.add_argument('-timeout', default=3600, type=float, help='Timeout per run in seconds')
+    parser.add_argument('-o', default='benchmarkResults.json', help='The result json file')
+    parser.add_argument('-baseline', help='A previous result file to compare with')
+    parser.add_argument('-tolerance', default=0.2, type=float, help='Allowed slowdown compared to the baseline, 0.2 = 20 percent')
+    parser.add_argument('-workDir', help='Directory for models and outputs. Default is a temporary directory')
+    args = parser.parse_args()
+
+    scales = args.scales.split(',')
+    tools = args.tools.split(',')
+    for name in scales:
+        if name not in syntheticModel.SCALES:
+            sys.exit(f'Unknown scale {name}')
+    for name in tools:
+        if name not in TOOLS:
+            sys.exit(f'Unknown tool {name}')
+
+    if args.workDir:
+        os.makedirs(args.workDir, exist_ok=True)
+        results = runBenchmarks(scales, tools, args.repeat, args.timeout, args.workDir)
+    else:
+        with tempfile.TemporaryDirectory() as workDir:
+            results = runBenchmarks(scales, tools, args.repeat, args.timeout, workDir)
+
+    report = {'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+              'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}
+    with open(args.o, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote results to {args.o}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compareWithBaseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} metrics are more than {args.tolerance * 100:.0f} percent slower than the baseline')
+            sys.exit(1)
+        print('No regressions compared to the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import importProfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds until the tool exits for -h. The plugin starts the executables interactively, the budget includes the
+# unpacking of the one file executables
+DEFAULT_BUDGETS = {
+    'IFCFaceBoxExtractor': 2.0,
+    'IFCFaceExtractor': 2.0,
+    'PointCloudFragmentation': 1.5,
+}
+
+SCRIPTS = {
+    'IFCFaceBoxExtractor': os.path.join('faceExtraction', 'IFCFaceBoxExtractor.py'),
+    'IFCFaceExtractor': os.path.join('faceExtraction', 'IFCFaceExtractor.py'),
+    'PointCloudFragmentation': os.path.join('pointCloudFragmentation', 'PointCloudFragmentation.py'),
+}
+
+
+def getCommand(tool, exeDir):
+    # the frozen executable if exeDir is given, the script otherwise
+    if exeDir:
+        return [os.path.join(exeDir, tool + ('.exe' if sys.platform == 'win32' else ''))]
+    return [sys.executable, SCRIPTS[tool]]
+
+
+def measureStartup(command, arguments, repeat, environment=None):
+    # wall times of repeat runs of the command, the first run warms the file system cache and is not counted
+    environment = dict(os.environ if environment is None else environment)
+    environment['PYTHONPATH'] = os.pathsep.join([ROOT, environment.get('PYTHONPATH', '')])
+    times = []
+    for i in range(repeat + 1):
+        start = time.perf_counter()
+        subprocess.run(command + arguments, cwd=ROOT, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times[1:]
+
+
+def profileImports(command, arguments):
+    # import profile of one run, see common/importProfile.py
+    with tempfile.TemporaryDirectory() as tempDir:
+        reportPath = os.path.join(tempDir, 'imports.txt')
+        measureStartup(command, arguments, 0, dict(os.environ, **{importProfile.PROFILE_VARIABLE: reportPath}))
+        if not os.path.exists(reportPath):
+            return 'no import profile written'
+        with open(reportPath) as f:
+            return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of the tools against a budget')
+    parser.add_argument('-tools', default=','.join(DEFAULT_BUDGETS), help='Comma separated tools')
+    parser.add_argument('-exeDir', help='Directory of the frozen executables. Default runs the scripts')
+    parser.add_argument('-args', default='-h', help='Arguments of the measured call')
+    parser.add_argument('-repeat', default=5, type=int, help='Measured runs per tool')
+    parser.add_argument('-budget', type=float, help='Budget in seconds for all tools instead of the defaults')
+    parser.add_argument('-profile', action='store_true', help='Print the import profile of one run per tool')
+    parser.add_argument('-profileLines', default=25, type=int, help='Lines of the import profile to print')
+    args = parser.parse_args()
+
+    exceeded = []
+    for tool in args.tools.split(','):
+        if tool not in SCRIPTS:
+            sys.exit(f'Unknown tool {tool}')
+        command = getCommand(tool, args.exeDir)
+        times = measureStartup(command, args.args.split(), args.repeat)
+        budget = args.budget if args.budget is not None else DEFAULT_BUDGETS[tool]
+        median = statistics.median(times)
+        print(f'{tool}: median {median:.3f} s, min {min(times):.3f} s, max {max(times):.3f} s, budget {budget:.3f} s')
+        if median > budget:
+            exceeded.append(tool)
+        if args.profile:
+            print('\n'.join(profileImports(command, args.args.split()).splitlines()[:args.profileLines]))
+
+    if exceeded:
+        print(f'Startup budget exceeded by {", ".join(exceeded)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
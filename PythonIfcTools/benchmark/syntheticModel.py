@@ -0,0 +1,171 @@
+import argparse
+import collections
+import math
+import random
+import uuid
+
+import ifcopenshell
+import ifcopenshell.guid
+
+# NumStoreys: storeys with a slab each, WallsPerStorey: parallel walls of 10 m, OpeningsPerWall: openings cut into
+# every wall, ColumnsPerStorey: round columns, MappedItemsPerStorey: furnishing elements sharing one IfcRepresentationMap,
+# PlacementDepth: additional IfcLocalPlacements between the storey and each element
+ModelParameters = collections.namedtuple('ModelParameters', ['NumStoreys', 'WallsPerStorey', 'OpeningsPerWall', 'ColumnsPerStorey',
+                                                             'MappedItemsPerStorey', 'PlacementDepth'])
+
+SCALES = {
+    'small': ModelParameters(2, 10, 1, 4, 10, 2),
+    'medium': ModelParameters(5, 40, 2, 16, 50, 4),
+    'large': ModelParameters(10, 150, 3, 64, 200, 8),
+}
+
+STOREY_HEIGHT = 3.5
+WALL_HEIGHT = 3.0
+WALL_LENGTH = 10.0
+WALL_THICKNESS = 0.2
+WALL_SPACING = 3.0
+
+
+class ModelBuilder:
+
+    def __init__(self, seed=0):
+        self.Random = random.Random(seed)
+        self.File = ifcopenshell.file(schema='IFC4')
+
+    def guid(self):
+        # reproducible GUIDs, so models of the same parameters are identical
+        return ifcopenshell.guid.compress(uuid.UUID(int=self.Random.getrandbits(128)).hex)
+
+    def point(self, coordinates):
+        return self.File.create_entity('IfcCartesianPoint', Coordinates=[float(x) for x in coordinates])
+
+    def direction(self, ratios):
+        return self.File.create_entity('IfcDirection', DirectionRatios=[float(x) for x in ratios])
+
+    def axis2Placement(self, location=(0, 0, 0), axis=None, refDirection=None):
+        return self.File.create_entity('IfcAxis2Placement3D', Location=self.point(location),
+                                       Axis=self.direction(axis) if axis else None,
+                                       RefDirection=self.direction(refDirection) if refDirection else None)
+
+    def localPlacement(self, relativeTo=None, location=(0, 0, 0), refDirection=None):
+        return self.File.create_entity('IfcLocalPlacement', PlacementRelTo=relativeTo,
+                                       RelativePlacement=self.axis2Placement(location, (0, 0, 1) if refDirection else None, refDirection))
+
+    def placementChain(self, relativeTo, depth):
+        # chain of small offsets that cancel out, so the element ends up where it would be without the chain
+        placement = relativeTo
+        for i in range(depth):
+            offset = 0.01 if i % 2 == 0 and i < depth - 1 else -0.01 if i % 2 == 1 else 0.0
+            placement = self.localPlacement(placement, (offset, 0, 0))
+        return placement
+
+    def extrusion(self, profile, depth, location=(0, 0, 0)):
+        return self.File.create_entity('IfcExtrudedAreaSolid', SweptArea=profile, Position=self.axis2Placement(location),
+                                       ExtrudedDirection=self.direction((0, 0, 1)), Depth=float(depth))
+
+    def rectangle(self, xDim, yDim, center=(0, 0)):
+        position = self.File.create_entity('IfcAxis2Placement2D', Location=self.File.create_entity('IfcCartesianPoint', Coordinates=[float(x) for x in center]))
+        return self.File.create_entity('IfcRectangleProfileDef', ProfileType='AREA', Position=position, XDim=float(xDim), YDim=float(yDim))
+
+    def circle(self, radius):
+        position = self.File.create_entity('IfcAxis2Placement2D', Location=self.File.create_entity('IfcCartesianPoint', Coordinates=[0.0, 0.0]))
+        return self.File.create_entity('IfcCircleProfileDef', ProfileType='AREA', Position=position, Radius=float(radius))
+
+    def productShape(self, items, representationType='SweptSolid'):
+        representation = self.File.create_entity('IfcShapeRepresentation', ContextOfItems=self.Body, RepresentationIdentifier='Body',
+                                                 RepresentationType=representationType, Items=items)
+        return self.File.create_entity('IfcProductDefinitionShape', Representations=[representation])
+
+    def product(self, ifcType, name, placement, shape):
+        return self.File.create_entity(ifcType, GlobalId=self.guid(), Name=name, ObjectPlacement=placement, Representation=shape)
+
+    def createProject(self):
+        units = self.File.create_entity('IfcUnitAssignment', Units=[
+            self.File.create_entity('IfcSIUnit', UnitType='LENGTHUNIT', Name='METRE'),
+            self.File.create_entity('IfcSIUnit', UnitType='PLANEANGLEUNIT', Name='RADIAN')])
+        context = self.File.create_entity('IfcGeometricRepresentationContext', ContextType='Model', CoordinateSpaceDimension=3,
+                                          Precision=1e-5, WorldCoordinateSystem=self.axis2Placement())
+        self.Body = self.File.create_entity('IfcGeometricRepresentationSubContext', ContextIdentifier='Body', ContextType='Model',
+                                            ParentContext=context, TargetView='MODEL_VIEW')
+        project = self.File.create_entity('IfcProject', GlobalId=self.guid(), Name='Benchmark', RepresentationContexts=[context], UnitsInContext=units)
+
+        self.SitePlacement = self.localPlacement()
+        site = self.product('IfcSite', 'Site', self.SitePlacement, None)
+        self.BuildingPlacement = self.localPlacement(self.SitePlacement, (100, 50, 0), (0.8, 0.6, 0))
+        self.Building = self.product('IfcBuilding', 'Building', self.BuildingPlacement, None)
+        self.File.create_entity('IfcRelAggregates', GlobalId=self.guid(), RelatingObject=project, RelatedObjects=[site])
+        self.File.create_entity('IfcRelAggregates', GlobalId=self.guid(), RelatingObject=site, RelatedObjects=[self.Building])
+
+        # one shared representation for all furnishing elements
+        table = self.productShape([self.extrusion(self.rectangle(1.6, 0.8), 0.75)]).Representations[0]
+        self.TableMap = self.File.create_entity('IfcRepresentationMap', MappingOrigin=self.axis2Placement(), MappedRepresentation=table)
+
+    def createStorey(self, index, parameters):
+        elevation = index * STOREY_HEIGHT
+        placement = self.localPlacement(self.BuildingPlacement, (0, 0, elevation))
+        storey = self.product('IfcBuildingStorey', f'Storey {index}', placement, None)
+        storey.Elevation = elevation
+
+        elements = []
+        width = max(parameters.WallsPerStorey, 1) * WALL_SPACING
+        slab = self.product('IfcSlab', f'Slab {index}', self.placementChain(placement, parameters.PlacementDepth),
+                            self.productShape([self.extrusion(self.rectangle(WALL_LENGTH + 1, width, (WALL_LENGTH / 2, width / 2)), 0.25, (0, 0, -0.25))]))
+        elements.append(slab)
+
+        for i in range(parameters.WallsPerStorey):
+            wallPlacement = self.localPlacement(self.placementChain(placement, parameters.PlacementDepth), (0, i * WALL_SPACING, 0))
+            wall = self.product('IfcWall', f'Wall {index}-{i}', wallPlacement,
+                                self.productShape([self.extrusion(self.rectangle(WALL_LENGTH, WALL_THICKNESS, (WALL_LENGTH / 2, 0)), WALL_HEIGHT)]))
+            elements.append(wall)
+            for j in range(parameters.OpeningsPerWall):
+                x = (j + 0.5) * WALL_LENGTH / parameters.OpeningsPerWall
+                opening = self.product('IfcOpeningElement', None, self.localPlacement(wallPlacement, (x, 0, 0.8)),
+                                       self.productShape([self.extrusion(self.rectangle(1.0, 1.0), 1.2)]))
+                self.File.create_entity('IfcRelVoidsElement', GlobalId=self.guid(), RelatingBuildingElement=wall, RelatedOpeningElement=opening)
+
+        for i in range(parameters.ColumnsPerStorey):
+            location = (self.Random.uniform(0, WALL_LENGTH), self.Random.uniform(0, width), 0)
+            column = self.product('IfcColumn', f'Column {index}-{i}', self.localPlacement(self.placementChain(placement, parameters.PlacementDepth), location),
+                                  self.productShape([self.extrusion(self.circle(0.15), WALL_HEIGHT)]))
+            elements.append(column)
+
+        for i in range(parameters.MappedItemsPerStorey):
+            angle = self.Random.uniform(0, 2 * math.pi)
+            operator = self.File.create_entity('IfcCartesianTransformationOperator3D', Axis1=self.direction((math.cos(angle), math.sin(angle), 0)),
+                                               LocalOrigin=self.point((self.Random.uniform(1, WALL_LENGTH - 1), self.Random.uniform(1, width - 1), 0)),
+                                               Axis3=self.direction((0, 0, 1)))
+            item = self.File.create_entity('IfcMappedItem', MappingSource=self.TableMap, MappingTarget=operator)
+            furniture = self.product('IfcFurnishingElement', f'Table {index}-{i}', self.placementChain(placement, parameters.PlacementDepth),
+                                     self.productShape([item], 'MappedRepresentation'))
+            elements.append(furniture)
+
+        self.File.create_entity('IfcRelContainedInSpatialStructure', GlobalId=self.guid(), RelatingStructure=storey, RelatedElements=elements)
+        return storey
+
+
+def createModel(parameters, seed=0):
+    builder = ModelBuilder(seed)
+    builder.createProject()
+    storeys = [builder.createStorey(i, parameters) for i in range(parameters.NumStoreys)]
+    builder.File.create_entity('IfcRelAggregates', GlobalId=builder.guid(), RelatingObject=builder.Building, RelatedObjects=storeys)
+    return builder.File
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic IFC model for benchmarks')
+    parser.add_argument('-o', required=True, help='the output Ifc-File')
+    parser.add_argument('-scale', choices=list(SCALES), default='small', help='Predefined model size, single values can be overwritten')
+    for field in ModelParameters._fields:
+        parser.add_argument('-' + field[0].lower() + field[1:], type=int, help=f'overwrites {field} of the scale')
+    parser.add_argument('-seed', default=0, type=int, help='seed for GUIDs and random positions')
+    args = parser.parse_args()
+
+    parameters = SCALES[args.scale]._replace(**{x: getattr(args, x[0].lower() + x[1:]) for x in ModelParameters._fields
+                                                if getattr(args, x[0].lower() + x[1:]) is not None})
+    model = createModel(parameters, args.seed)
+    model.write(args.o)
+    print(f'Wrote {len(model.by_type("IfcProduct"))} products to {args.o}')
+
+
+if __name__ == '__main__':
+    main()
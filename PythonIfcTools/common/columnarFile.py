@@ -0,0 +1,144 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+# File layout:
+#   8 bytes magic, uint64 length of the JSON header, JSON header, data section
+# The data section starts and every column inside it is aligned to ALIGNMENT bytes, so uncompressed
+# columns can be used as NumPy views of a memory map without copying
+MAGIC = b'G3DCOL01'
+ALIGNMENT = 64
+
+
+def alignUp(value):
+    return (value + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def descrFromJSON(descr):
+    # JSON turns the tuples of a structured dtype description into lists
+    if isinstance(descr, str):
+        return descr
+    fields = []
+    for field in descr:
+        entry = [field[0], descrFromJSON(field[1])]
+        if len(field) > 2:
+            entry.append(tuple(field[2]))
+        fields.append(tuple(entry))
+    return fields
+
+
+class ColumnarWriter:
+    # Writes named arrays column by column. Appended data is spilled into temporary files next to the
+    # output, so the memory consumption does not depend on the size of the written data
+
+    def __init__(self, path, compression=None):
+        if compression not in (None, 'zlib'):
+            raise ValueError(f'unknown compression {compression}')
+        self.Path = os.path.abspath(path)
+        self.Compression = compression
+        self.Columns = {}
+        self.Attributes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def addColumn(self, name, dtype, shape=()):
+        self.Columns[name] = {'dtype': np.dtype(dtype), 'shape': tuple(shape), 'count': 0,
+                              'file': tempfile.TemporaryFile(dir=os.path.dirname(self.Path))}
+
+    def append(self, name, values):
+        column = self.Columns[name]
+        values = np.ascontiguousarray(values, dtype=column['dtype']).reshape((-1,) + column['shape'])
+        column['file'].write(values.tobytes())
+        column['count'] += len(values)
+
+    def setAttribute(self, key, value):
+        self.Attributes[key] = value
+
+    def discard(self):
+        for column in self.Columns.values():
+            column['file'].close()
+        self.Columns = {}
+
+    def close(self):
+        # compress the spilled columns first, their sizes are needed for the header
+        header = {'attributes': self.Attributes, 'columns': {}}
+        offset = 0
+        for name, column in self.Columns.items():
+            rawBytes = column['file'].tell()
+            column['file'].seek(0)
+            if self.Compression == 'zlib':
+                compressed = tempfile.TemporaryFile(dir=os.path.dirname(self.Path))
+                compressor = zlib.compressobj()
+                for block in iter(lambda: column['file'].read(1 << 24), b''):
+                    compressed.write(compressor.compress(block))
+                compressed.write(compressor.flush())
+                column['file'].close()
+                column['file'] = compressed
+                column['file'].seek(0, os.SEEK_END)
+                nbytes = column['file'].tell()
+                column['file'].seek(0)
+            else:
+                nbytes = rawBytes
+
+            header['columns'][name] = {'dtype': np.lib.format.dtype_to_descr(column['dtype']), 'shape': list(column['shape']),
+                                       'count': column['count'], 'offset': offset, 'nbytes': nbytes, 'rawbytes': rawBytes,
+                                       'compression': self.Compression}
+            offset = alignUp(offset + nbytes)
+
+        headerBytes = json.dumps(header).encode('utf-8')
+        dataStart = alignUp(len(MAGIC) + 8 + len(headerBytes))
+
+        with open(self.Path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(headerBytes)))
+            f.write(headerBytes)
+            for name, column in self.Columns.items():
+                f.write(b'\0' * (dataStart + header['columns'][name]['offset'] - f.tell()))
+                shutil.copyfileobj(column['file'], f, 1 << 24)
+                column['file'].close()
+
+        self.Columns = {}
+
+
+class ColumnarFile:
+    # Memory mapped reader, uncompressed columns are returned as read only views without copying
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a columnar result file')
+            headerLength = struct.unpack('<Q', f.read(8))[0]
+            header = json.loads(f.read(headerLength).decode('utf-8'))
+            self.Map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.DataStart = alignUp(len(MAGIC) + 8 + headerLength)
+        self.Attributes = header['attributes']
+        self.Columns = header['columns']
+
+    def column(self, name):
+        info = self.Columns[name]
+        dtype = np.lib.format.descr_to_dtype(descrFromJSON(info['dtype']))
+        shape = (info['count'],) + tuple(info['shape'])
+        itemCount = info['count'] * int(np.prod(info['shape'], dtype=np.int64))
+        if itemCount == 0:
+            return np.empty(shape, dtype=dtype)
+
+        start = self.DataStart + info['offset']
+        if info['compression'] == 'zlib':
+            data = zlib.decompress(self.Map[start:start + info['nbytes']])
+            return np.frombuffer(data, dtype=dtype, count=itemCount).reshape(shape)
+
+        return np.frombuffer(self.Map, dtype=dtype, count=itemCount, offset=start).reshape(shape)
@@ -0,0 +1,4 @@
+class ExtractionError(Exception):
+    # a check of the arguments or a step of a tool failed. The tool functions raise it so that Python callers
+    # keep their interpreter, only the main() of the tools ends the process with its message
+    pass
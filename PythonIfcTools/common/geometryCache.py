@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+
+import ifcopenshell
+from ifcopenshell import geom
+
+# settings that change the created geometry and therefore have to be part of the cache key
+CACHE_RELEVANT_SETTINGS = ['USE_PYTHON_OPENCASCADE', 'USE_BREP_DATA', 'DISABLE_TRIANGULATION', 'USE_WORLD_COORDS',
+                           'WELD_VERTICES', 'SEW_SHELLS', 'INCLUDE_CURVES', 'DISABLE_OPENING_SUBTRACTIONS',
+                           'APPLY_DEFAULT_MATERIALS', 'FASTER_BOOLEANS']
+
+# types the geometry iterator skips when neither include nor exclude is given
+DEFAULT_EXCLUDED_TYPES = ['IfcOpeningElement', 'IfcSpace']
+
+FILE_HASH_INDEX = 'fileHashes.json'
+# total size of the entries of all models as of the last close, so that the cache is only walked when it may be full
+SIZE_INDEX = 'cacheSize.json'
+
+
+def hashFile(filePath, blockSize=1 << 20):
+    sha = hashlib.sha256()
+    with open(filePath, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def describeSettings(settings):
+    description = {'ifcopenshell': ifcopenshell.version}
+    for name in CACHE_RELEVANT_SETTINGS:
+        if hasattr(settings, name):
+            try:
+                description[name] = settings.get(getattr(settings, name))
+            except Exception:
+                continue
+    return description
+
+
+class GeometryCache:
+
+    def __init__(self, cacheDir, ifcPath, settings, maxSizeMB=4096):
+        self.CacheDir = os.path.abspath(cacheDir)
+        self.MaxSize = int(maxSizeMB * 1024 * 1024)
+        self.Hits = 0
+        self.Misses = 0
+        self.StoredBytes = 0
+
+        os.makedirs(self.CacheDir, exist_ok=True)
+
+        fileHash = self.getFileHash(os.path.abspath(ifcPath))
+        settingsString = json.dumps(describeSettings(settings), sort_keys=True)
+        self.Key = hashlib.sha256((fileHash + settingsString).encode('utf-8')).hexdigest()[:32]
+        self.ModelDir = os.path.join(self.CacheDir, self.Key)
+        os.makedirs(self.ModelDir, exist_ok=True)
+
+    def getFileHash(self, ifcPath):
+        # hashing a large IFC file takes seconds, so the hash is remembered for path, size and modification time
+        indexPath = os.path.join(self.CacheDir, FILE_HASH_INDEX)
+        stat = os.stat(ifcPath)
+        indexKey = f"{ifcPath}|{stat.st_size}|{stat.st_mtime_ns}"
+
+        index = {}
+        if os.path.exists(indexPath):
+            try:
+                with open(indexPath) as f:
+                    index = json.load(f)
+            except Exception:
+                logging.warning('geometry cache file hash index is corrupt and will be rebuilt')
+
+        if indexKey not in index:
+            index = {key: value for key, value in index.items() if not key.startswith(ifcPath + '|')}
+            index[indexKey] = hashFile(ifcPath)
+            self.writeAtomic(indexPath, json.dumps(index).encode('utf-8'))
+
+        return index[indexKey]
+
+    def entryPath(self, guid):
+        # GlobalIds are case sensitive, file systems on windows are not
+        return os.path.join(self.ModelDir, guid.encode('utf-8').hex() + '.geom')
+
+    def load(self, guid):
+        path = self.entryPath(guid)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.Misses += 1
+            return False, None
+        except Exception as ex:
+            logging.warning(f'dropping unreadable geometry cache entry for {guid}: {ex}')
+            self.Misses += 1
+            self.remove(path)
+            return False, None
+
+        # the entry may have been evicted by another process sharing the cache in between
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        self.Hits += 1
+        return True, value
+
+    def store(self, guid, value):
+        # value None marks a product without geometry so that it is not sent to the kernel again
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self.writeAtomic(self.entryPath(guid), data)
+            self.StoredBytes += len(data)
+        except Exception as ex:
+            logging.warning(f'could not write geometry cache entry for {guid}: {ex}')
+
+    def writeAtomic(self, path, data):
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+        with open(tmpPath, 'wb') as f:
+            f.write(data)
+        os.replace(tmpPath, path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def readTrackedSize(self):
+        try:
+            with open(os.path.join(self.CacheDir, SIZE_INDEX)) as f:
+                return int(json.load(f)['size'])
+        except Exception:
+            return None
+
+    def writeTrackedSize(self, size):
+        try:
+            self.writeAtomic(os.path.join(self.CacheDir, SIZE_INDEX), json.dumps({'size': size}).encode('utf-8'))
+        except OSError as ex:
+            logging.warning(f'could not write geometry cache size: {ex}')
+        self.StoredBytes = 0
+
+    def evict(self):
+        # removes least recently used entries of all models until the cache fits into its size limit. The cache is
+        # only walked if the tracked size plus the entries stored by this process exceed the limit. Replaced entries
+        # are counted twice, which only leads to an earlier walk, and the walk corrects the tracked size
+        trackedSize = self.readTrackedSize()
+        if trackedSize is not None and trackedSize + self.StoredBytes <= self.MaxSize:
+            self.writeTrackedSize(trackedSize + self.StoredBytes)
+            return 0
+
+        entries = []
+        totalSize = 0
+        for root, dirs, files in os.walk(self.CacheDir):
+            for fileName in files:
+                if not fileName.endswith('.geom'):
+                    continue
+                path = os.path.join(root, fileName)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                totalSize += stat.st_size
+
+        if totalSize <= self.MaxSize:
+            self.writeTrackedSize(totalSize)
+            return 0
+
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if totalSize <= self.MaxSize:
+                break
+            self.remove(path)
+            totalSize -= size
+            removed += 1
+
+        self.writeTrackedSize(totalSize)
+
+        for entry in os.scandir(self.CacheDir):
+            try:
+                if entry.is_dir() and entry.path != self.ModelDir and not os.listdir(entry.path):
+                    os.rmdir(entry.path)
+            except OSError:
+                # removed or filled by another process in between
+                continue
+
+        logging.info(f'geometry cache evicted {removed} entries')
+        return removed
+
+    def close(self):
+        logging.info(f'geometry cache {self.ModelDir}: {self.Hits} hits, {self.Misses} misses')
+        print(f'geometry cache: {self.Hits} hits, {self.Misses} misses')
+        self.evict()
+
+
+def getCandidateProducts(ifc_file, include=None, exclude=None):
+    # the products the geometry iterator would process for the given include / exclude lists of types or entities
+    if include:
+        products = {}
+        for entry in include:
+            if isinstance(entry, str):
+                products.update({x.id(): x for x in ifc_file.by_type(entry)})
+            else:
+                products[entry.id()] = entry
+    else:
+        excludedTypes = exclude if exclude else DEFAULT_EXCLUDED_TYPES
+        excludedIds = {x.id() for entType in excludedTypes for x in ifc_file.by_type(entType)}
+        products = {x.id(): x for x in ifc_file.by_type('IfcProduct') if x.id() not in excludedIds}
+
+    return [x for x in products.values() if x.Representation is not None]
+
+
+def createShape(cache, settings, product):
+    # drop in replacement for geom.create_shape(settings, product).geometry
+    if cache is not None:
+        found, shape = cache.load(product.GlobalId)
+        if found and shape is not None:
+            return shape
+
+    shape = geom.create_shape(settings, product).geometry
+
+    if cache is not None:
+        cache.store(product.GlobalId, shape)
+    return shape
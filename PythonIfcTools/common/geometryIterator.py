@@ -0,0 +1,83 @@
+import multiprocessing
+
+import numpy as np
+from ifcopenshell import geom
+
+from . import geometryCache
+
+
+def getBRepIteratorSettings():
+    iterator_settings = geom.settings()
+    iterator_settings.set(iterator_settings.USE_PYTHON_OPENCASCADE, True)
+    iterator_settings.set(iterator_settings.DISABLE_TRIANGULATION, False)
+    iterator_settings.set(iterator_settings.USE_BREP_DATA, True)
+    return iterator_settings
+
+
+def getMeshIteratorSettings():
+    # triangulated geometry in world coordinates, no pythonOCC shapes are created
+    iterator_settings = geom.settings()
+    iterator_settings.set(iterator_settings.USE_PYTHON_OPENCASCADE, False)
+    iterator_settings.set(iterator_settings.USE_WORLD_COORDS, True)
+    iterator_settings.set(iterator_settings.WELD_VERTICES, True)
+    return iterator_settings
+
+
+def getMeshArrays(geometry):
+    # vertices (n, 3) and triangles (m, 3) of a triangulation, plain arrays can be cached and sent to workers
+    vertices = np.array(geometry.verts, dtype=np.float64).reshape(-1, 3)
+    triangles = np.array(geometry.faces, dtype=np.int64).reshape(-1, 3)
+    return vertices, triangles
+
+
+def iterateShapes(ifc_file, iterator_settings, include=None, exclude=None, numThreads=None, cache=None):
+    # generator yielding [IfcProduct, shape] as soon as the iterator has created the geometry.
+    # Nothing is kept here, so the caller decides how long a shape stays in memory
+    if include is not None and len(include) == 0:
+        return
+
+    if numThreads is None:
+        numThreads = multiprocessing.cpu_count()
+
+    if cache is not None:
+        yield from iterateShapesCached(ifc_file, iterator_settings, include, exclude, numThreads, cache)
+        return
+
+    iterator = geom.iterator(iterator_settings, ifc_file, numThreads, include=include, exclude=exclude)
+    meshOutput = not iterator_settings.get(iterator_settings.USE_PYTHON_OPENCASCADE)
+
+    if iterator.initialize():
+        while True:
+            shape_tuple = iterator.get()
+            if meshOutput:
+                # shapes of the mesh iterator are [vertices, triangles] arrays
+                yield ifc_file.by_guid(shape_tuple.guid), getMeshArrays(shape_tuple.geometry)
+            else:
+                yield ifc_file.by_guid(shape_tuple.data.guid), shape_tuple.geometry
+            del shape_tuple
+            if not iterator.next():
+                break
+
+
+def iterateShapesCached(ifc_file, iterator_settings, include, exclude, numThreads, cache):
+    uncachedProducts = []
+    for product in geometryCache.getCandidateProducts(ifc_file, include, exclude):
+        found, shape = cache.load(product.GlobalId)
+        if not found:
+            uncachedProducts.append(product)
+        elif shape is not None:
+            yield product, shape
+        del shape
+
+    if len(uncachedProducts) == 0:
+        return
+
+    pendingGuids = {x.GlobalId for x in uncachedProducts}
+    for product, shape in iterateShapes(ifc_file, iterator_settings, include=uncachedProducts, numThreads=numThreads):
+        cache.store(product.GlobalId, shape)
+        pendingGuids.discard(product.GlobalId)
+        yield product, shape
+
+    # the kernel could not create a shape for the remaining products, remember that as well
+    for guid in pendingGuids:
+        cache.store(guid, None)
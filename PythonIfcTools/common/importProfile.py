@@ -0,0 +1,106 @@
+import atexit
+import os
+import sys
+import time
+
+# Import time profile like python -X importtime, which is not available in the frozen executables.
+# Enabled by the environment variable GREEN3DSCAN_IMPORT_PROFILE=<report file>, the report is written at exit
+PROFILE_VARIABLE = 'GREEN3DSCAN_IMPORT_PROFILE'
+
+
+class TimingLoader:
+    # wraps the loader of a module and measures create_module and exec_module, imports of other modules
+    # during the execution are subtracted for the self time
+
+    def __init__(self, loader, profile, name):
+        self.Loader = loader
+        self.Profile = profile
+        self.Name = name
+
+    def __getattr__(self, name):
+        return getattr(self.Loader, name)
+
+    def create_module(self, spec):
+        return self.Profile.measure(self.Name, self.Loader.create_module, spec)
+
+    def exec_module(self, module):
+        # the wrapped loader is restored, so code inspecting module.__loader__ sees the original one
+        if getattr(module, '__loader__', None) is self:
+            module.__loader__ = self.Loader
+        if getattr(module, '__spec__', None) is not None and module.__spec__.loader is self:
+            module.__spec__.loader = self.Loader
+        return self.Profile.measure(self.Name, self.Loader.exec_module, module)
+
+
+class TimingFinder:
+
+    def __init__(self, profile):
+        self.Profile = profile
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = TimingLoader(spec.loader, self.Profile, name)
+            return spec
+        return None
+
+
+class ImportProfile:
+
+    def __init__(self):
+        self.Start = time.perf_counter()
+        # name -> [self seconds, cumulative seconds]
+        self.Times = {}
+        self.Stack = []
+        self.Finder = TimingFinder(self)
+
+    def measure(self, name, function, argument):
+        self.Stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return function(argument)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self.Stack.pop()
+            if self.Stack:
+                self.Stack[-1] += elapsed
+            selfTime, cumulative = self.Times.get(name, (0.0, 0.0))
+            self.Times[name] = (selfTime + elapsed - children, cumulative + elapsed)
+
+    def start(self):
+        if self.Finder not in sys.meta_path:
+            sys.meta_path.insert(0, self.Finder)
+
+    def stop(self):
+        if self.Finder in sys.meta_path:
+            sys.meta_path.remove(self.Finder)
+
+    def getReport(self, limit=50):
+        # the modules with the highest cumulative import time
+        totalImport = sum(x[0] for x in self.Times.values())
+        lines = [f'{len(self.Times)} modules imported in {totalImport:.3f} s, {time.perf_counter() - self.Start:.3f} s since profile start',
+                 f'{"self [s]":>10} {"cumulative [s]":>15}  module']
+        for name, (selfTime, cumulative) in sorted(self.Times.items(), key=lambda x: -x[1][1])[:limit]:
+            lines.append(f'{selfTime:10.4f} {cumulative:15.4f}  {name}')
+        return '\n'.join(lines)
+
+    def write(self, path, limit=200):
+        self.stop()
+        with open(path, 'w') as f:
+            f.write(self.getReport(limit) + '\n')
+
+
+def startFromEnvironment():
+    # to be called before the heavy imports of a tool. Returns the running profile or None
+    path = os.environ.get(PROFILE_VARIABLE)
+    if not path:
+        return None
+    profile = ImportProfile()
+    profile.start()
+    atexit.register(profile.write, os.path.abspath(path))
+    return profile
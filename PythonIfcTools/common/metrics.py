@@ -0,0 +1,221 @@
+import collections
+import contextlib
+import heapq
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+METRICS_FORMAT = 'Green3DScan.Metrics.1'
+
+# times of one product measured in the extraction workers, [wall, cpu] in seconds
+ProductTiming = collections.namedtuple('ProductTiming', ['FaceWallTime', 'FaceCPUTime', 'BoxWallTime', 'BoxCPUTime'], defaults=[0.0, 0.0, 0.0, 0.0])
+
+
+def getProcessPeakRSSMB(processHandle):
+    # peak working set in MB of a process on windows by its handle, e.g. of a terminated subprocess.Popen. None if unknown
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD), ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t), ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t), ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    getProcessMemoryInfo = ctypes.windll.psapi.GetProcessMemoryInfo
+    getProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    if getProcessMemoryInfo(processHandle, ctypes.byref(counters), counters.cb):
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    return None
+
+
+def getPeakRSSMB(children=False):
+    # peak resident memory in MB of this process or of all terminated child processes, None if unknown
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB everywhere else
+        return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+    if sys.platform == 'win32' and not children:
+        import ctypes
+        from ctypes import wintypes
+
+        getCurrentProcess = ctypes.windll.kernel32.GetCurrentProcess
+        getCurrentProcess.restype = wintypes.HANDLE
+        return getProcessPeakRSSMB(getCurrentProcess())
+    return None
+
+
+def getAvailableMemoryMB():
+    # physical memory in MB that can be used without swapping, None if unknown
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong), ('ullTotalPhys', ctypes.c_ulonglong),
+                        ('ullAvailPhys', ctypes.c_ulonglong), ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong), ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys / (1024 * 1024)
+        return None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class Stopwatch:
+
+    def __init__(self):
+        self.WallStart = time.perf_counter()
+        self.CPUStart = time.process_time()
+
+    def elapsed(self):
+        # [wall, cpu] seconds since the creation
+        return time.perf_counter() - self.WallStart, time.process_time() - self.CPUStart
+
+
+def newTimes():
+    return {'count': 0, 'wallTime': 0.0, 'cpuTime': 0.0}
+
+
+def addTimes(times, wallTime, cpuTime):
+    times['count'] += 1
+    times['wallTime'] += wallTime
+    times['cpuTime'] += cpuTime
+
+
+class MetricsRecorder:
+    # Collects wall time, CPU time and peak memory per stage of a tool and the times of the products per
+    # product stage (e.g. geometry iteration, face extraction, write), summed up per IFC entity type.
+    # Stages are blocks of the main process. The product stages may run in worker processes, their sums
+    # can therefore exceed the wall time of the enclosing stage. A product is kept until finishProduct, after
+    # that only the sums and the slowestCount slowest products. Without recordProducts only the stages are recorded
+
+    def __init__(self, tool, slowestCount=20, recordProducts=True):
+        self.Tool = tool
+        self.SlowestCount = slowestCount
+        self.RecordProducts = recordProducts
+        self.Watch = Stopwatch()
+        self.Attributes = {}
+        self.Stages = collections.OrderedDict()
+        # product -> [ifcType, {product stage -> [wall, cpu]}] of the products not finished yet. The product is the
+        # GlobalId, or [source, GlobalId] for tools reading several files, whose GlobalIds may repeat
+        self.Products = {}
+        self.ProductStages = collections.OrderedDict()
+        self.EntityTypes = {}
+        # min heap of [wall, number, product, ifcType, stages]
+        self.Slowest = []
+        self.FinishedProducts = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        watch = Stopwatch()
+        try:
+            yield
+        finally:
+            self.addStage(name, *watch.elapsed())
+
+    def addStage(self, name, wallTime, cpuTime):
+        times = self.Stages.setdefault(name, newTimes())
+        addTimes(times, wallTime, cpuTime)
+        times['peakRSSMB'] = getPeakRSSMB()
+
+    def setAttribute(self, name, value):
+        self.Attributes[name] = value
+
+    def setProductType(self, product, ifcType):
+        if self.RecordProducts:
+            self.Products.setdefault(product, [ifcType, {}])[0] = ifcType
+
+    def addProductTime(self, product, stage, wallTime, cpuTime):
+        if not self.RecordProducts:
+            return
+        stages = self.Products.setdefault(product, [None, {}])[1]
+        previous = stages.get(stage, (0.0, 0.0))
+        stages[stage] = (previous[0] + wallTime, previous[1] + cpuTime)
+
+    def addProductTiming(self, product, timing):
+        # timing: ProductTiming of the extraction workers
+        if timing.FaceWallTime or timing.FaceCPUTime:
+            self.addProductTime(product, 'face extraction', timing.FaceWallTime, timing.FaceCPUTime)
+        if timing.BoxWallTime or timing.BoxCPUTime:
+            self.addProductTime(product, 'box extraction', timing.BoxWallTime, timing.BoxCPUTime)
+
+    def finishProduct(self, product):
+        # adds the times of the product to the sums and to the slowest products and forgets it
+        if product not in self.Products:
+            return
+        ifcType, stages = self.Products.pop(product)
+        ifcType = ifcType if ifcType else 'unknown'
+        typeTimes = self.EntityTypes.setdefault(ifcType, {'count': 0, 'wallTime': 0.0, 'cpuTime': 0.0, 'stages': {}})
+        typeTimes['count'] += 1
+        for stage, (wallTime, cpuTime) in stages.items():
+            addTimes(self.ProductStages.setdefault(stage, newTimes()), wallTime, cpuTime)
+            addTimes(typeTimes['stages'].setdefault(stage, newTimes()), wallTime, cpuTime)
+            typeTimes['wallTime'] += wallTime
+            typeTimes['cpuTime'] += cpuTime
+
+        self.FinishedProducts += 1
+        entry = (sum(x[0] for x in stages.values()), self.FinishedProducts, product, ifcType, stages)
+        if len(self.Slowest) < self.SlowestCount:
+            heapq.heappush(self.Slowest, entry)
+        elif self.Slowest and entry[0] > self.Slowest[0][0]:
+            heapq.heapreplace(self.Slowest, entry)
+
+    def timeIterator(self, iterable, stage, getProduct):
+        # yields the items of iterable and records the time spent in the iterable for every item.
+        # getProduct returns [product, ifcType] of an item
+        if not self.RecordProducts:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            watch = Stopwatch()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            product, ifcType = getProduct(item)
+            self.setProductType(product, ifcType)
+            self.addProductTime(product, stage, *watch.elapsed())
+            yield item
+
+    def toDict(self):
+        for product in list(self.Products):
+            self.finishProduct(product)
+
+        slowest = []
+        for wallTime, number, product, ifcType, stages in sorted(self.Slowest, key=lambda x: (-x[0], x[1])):
+            item = {'source': product[0], 'guid': product[1]} if isinstance(product, tuple) else {'guid': product}
+            item.update({'type': ifcType, 'wallTime': wallTime, 'cpuTime': sum(x[1] for x in stages.values()),
+                         'stages': {x: {'wallTime': y[0], 'cpuTime': y[1]} for x, y in stages.items()}})
+            slowest.append(item)
+
+        wallTime, cpuTime = self.Watch.elapsed()
+        return {'format': METRICS_FORMAT, 'tool': self.Tool, 'attributes': self.Attributes,
+                'wallTime': wallTime, 'cpuTime': cpuTime, 'peakRSSMB': getPeakRSSMB(), 'peakChildRSSMB': getPeakRSSMB(True),
+                'stages': self.Stages, 'productStages': self.ProductStages,
+                'entityTypes': dict(sorted(self.EntityTypes.items(), key=lambda x: -x[1]['wallTime'])),
+                'slowestProducts': slowest}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.toDict(), f, indent=2)
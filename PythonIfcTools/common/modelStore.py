@@ -0,0 +1,99 @@
+import collections
+import json
+import logging
+import os
+
+import ifcopenshell
+
+from common import geometryCache
+
+
+class MemoryGeometryCache:
+    # Geometry cache in memory with the interface of geometryCache.GeometryCache. It keeps the created
+    # shapes alive between the requests of a long running process
+
+    def __init__(self):
+        self.Shapes = {}
+        self.Hits = 0
+        self.Misses = 0
+
+    def load(self, guid):
+        if guid in self.Shapes:
+            self.Hits += 1
+            return True, self.Shapes[guid]
+        self.Misses += 1
+        return False, None
+
+    def store(self, guid, value):
+        self.Shapes[guid] = value
+
+    def close(self):
+        # the shapes are kept, only the statistics are reset for the next request
+        logging.info(f'memory geometry cache: {self.Hits} hits, {self.Misses} misses, {len(self.Shapes)} shapes')
+        print(f'geometry cache: {self.Hits} hits, {self.Misses} misses')
+        self.Hits, self.Misses = 0, 0
+
+
+class StoredModel:
+
+    def __init__(self, path):
+        self.Path = path
+        self.Signature = getFileSignature(path)
+        self.File = ifcopenshell.open(path)
+        # settings description -> MemoryGeometryCache
+        self.Caches = {}
+
+    def getCache(self, settings):
+        key = json.dumps(geometryCache.describeSettings(settings), sort_keys=True)
+        if key not in self.Caches:
+            self.Caches[key] = MemoryGeometryCache()
+        return self.Caches[key]
+
+
+def getFileSignature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ModelStore:
+    # Keeps the last maxModels opened IFC files and their geometry. A model is opened again
+    # when size or modification time of its file changed
+
+    def __init__(self, maxModels=2, keepGeometry=True):
+        self.MaxModels = maxModels
+        self.KeepGeometry = keepGeometry
+        self.Models = collections.OrderedDict()
+
+    def getModel(self, path):
+        path = os.path.abspath(path)
+        model = self.Models.pop(path, None)
+        if model is not None and model.Signature != getFileSignature(path):
+            logging.info(f'{path} changed, opening it again')
+            model = None
+        if model is None:
+            model = StoredModel(path)
+        self.Models[path] = model
+
+        while len(self.Models) > self.MaxModels:
+            oldPath, _ = self.Models.popitem(last=False)
+            logging.info(f'closing model {oldPath}')
+        return model
+
+    def getFile(self, path):
+        return self.getModel(path).File
+
+    def getCacheFunction(self, path):
+        # the getCache argument of the tools, None if no geometry is kept
+        if not self.KeepGeometry:
+            return None
+        return self.getModel(path).getCache
+
+    def remove(self, path=None):
+        # closes one model or all models
+        if path is None:
+            self.Models.clear()
+        else:
+            self.Models.pop(os.path.abspath(path), None)
+
+    def getStatus(self):
+        return [{'path': x.Path, 'shapes': sum(len(y.Shapes) for y in x.Caches.values())} for x in self.Models.values()]
@@ -0,0 +1,96 @@
+import hashlib
+import logging
+
+import ifcopenshell
+
+from . import geometryCache
+
+
+class SignatureBuilder:
+    # Merkle hash over the attribute graph of an entity. Step ids are not part of the hash, so identical
+    # geometry exported into a new revision gets the same signature. Shared subgraphs are hashed only once
+
+    def __init__(self, ifc_file):
+        self.File = ifc_file
+        self.Memo = {}
+
+    def valueHash(self, value):
+        if isinstance(value, ifcopenshell.entity_instance):
+            if value.id() == 0:
+                # typed values like IfcLengthMeasure(1.0) have no step id
+                return value.is_a() + '(' + self.valueHash(value.wrappedValue) + ')'
+            return self.entityHash(value)
+        if isinstance(value, (tuple, list)):
+            return '(' + ','.join(self.valueHash(x) for x in value) + ')'
+        return repr(value)
+
+    def entityHash(self, entity):
+        entityId = entity.id()
+        if entityId in self.Memo:
+            return self.Memo[entityId]
+
+        attributes = ','.join(self.valueHash(entity[i]) for i in range(len(entity)))
+        digest = hashlib.sha1((entity.is_a() + '(' + attributes + ')').encode('utf-8')).hexdigest()
+        self.Memo[entityId] = digest
+        return digest
+
+    def productSignature(self, product):
+        # representation, placement chain and subtracted openings define the created shape
+        parts = [self.valueHash(product.Representation), self.valueHash(product.ObjectPlacement)]
+        for rel in getattr(product, 'HasOpenings', None) or []:
+            opening = rel.RelatedOpeningElement
+            parts.append(self.valueHash(opening.Representation) + self.valueHash(opening.ObjectPlacement))
+
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def getProductSignatures(ifc_file, products):
+    builder = SignatureBuilder(ifc_file)
+    return {x.GlobalId: builder.productSignature(x) for x in products}
+
+
+def compareRevisions(prev_ifc_file, ifc_file, include=None, exclude=None):
+    # returns the products of the new revision that need new geometry, the GlobalIds that can be reused
+    # from the previous results and the GlobalIds that were removed
+    products = geometryCache.getCandidateProducts(ifc_file, include, exclude)
+    signatures = getProductSignatures(ifc_file, products)
+
+    prevProducts = [x for x in prev_ifc_file.by_type('IfcProduct') if x.GlobalId in signatures and x.Representation is not None]
+    prevSignatures = getProductSignatures(prev_ifc_file, prevProducts)
+
+    changedProducts = [x for x in products if prevSignatures.get(x.GlobalId) != signatures[x.GlobalId]]
+    changedGuids = {x.GlobalId for x in changedProducts}
+    unchangedGuids = set(signatures.keys()) - changedGuids
+
+    currentGuids = {x.GlobalId for x in ifc_file.by_type('IfcProduct')}
+    removedGuids = {x.GlobalId for x in prev_ifc_file.by_type('IfcProduct') if x.GlobalId not in currentGuids}
+
+    logging.info(f'{len(changedProducts)} products are new or changed, {len(unchangedGuids)} unchanged, {len(removedGuids)} removed')
+    return changedProducts, unchangedGuids, removedGuids
+
+
+def readGuidsFromCsv(csvPath, guidColumn):
+    guids = set()
+    with open(csvPath) as f:
+        next(f, None)
+        for line in f:
+            columns = line.split(';', guidColumn + 1)
+            if len(columns) > guidColumn:
+                guids.add(columns[guidColumn])
+    return guids
+
+
+def copyRowsForGuids(csvPath, outFile, guidColumn, stateColumn, guids, stateID):
+    # copies the result rows of the given products from a previous output file and sets the new state id
+    counter = 0
+    with open(csvPath) as f:
+        next(f, None)
+        for line in f:
+            line = line.rstrip('\n')
+            columns = line.split(';', guidColumn + 1)
+            if len(columns) <= guidColumn or columns[guidColumn] not in guids:
+                continue
+            columns[stateColumn] = str(stateID)
+            outFile.write(';'.join(columns) + '\n')
+            counter += 1
+    return counter
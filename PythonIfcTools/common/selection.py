@@ -0,0 +1,166 @@
+import json
+import logging
+import operator
+
+from common import geometryCache
+
+# Product selection of the -entityList json files. All keys are optional:
+#   includeList / excludeList: entity types, subtypes are included (IfcWall also selects IfcWallStandardCase)
+#   includeGuids / excludeGuids: GlobalIds of single products
+#   storeys: names, GlobalIds or indices (in file order) of IfcBuildingStoreys, selects the contained products
+#   properties: filters {"pset": ..., "property": ..., "operator": "==", "value": ...} that all have to match.
+#       Without "value" the property only has to exist. Operators: == != < <= > >= in
+# Without includeList the selection starts from all IfcProducts except excludeList, or except IfcOpeningElement
+# and IfcSpace if excludeList is empty, like the geometry iterator. Every other key narrows the selection down
+SELECTION_KEYS = ['includeList', 'excludeList', 'includeGuids', 'excludeGuids', 'storeys', 'properties']
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, values: value in values,
+}
+
+
+def readSelection(path):
+    with open(path) as json_file:
+        selection = json.load(json_file)
+    unknownKeys = [x for x in selection if x not in SELECTION_KEYS]
+    if unknownKeys:
+        raise ValueError(f'unknown keys {unknownKeys} in selection file {path}')
+    return selection
+
+
+def isEmptySelection(selection):
+    return selection is None or not any(selection.get(x) for x in SELECTION_KEYS)
+
+
+def getTypeIds(ifc_file, types):
+    # ids of all instances of the types and their subtypes
+    ids = set()
+    for entType in types:
+        try:
+            ids.update(x.id() for x in ifc_file.by_type(entType))
+        except RuntimeError:
+            logging.warning(f'entity type {entType} is not part of the schema {ifc_file.schema}')
+            print(f'entity type {entType} is not part of the schema {ifc_file.schema}')
+    return ids
+
+
+def getGuidIds(ifc_file, guids):
+    ids = set()
+    for guid in guids:
+        try:
+            ids.add(ifc_file.by_guid(guid).id())
+        except RuntimeError:
+            logging.warning(f'GlobalId {guid} was not found')
+    return ids
+
+
+def findStorey(storeys, key):
+    if isinstance(key, int):
+        return storeys[key] if -len(storeys) <= key < len(storeys) else None
+    for storey in storeys:
+        if key == storey.GlobalId or key == storey.Name:
+            return storey
+    return None
+
+
+def getDecompositionIds(element):
+    # the element, the products aggregated by it and, for spatial elements, the products contained in it
+    ids = set()
+    stack = [element]
+    while stack:
+        current = stack.pop()
+        if current.id() in ids:
+            continue
+        ids.add(current.id())
+        for rel in getattr(current, 'IsDecomposedBy', []) or []:
+            stack.extend(rel.RelatedObjects)
+        for rel in getattr(current, 'ContainsElements', []) or []:
+            stack.extend(rel.RelatedElements)
+    return ids
+
+
+def getStoreyIds(ifc_file, keys):
+    storeys = ifc_file.by_type('IfcBuildingStorey')
+    ids = set()
+    for key in keys:
+        storey = findStorey(storeys, key)
+        if storey is None:
+            logging.warning(f'storey {key} was not found')
+            print(f'storey {key} was not found')
+            continue
+        ids.update(getDecompositionIds(storey))
+    return ids
+
+
+def getPropertyValue(psets, psetName, propertyName):
+    # [found, value]
+    pset = psets.get(psetName)
+    if pset is None or propertyName not in pset:
+        return False, None
+    return True, pset[propertyName]
+
+
+def matchesProperties(product, filters):
+    import ifcopenshell.util.element
+
+    psets = ifcopenshell.util.element.get_psets(product)
+    for entry in filters:
+        found, value = getPropertyValue(psets, entry['pset'], entry['property'])
+        if not found:
+            return False
+        if 'value' not in entry:
+            continue
+        try:
+            if not OPERATORS[entry.get('operator', '==')](value, entry['value']):
+                return False
+        except TypeError:
+            # e.g. a text compared with a number
+            return False
+    return True
+
+
+def selectProductIds(ifc_file, selection):
+    # set of the ids of all selected IfcProducts with a representation
+    selection = selection if selection is not None else {}
+    if selection.get('includeList'):
+        ids = getTypeIds(ifc_file, selection['includeList']) & getTypeIds(ifc_file, ['IfcProduct'])
+        ids -= getTypeIds(ifc_file, selection.get('excludeList', []))
+    else:
+        excludedTypes = selection.get('excludeList') or geometryCache.DEFAULT_EXCLUDED_TYPES
+        ids = getTypeIds(ifc_file, ['IfcProduct']) - getTypeIds(ifc_file, excludedTypes)
+
+    if selection.get('includeGuids'):
+        ids &= getGuidIds(ifc_file, selection['includeGuids'])
+    ids -= getGuidIds(ifc_file, selection.get('excludeGuids', []))
+    if selection.get('storeys'):
+        ids &= getStoreyIds(ifc_file, selection['storeys'])
+
+    ids = {x for x in ids if ifc_file.by_id(x).Representation is not None}
+    if selection.get('properties'):
+        ids = {x for x in ids if matchesProperties(ifc_file.by_id(x), selection['properties'])}
+    return ids
+
+
+def selectProducts(ifc_file, selection):
+    # the selected products ordered by their step id
+    return [ifc_file.by_id(x) for x in sorted(selectProductIds(ifc_file, selection))]
+
+
+def getIteratorArguments(ifc_file, selection):
+    # [include, exclude] for geom.iterator and geometryIterator.iterateShapes. Without selection the iterator
+    # defaults are kept, otherwise the selected products are passed as include list, so no other product is tessellated
+    if isEmptySelection(selection):
+        return None, None
+    return selectProducts(ifc_file, selection), None
+
+
+def describeSelection(selection):
+    if isEmptySelection(selection):
+        return 'all IfcProducts'
+    return ', '.join(f'{x}: {selection[x]}' for x in SELECTION_KEYS if selection.get(x))
@@ -1,7 +1,11 @@
-from OCC.Core import gp, BRepBuilderAPI
+import logging
+
+import numpy as np
 
 from . import calculations
 
+# OCC is imported by the functions using it, so the mesh based tools start without it
+
 
 class Axis2Placement3D:
 
@@ -12,6 +16,7 @@ class Axis2Placement3D:
         self.YAxis = calculations.crossFromAxis(axis, refDirection)
 
     def getTrsfMatrix(self):
+        from OCC.Core import gp
         trsf = gp.gp_Trsf()
         a11 = self.RefDirection[0]
         a21 = self.RefDirection[1]
@@ -119,6 +124,7 @@ def localPlacementIfc2Axis2Placement(ifcLocalPlacement):
     return Axis2Placement3D(loc, refDir, axis)
 
 def transformListOfOCCShape(shapes, trsfMatrix):
+    from OCC.Core import BRepBuilderAPI
     transformedShapes = []
     brepTransformator = BRepBuilderAPI.BRepBuilderAPI_Transform(trsfMatrix)
 
@@ -126,4 +132,171 @@ def transformListOfOCCShape(shapes, trsfMatrix):
         brepTransformator.Perform(shape)
         transformedShapes.append(brepTransformator.Shape())
 
-    return transformedShapes
\ No newline at end of file
+    return transformedShapes
+
+###########################################
+### Placement resolver
+###########################################
+def axis2PlacementMatrices(locations, axes, refDirections):
+    # 4x4 matrices for n placements given as (n, 3) arrays. The RefDirection is projected into the plane
+    # perpendicular to the Axis as defined for IfcAxis2Placement3D
+    zAxes = axes / np.linalg.norm(axes, axis=1)[:, None]
+    xAxes = refDirections - np.sum(refDirections * zAxes, axis=1)[:, None] * zAxes
+    xAxes = xAxes / np.linalg.norm(xAxes, axis=1)[:, None]
+    yAxes = np.cross(zAxes, xAxes)
+
+    matrices = np.zeros((len(locations), 4, 4))
+    matrices[:, :3, 0] = xAxes
+    matrices[:, :3, 1] = yAxes
+    matrices[:, :3, 2] = zAxes
+    matrices[:, :3, 3] = locations
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def getTrsfFromMatrix(matrix):
+    from OCC.Core import gp
+    trsf = gp.gp_Trsf()
+    trsf.SetValues(matrix[0, 0], matrix[0, 1], matrix[0, 2], matrix[0, 3],
+                   matrix[1, 0], matrix[1, 1], matrix[1, 2], matrix[1, 3],
+                   matrix[2, 0], matrix[2, 1], matrix[2, 2], matrix[2, 3])
+    return trsf
+
+
+def transformPoints(matrix, points):
+    # applies a 4x4 matrix to an (n, 3) array of points
+    return np.matmul(points, matrix[:3, :3].T) + matrix[:3, 3]
+
+
+def transformDirections(matrix, directions):
+    return np.matmul(directions, matrix[:3, :3].T)
+
+
+def getDirectionRatios(direction, default):
+    # unit vector of an IfcDirection with 2 or 3 ratios
+    if direction is None:
+        return np.array(default, dtype=np.float64)
+    ratios = np.zeros(3)
+    ratios[:len(direction.DirectionRatios)] = direction.DirectionRatios
+    return ratios / np.linalg.norm(ratios)
+
+
+def getOperatorMatrix(operator):
+    # 4x4 matrix of an IfcCartesianTransformationOperator (MappingTarget of an IfcMappedItem) in file units. The
+    # axes follow the BaseAxis function of the standard, so scale and mirroring by Axis2 are part of the matrix
+    if operator is None:
+        return np.eye(4)
+    zAxis = getDirectionRatios(getattr(operator, 'Axis3', None), (0.0, 0.0, 1.0))
+    xAxis = getDirectionRatios(operator.Axis1, (1.0, 0.0, 0.0))
+    xAxis = xAxis - np.dot(xAxis, zAxis) * zAxis
+    if np.linalg.norm(xAxis) < 1e-9:
+        xAxis = np.array([0.0, 1.0, 0.0]) - zAxis[1] * zAxis
+    xAxis /= np.linalg.norm(xAxis)
+    yAxis = np.cross(zAxis, xAxis)
+    if operator.Axis2 is not None and np.dot(getDirectionRatios(operator.Axis2, yAxis), yAxis) < 0:
+        yAxis = -yAxis
+
+    scale = operator.Scale if operator.Scale is not None else 1.0
+    scales = [scale, getattr(operator, 'Scale2', None) or scale, getattr(operator, 'Scale3', None) or scale]
+    matrix = np.eye(4)
+    matrix[:3, 0], matrix[:3, 1], matrix[:3, 2] = xAxis * scales[0], yAxis * scales[1], zAxis * scales[2]
+    coordinates = operator.LocalOrigin.Coordinates
+    matrix[:len(coordinates), 3] = coordinates
+    return matrix
+
+
+def getInvertedBuildingMatrix(ifc_file, resolver=None):
+    # matrix from site into building coordinate system, used for -buildingCS
+    if resolver is None:
+        resolver = PlacementResolver(ifc_file)
+    building = ifc_file.by_type('IfcBuilding')[0]
+    return np.linalg.inv(resolver.getEntityMatrix(building))
+
+
+class PlacementResolver:
+    # Computes the world matrices of all IfcLocalPlacements of a file in one pass. The placements are
+    # resolved level by level from the root of the PlacementRelTo tree, so shared parents like site,
+    # building and storey are only computed once and all placements of one level in one batched product
+
+    def __init__(self, ifc_file):
+        placements = ifc_file.by_type('IfcObjectPlacement')
+        self.File = ifc_file
+        self.Index = {x.id(): i for i, x in enumerate(placements)}
+
+        n = len(placements)
+        locations = np.zeros((n, 3))
+        axes = np.tile([0.0, 0.0, 1.0], (n, 1))
+        refDirections = np.tile([1.0, 0.0, 0.0], (n, 1))
+        self.Parents = np.full(n, -1, dtype=np.int64)
+
+        for i, placement in enumerate(placements):
+            if not placement.is_a('IfcLocalPlacement'):
+                logging.warning(f'{placement.is_a()} is not supported, using identity for #{placement.id()}')
+                continue
+
+            relPlc = placement.RelativePlacement
+            coordinates = relPlc.Location.Coordinates
+            locations[i, :len(coordinates)] = coordinates
+            if relPlc.RefDirection is not None:
+                ratios = relPlc.RefDirection.DirectionRatios
+                refDirections[i, :] = 0.0
+                refDirections[i, :len(ratios)] = ratios
+            if relPlc.is_a('IfcAxis2Placement3D') and relPlc.Axis is not None:
+                axes[i] = relPlc.Axis.DirectionRatios
+
+            if placement.PlacementRelTo is not None:
+                self.Parents[i] = self.Index[placement.PlacementRelTo.id()]
+
+        self.LocalMatrices = axis2PlacementMatrices(locations, axes, refDirections)
+        self.Levels = self.getLevels()
+
+        self.WorldMatrices = self.LocalMatrices.copy()
+        for level in self.Levels[1:]:
+            self.WorldMatrices[level] = np.matmul(self.WorldMatrices[self.Parents[level]], self.LocalMatrices[level])
+
+    def getLevels(self):
+        # index arrays of the placements per depth in the PlacementRelTo tree, roots first
+        resolved = self.Parents < 0
+        levels = [np.flatnonzero(resolved)]
+        while not resolved.all():
+            ready = ~resolved & (self.Parents >= 0) & resolved[np.maximum(self.Parents, 0)]
+            if not ready.any():
+                raise ValueError('PlacementRelTo contains a cycle')
+            levels.append(np.flatnonzero(ready))
+            resolved |= ready
+        return levels
+
+    def getPlacementIndices(self, entities):
+        return np.array([self.Index[x.ObjectPlacement.id()] for x in entities], dtype=np.int64)
+
+    def getEntityMatrix(self, entity):
+        return self.WorldMatrices[self.Index[entity.ObjectPlacement.id()]]
+
+    def getEntityMatrices(self, entities):
+        # (n, 4, 4) world matrices for a list of placed entities
+        return self.WorldMatrices[self.getPlacementIndices(entities)]
+
+    def getStopAncestors(self, stopEntity):
+        # for every placement the index of the first ancestor placing an object of type stopEntity, -1 if none
+        placesStop = np.zeros(len(self.Parents), dtype=bool)
+        for obj in self.File.by_type(stopEntity):
+            if getattr(obj, 'ObjectPlacement', None) is not None:
+                placesStop[self.Index[obj.ObjectPlacement.id()]] = True
+
+        stopAncestors = np.full(len(self.Parents), -1, dtype=np.int64)
+        for level in self.Levels[1:]:
+            parents = self.Parents[level]
+            stopAncestors[level] = np.where(placesStop[parents], parents, stopAncestors[parents])
+        return stopAncestors
+
+    def getEntityMatricesUpToEntity(self, entities, stopEntity):
+        # batched version of getCombinedAxis2PlcUpToEntity: matrices relative to the placement of the
+        # first ancestor of type stopEntity
+        indices = self.getPlacementIndices(entities)
+        stopIndices = self.getStopAncestors(stopEntity)[indices]
+
+        matrices = self.WorldMatrices[indices].copy()
+        hasStop = stopIndices >= 0
+        if hasStop.any():
+            matrices[hasStop] = np.matmul(np.linalg.inv(self.WorldMatrices[stopIndices[hasStop]]), matrices[hasStop])
+        return matrices
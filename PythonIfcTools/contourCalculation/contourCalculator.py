@@ -1,113 +1,218 @@
 import argparse
 import itertools
-import json
+import logging
+import multiprocessing
 import os
-import subprocess
 import sys
+import time
 
 import ifcopenshell
-from OCC.Core import gp, BRepAlgoAPI
-from OCC.Extend import TopologyUtils
+import numpy as np
 from ifcopenshell import geom
 
-import contourHelper
-from common import ifcUtils
-
-parser = argparse.ArgumentParser(description='Extract Building Contour from Ifc-File')
-parser.add_argument('-i', required=True, help='the input Ifc-File')
-parser.add_argument('-o', required=True, help='the path to the output directory')
-parser.add_argument('-s', required=True, help='Nr of storey for which section is made')
-parser.add_argument('-height', default=1.0, help='height offset where section is made based from elevation of storey')
-parser.add_argument('-entityList', help='List of IfcProducts that should be processed')
-
-args = parser.parse_args()
-
-ifc_file = ifcopenshell.open(args.i)
-settings = geom.settings()
-settings.set(settings.USE_PYTHON_OPENCASCADE, True)
-
-lengthUnit = ifcUtils.getLengthUnit(ifc_file)
-heightFactor = 1
-if lengthUnit == 'millimeter':
-    heightFactor = 1000
-
-storeys = ifc_file.by_type('IfcBuildingStorey')
-elementsInStorey = ifcUtils.getProductsForBuildingStorey(storeys[int(args.s)])
-
-if args.entityList:
-    with open(args.entityList) as json_file:
-        entityList = json.load(json_file)
-
-    if len(entityList['includeList']) > 0:
-        entitiesToInclude = []
-        for elemType in entityList['includeList']:
-            entitiesToInclude.append(ifc_file.by_type(elemType))
-        entitiesToInclude = list(itertools.chain.from_iterable(entitiesToInclude))
-
-        elementsInStorey = [x for x in elementsInStorey if x in entitiesToInclude]
-
-    if len(entityList['excludeList']) > 0:
-        products = ifc_file.by_type('IfcProduct')
-        entitiesToExclude = []
-        for elemType in entityList['excludeList']:
-            entitiesToExclude.append(ifc_file.by_type(elemType))
-        entitiesToExclude = list(itertools.chain.from_iterable(entitiesToExclude))
-
-        elementsInStorey = [x for x in elementsInStorey if x not in entitiesToExclude]
-
-shapes = []
-for elem in elementsInStorey:
-    try:
-        shapes.append(geom.create_shape(settings, elem).geometry)
-    except:
-        pass
-
-storyElevation = storeys[int(args.s)].Elevation
-if storyElevation is not None:
-    section_height = (storyElevation / heightFactor) + float(args.height)
-else:
-    section_height =ifcUtils.getMediumHeightFromShapes(shapes)
-
-section_plane = gp.gp_Pln(gp.gp_Pnt(0, 0, section_height), gp.gp_Dir(0, 0, 1))
-
-all_section_edges = []
-for idx, shape in enumerate(shapes):
+from common import geometryCache, geometryIterator, ifcUtils, selection
+from common.extractionError import ExtractionError
+
+
+def getArgumentParser():
+    parser = argparse.ArgumentParser(description='Extract Building Contour from Ifc-File')
+    parser.add_argument('-i', required=True, help='the input Ifc-File')
+    parser.add_argument('-o', required=True, help='the path to the output directory')
+    parser.add_argument('-s', help='Nr of storey for which section is made')
+    parser.add_argument('-height', default=1.0, help='height offset where section is made based from elevation of storey')
+    parser.add_argument('-allStoreys', action='store_true', help='Write the section segments of all storeys to sections.csv instead of the contour of -s')
+    parser.add_argument('-heights', help='Comma separated height offsets, writes the section segments at all of them to sections.csv instead of the contour')
+    parser.add_argument('-tolerance', default=1e-6, type=float, help='Distance in meter below which end points of section segments are welded')
+    parser.add_argument('-entityList', help='List of IfcProducts that should be processed')
+    parser.add_argument('-cacheDir', help='Directory of the persistent geometry cache. If not set, no cache is used')
+    parser.add_argument('-cacheSize', help='Maximum size of the geometry cache in MB', default=4096, type=float)
+    return parser
+
+
+def getArguments(ifcPath, outDir, storey, **options):
+    # the command line defaults, overwritten by options named like the command line flags, e.g. height=1.5
+    args = getArgumentParser().parse_args(['-i', ifcPath, '-o', outDir, '-s', str(storey)])
+    for name, value in options.items():
+        if not hasattr(args, name):
+            raise TypeError(f'unknown option {name}')
+        setattr(args, name, value)
+    return args
+
+
+def calculateContour(args, ifc_file=None, getCache=None):
+    # runs the contour calculation for the arguments of getArgumentParser. A model opened already and a function
+    # returning the geometry cache for the settings can be passed. Returns the path of the written WKT file
+    if args.allStoreys or args.heights:
+        return calculateSections(args, ifc_file, getCache)
+    if args.s is None:
+        logging.error('Either -s, -allStoreys or -heights is required. Terminating process')
+        raise ExtractionError('Either -s, -allStoreys or -heights is required. Terminating process')
+
+    from OCC.Core import gp, BRepAlgoAPI
+    from OCC.Extend import TopologyUtils
+
+    from contourCalculation import contourHelper, heightIndex
+
+    if ifc_file is None:
+        ifc_file = ifcopenshell.open(args.i)
+    settings = geom.settings()
+    settings.set(settings.USE_PYTHON_OPENCASCADE, True)
+
+    cache = getCache(settings) if getCache is not None else None
+    if cache is None and args.cacheDir:
+        cache = geometryCache.GeometryCache(args.cacheDir, args.i, settings, args.cacheSize)
+
+    lengthUnit = ifcUtils.getLengthUnit(ifc_file)
+    heightFactor = 1
+    if lengthUnit == 'millimeter':
+        heightFactor = 1000
+
+    storeys = ifc_file.by_type('IfcBuildingStorey')
+    elementsInStorey = contourHelper.getProductsForBuildingStorey(storeys[int(args.s)])
+
+    if args.entityList:
+        selectedIds = selection.selectProductIds(ifc_file, selection.readSelection(args.entityList))
+        elementsInStorey = [x for x in elementsInStorey if x.id() in selectedIds]
+
+    # the z ranges of the storey elements, only elements missing in the stored index are created for it
+    indexPath = heightIndex.getIndexPath(cache)
+    zIndex = heightIndex.loadIndex(indexPath)
+    shapes = {}
+    zRanges = {}
+    for elem in elementsInStorey:
+        if zIndex.hasProduct(elem.GlobalId):
+            continue
+        try:
+            shapes[elem.GlobalId] = geometryCache.createShape(cache, settings, elem)
+            zRanges[elem.GlobalId] = heightIndex.getShapeZRange(shapes[elem.GlobalId])
+        except:
+            pass
+    zIndex = zIndex.withRanges(zRanges)
+    if indexPath is not None and zRanges:
+        zIndex.save(indexPath)
+
+    storyElevation = storeys[int(args.s)].Elevation
+    if storyElevation is not None:
+        section_height = (storyElevation / heightFactor) + float(args.height)
+    else:
+        section_height = zIndex.getMiddleHeight([x.GlobalId for x in elementsInStorey])
+        if section_height is None:
+            print('No geometry in storey!')
+            return None
+
+    # only the elements crossing the section plane are cut
+    crossingGuids = set(zIndex.query(section_height))
+    crossingShapes = []
+    for elem in elementsInStorey:
+        if elem.GlobalId not in crossingGuids:
+            continue
+        try:
+            crossingShapes.append(shapes[elem.GlobalId] if elem.GlobalId in shapes else geometryCache.createShape(cache, settings, elem))
+        except:
+            pass
+
+    if cache is not None:
+        cache.close()
+
+    logging.info(f'{len(crossingShapes)} of {len(elementsInStorey)} elements cross the section at {section_height}')
+    print(f'{len(crossingShapes)} of {len(elementsInStorey)} elements cross the section at {section_height}')
+
+    section_plane = gp.gp_Pln(gp.gp_Pnt(0, 0, section_height), gp.gp_Dir(0, 0, 1))
+
+    all_section_edges = []
+    for idx, shape in enumerate(crossingShapes):
+        try:
+            section = BRepAlgoAPI.BRepAlgoAPI_Section(shape, section_plane).Shape()
+            all_section_edges.append(list(TopologyUtils.TopologyExplorer(section).edges()))
+        except:
+            pass
+
+    edges = list(itertools.chain.from_iterable(all_section_edges))
+
+    if len(edges) < 1:
+        print('No edges at section! (maybe use other section height?)')
+        return None
+
+    # end points of all edges welded at once, the outline works on the shared point indices
+    endpoints = contourHelper.getEdgeEndpoints(edges)
+    graph = contourHelper.buildSegmentGraph(endpoints[:, :, 0:2].reshape(-1, 4), args.tolerance)
+    logging.info(f'{len(edges)} section edges welded to {len(graph.Edges)} edges between {len(graph.Points)} points')
+
+    # outer boundary of the section, computed in this process
+    rings = contourHelper.getGraphOutlineRings(graph, args.tolerance)
+    if not rings:
+        print('No closed contour at section! (maybe use other section height?)')
+        return None
+
+    out_file_name = os.path.join(os.path.abspath(args.o), "contour_wkt.txt")
+    contourHelper.writeWKTStringToFile(contourHelper.getWKTStringFromRings(rings, section_height), out_file_name)
+
+    return out_file_name
+
+
+def calculateSections(args, ifc_file=None, getCache=None):
+    # cuts the triangulated products of the storeys with the planes at all height offsets in one pass per product
+    # and writes the segments to <outDir>/sections.csv, see meshSlicer.py. Returns the path of the file
+    from contourCalculation import contourHelper, heightIndex, meshSlicer
+
+    start = time.time()
+    if ifc_file is None:
+        ifc_file = ifcopenshell.open(args.i)
+
+    numStoreys = len(ifc_file.by_type('IfcBuildingStorey'))
+    storeyIndices = list(range(numStoreys)) if args.allStoreys else [int(args.s) if args.s is not None else 0]
+    offsets = [float(x) for x in args.heights.split(',')] if args.heights else [float(args.height)]
+    planes, skipped = meshSlicer.getStoreyPlanes(ifc_file, storeyIndices, offsets)
+    for index in skipped:
+        logging.warning(f'storey {index} has neither placement nor elevation and is skipped')
+        print(f'storey {index} has neither placement nor elevation and is skipped')
+
+    productSelection = selection.readSelection(args.entityList) if args.entityList else None
+    productIds = selection.selectProductIds(ifc_file, productSelection)
+    productPlanes = meshSlicer.getProductPlanes(ifc_file, planes, productIds)
+
+    cache = getCache(geometryIterator.getMeshIteratorSettings()) if getCache is not None else None
+    if cache is None and args.cacheDir:
+        cache = geometryCache.GeometryCache(args.cacheDir, args.i, geometryIterator.getMeshIteratorSettings(), args.cacheSize)
+
+    # products in the height index are only meshed if they cross one of their planes, see heightIndex.py
+    indexPath = heightIndex.getIndexPath(cache)
+    zIndex = heightIndex.loadIndex(indexPath)
+    numProducts = len(productPlanes)
+    productPlanes = meshSlicer.getCrossingProductPlanes(ifc_file, planes, productPlanes, zIndex)
+    logging.info(f'{len(productPlanes)} of {numProducts} products cross the planes or are not in the height index')
+    print(f'{len(productPlanes)} of {numProducts} products cross the planes or are not in the height index')
+
+    out_file_name = os.path.join(os.path.abspath(args.o), 'sections.csv')
+    planeSegments = [[] for x in planes]
+    zRanges = {}
+    slices = meshSlicer.collectPlaneSegments(meshSlicer.sliceProducts(ifc_file, planes, productPlanes, cache, zRanges), planeSegments)
+    numSegments = meshSlicer.writeSectionsCsv(out_file_name, planes, slices)
+    if cache is not None:
+        cache.close()
+    if indexPath is not None and zRanges:
+        zIndex.withRanges(zRanges).save(indexPath)
+
+    logging.info(f'{numSegments} segments of {len(productPlanes)} products at {len(planes)} planes written to {out_file_name} in {time.time()-start} seconds')
+    print(f'{numSegments} segments of {len(productPlanes)} products at {len(planes)} planes written to {out_file_name} in {time.time()-start} seconds')
+
+    # the outlines of all planes in parallel
+    outline_start = time.time()
+    outlines = contourHelper.calculateOutlines([np.concatenate(x) if x else np.zeros((0, 4)) for x in planeSegments], args.tolerance)
+    contour_file_name = os.path.join(os.path.abspath(args.o), 'contours.csv')
+    meshSlicer.writeContoursCsv(contour_file_name, planes, outlines)
+    logging.info(f'Outlines of {len(planes)} planes written to {contour_file_name} in {time.time()-outline_start} seconds')
+    print(f'Outlines of {len(planes)} planes written to {contour_file_name} in {time.time()-outline_start} seconds')
+    return out_file_name
+
+
+def main():
     try:
-        section = BRepAlgoAPI.BRepAlgoAPI_Section(shape, section_plane).Shape()
-        all_section_edges.append(list(TopologyUtils.TopologyExplorer(section).edges()))
-    except:
-        pass
-
-edges = list(itertools.chain.from_iterable(all_section_edges))
-
-if len(edges) < 1:
-    print('No edges at section! (maybe use other section height?)')
-    sys.exit()
-
-points = contourHelper.getPointListFromEdgeList(edges)
-
-sectionSegments = [contourHelper.createSegment2dFromOCCEdge(x) for x in edges]
-
-with open('./bin/input.txt', 'w') as f:
-    for seg in sectionSegments:
-        f.write("{} {} {} {}\n".format(seg[0], seg[1], seg[2], seg[3]))
-
-subprocess.run(["./bin/IfcGeometryExtractor.exe", "./bin/input.txt", "./bin/output.txt"])
-
-contourPoints = []
-with open('./bin/output.txt', 'r') as file:
-    for line in file:
-        split = line.split(' ')
-        contourPoints.append(gp.gp_Pnt(float(split[0]), float(split[1]), section_height))
-
-wire = contourHelper.buildWireFromPointList(contourPoints)
-shapes.append(wire)
-
-out_file_name = os.path.join(os.path.abspath(args.o), "contour_wkt.txt")
-contourHelper.writeWKTStringToFile(wire, out_file_name)
+        calculateContour(getArgumentParser().parse_args())
+    except ExtractionError as ex:
+        sys.exit(str(ex))
 
-#from common import visualisation
-#visualisation.quickViewFromShapeList(wire)
 
-#from OCC.Core import BRepBuilderAPI
-#face = BRepBuilderAPI.BRepBuilderAPI_MakeFace(wire).Face()
\ No newline at end of file
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
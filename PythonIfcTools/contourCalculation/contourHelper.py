@@ -1,10 +1,15 @@
+import collections
 import itertools
+import multiprocessing
 
-from OCC.Core import Bnd, BRepBndLib, BRep, BRepBuilderAPI
-from OCC.Extend import TopologyUtils, ShapeFactory
+import numpy as np
+
+# OCC is imported by the functions using it, the outline engine below only needs numpy
 
 
 def vertex2pnt(vertex):
+    from OCC.Core import BRep
+
     return BRep.BRep_Tool.Pnt(vertex)
 
 def getProductsForBuildingStorey(IfcBuildingStorey):
@@ -15,35 +20,21 @@ def getProductsForBuildingStorey(IfcBuildingStorey):
     return list(itertools.chain(*returnList))
 
 
-def getMediumHeightFromShapes(shapes):
-    obb = Bnd.Bnd_OBB()
-    for shape in shapes:
-        BRepBndLib.brepbndlib_AddOBB(shape, obb)
-    return obb.Center().Z()
-
-
-def getPointListFromEdgeList(edges):
-
-    pointList = []
-
-    for edge in edges:
-        vertices = list(TopologyUtils.TopologyExplorer(edge).vertices())
-        pointList.append([vertex2pnt(x) for x in vertices])
-
-    pointList = itertools.chain.from_iterable(pointList)
-    pointSet = set(pointList)
-    return list(pointSet)
-
-
-def createSegment2dFromOCCEdge(edge):
-    vertIter = TopologyUtils.TopologyExplorer(edge).vertices()
-    start = vertex2pnt(next(vertIter)).Coord()[0:2]
-    end = vertex2pnt(next(vertIter)).Coord()[0:2]
+def getEdgeEndpoints(edges):
+    # (n, 2, 3) array of the first and last point of every edge, read in one pass without topology explorers
+    from OCC.Core import TopExp
 
-    return [start[0], start[1], end[0], end[1]]
+    endpoints = np.empty((len(edges), 2, 3), dtype=np.float64)
+    for index, edge in enumerate(edges):
+        endpoints[index, 0] = vertex2pnt(TopExp.topexp_FirstVertex(edge)).Coord()
+        endpoints[index, 1] = vertex2pnt(TopExp.topexp_LastVertex(edge)).Coord()
+    return endpoints
 
 
 def buildWireFromPointList(ptList):
+    from OCC.Core import BRepBuilderAPI
+    from OCC.Extend import ShapeFactory
+
     nrOfPoints = len(ptList)
 
     edgeList = []
@@ -56,4 +47,322 @@ def buildWireFromPointList(ptList):
                 edgeList.append(BRepBuilderAPI.BRepBuilderAPI_MakeEdge(ptList[idx], ptList[0]).Edge())
 
     wire = ShapeFactory.make_wire(edgeList)
-    return wire
\ No newline at end of file
+    return wire
+
+
+# Outline engine: the outer boundary of the union of 2D section segments. The segments are split at their
+# intersections, found by a uniform grid over the segments, the end points are welded into a planar graph and
+# the outer face of every connected part is traced. The functions have no state, so they can be called in
+# parallel, see calculateOutlines
+
+# planar graph of welded segments: Points (n, 2) and Edges (m, 2) as point index pairs, every edge once with
+# the smaller index first
+SegmentGraph = collections.namedtuple('SegmentGraph', ['Points', 'Edges'])
+
+
+def getUniqueValues(values):
+    # sorted unique values of an integer array, faster than np.unique for many duplicates
+    values = np.sort(values)
+    return values[np.append(True, values[1:] != values[:-1])] if len(values) else values
+
+
+def getCandidatePairs(segments, cellSize):
+    # index pairs [i, j], i < j, of the segments sharing a cell of the grid
+    mins = np.floor(np.minimum(segments[:, 0:2], segments[:, 2:4]) / cellSize).astype(np.int64)
+    maxs = np.floor(np.maximum(segments[:, 0:2], segments[:, 2:4]) / cellSize).astype(np.int64)
+    sizes = maxs - mins + 1
+    counts = sizes[:, 0] * sizes[:, 1]
+
+    # one entry per segment and overlapped cell
+    entrySegments = np.repeat(np.arange(len(segments)), counts)
+    local = np.arange(len(entrySegments)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cellX = mins[entrySegments, 0] + local // sizes[entrySegments, 1]
+    cellY = mins[entrySegments, 1] + local % sizes[entrySegments, 1]
+    order = np.lexsort((entrySegments, cellY, cellX))
+    cellX, cellY, entrySegments = cellX[order], cellY[order], entrySegments[order]
+
+    # every entry is paired with the following entries of its cell
+    newCell = np.ones(len(entrySegments), dtype=bool)
+    newCell[1:] = (cellX[1:] != cellX[:-1]) | (cellY[1:] != cellY[:-1])
+    cellEnds = np.append(np.flatnonzero(newCell)[1:], len(entrySegments))
+    ends = np.repeat(cellEnds, np.diff(np.append(np.flatnonzero(newCell), len(entrySegments))))
+    partners = ends - np.arange(len(entrySegments)) - 1
+    first = np.repeat(np.arange(len(entrySegments)), partners)
+    second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(partners) - partners, partners)
+
+    pairs = np.sort(np.column_stack([entrySegments[first], entrySegments[second]]), axis=1)
+    keys = getUniqueValues(pairs[pairs[:, 0] != pairs[:, 1]] @ np.array([len(segments), 1], dtype=np.int64))
+    return np.column_stack([keys // len(segments), keys % len(segments)])
+
+
+def cross2d(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def getSplitParameters(segments, pairs, tolerance):
+    # [segment indices, parameters along the segments] of all intersection and touching points of the pairs
+    starts, directions = segments[:, 0:2], segments[:, 2:4] - segments[:, 0:2]
+    i, j = pairs[:, 0], pairs[:, 1]
+    p, r, q, s = starts[i], directions[i], starts[j], directions[j]
+    denominator = cross2d(r, s)
+    offset = q - p
+    lengthI, lengthJ = np.linalg.norm(r, axis=1), np.linalg.norm(s, axis=1)
+    parallel = np.abs(denominator) <= tolerance * lengthI * lengthJ
+
+    safe = np.where(parallel, 1.0, denominator)
+    t = cross2d(offset, s) / safe
+    u = cross2d(offset, r) / safe
+    epsI, epsJ = tolerance / lengthI, tolerance / lengthJ
+    crossing = ~parallel & (t >= -epsI) & (t <= 1 + epsI) & (u >= -epsJ) & (u <= 1 + epsJ)
+    indices = [i[crossing], j[crossing]]
+    parameters = [t[crossing], u[crossing]]
+
+    # collinear overlaps: the end points of each segment lying on the other one
+    collinear = parallel & (np.abs(cross2d(offset, r)) <= tolerance * lengthI)
+    for a, b, pa, ra, pb, rb in [(i, j, p, r, q, s), (j, i, q, s, p, r)]:
+        lengthSquared = np.einsum('ij,ij->i', ra, ra)
+        for end in [pb, pb + rb]:
+            parameter = np.einsum('ij,ij->i', end - pa, ra) / lengthSquared
+            inside = collinear & (parameter > 0) & (parameter < 1)
+            indices.append(a[inside])
+            parameters.append(parameter[inside])
+
+    return np.concatenate(indices), np.clip(np.concatenate(parameters), 0.0, 1.0)
+
+
+def nodeSegments(segments, tolerance=1e-6):
+    # splits the segments (n, 4) [x1, y1, x2, y2] at all intersections, returns the pieces as (m, 4) array
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    lengths = np.linalg.norm(segments[:, 2:4] - segments[:, 0:2], axis=1)
+    segments = segments[lengths > tolerance]
+    if len(segments) < 2:
+        return segments
+
+    # cells of about the mean segment length keep the number of cells per segment and of segments per cell small
+    extent = np.ptp(segments.reshape(-1, 2), axis=0).max()
+    cellSize = max(np.mean(lengths[lengths > tolerance]), extent / 4096, tolerance)
+    pairs = getCandidatePairs(segments, cellSize)
+    splitSegments, splitParameters = getSplitParameters(segments, pairs, tolerance)
+
+    allSegments = np.concatenate([np.arange(len(segments)), np.arange(len(segments)), splitSegments])
+    allParameters = np.concatenate([np.zeros(len(segments)), np.ones(len(segments)), splitParameters])
+    order = np.lexsort((allParameters, allSegments))
+    allSegments, allParameters = allSegments[order], allParameters[order]
+
+    sameSegment = allSegments[1:] == allSegments[:-1]
+    owners = allSegments[1:][sameSegment]
+    startParameters, endParameters = allParameters[:-1][sameSegment], allParameters[1:][sameSegment]
+    starts = segments[owners, 0:2] + startParameters[:, None] * (segments[owners, 2:4] - segments[owners, 0:2])
+    ends = segments[owners, 0:2] + endParameters[:, None] * (segments[owners, 2:4] - segments[owners, 0:2])
+    return np.column_stack([starts, ends])
+
+
+def getNeighbourPairs(keys, sortedKeys, order, offsets):
+    # index pairs [i, j] of the points with the cell key keys[i] + offset of j, for all offsets
+    pairs = []
+    for offset in offsets:
+        starts = np.searchsorted(sortedKeys, keys + offset, 'left')
+        counts = np.searchsorted(sortedKeys, keys + offset, 'right') - starts
+        first = np.repeat(np.arange(len(keys)), counts)
+        second = order[np.repeat(starts, counts) + np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)]
+        pairs.append(np.column_stack([first, second]))
+    return np.concatenate(pairs)
+
+
+def weldPoints(points, tolerance=1e-6):
+    # [welded points (k, 2), index of the welded point per point]. Points closer than tolerance are merged, also
+    # across cell borders: each point is compared with the points of its own and the neighbouring cells of a
+    # grid with at least the cell size tolerance. A welded point is the first point of its group
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return points, np.zeros(0, dtype=np.int64)
+
+    # cells larger than tolerance only add candidates, they keep the cell keys within int64 for large extents
+    cellSize = max(tolerance, np.ptp(points, axis=0).max() / 2 ** 30)
+    cells = np.floor((points - points.min(axis=0)) / cellSize).astype(np.int64)
+    # one empty row on top, so the keys of neighbours below the lowest row do not reach into the next column
+    rows = int(cells[:, 1].max()) + 2
+    keys = cells[:, 0] * rows + cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+
+    # half of the neighbourhood is enough, the other half finds the same pairs the other way round
+    pairs = getNeighbourPairs(keys, keys[order], order, [0, 1, rows - 1, rows, rows + 1])
+    distances = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    pairs = pairs[(pairs[:, 0] != pairs[:, 1]) & (distances <= tolerance)]
+
+    representatives, ids = np.unique(getComponents(len(points), pairs), return_inverse=True)
+    return points[representatives], ids.reshape(-1)
+
+
+def buildSegmentGraph(segments, tolerance=1e-6):
+    # SegmentGraph of the segments (n, 4) [x1, y1, x2, y2] with end points closer than tolerance welded.
+    # Segments collapsing to one point and duplicates are dropped
+    points, ids = weldPoints(np.asarray(segments, dtype=np.float64).reshape(-1, 2), tolerance)
+    edges = np.sort(ids.reshape(-1, 2), axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    edgeKeys = getUniqueValues(edges @ np.array([len(points), 1], dtype=np.int64))
+    return SegmentGraph(points, np.column_stack([edgeKeys // len(points), edgeKeys % len(points)]))
+
+
+def removeDanglingEdges(numPoints, edges):
+    # removes edges ending in a point used by no other edge until only closed cycles are left
+    while len(edges):
+        degree = np.bincount(edges.ravel(), minlength=numPoints)
+        keep = (degree[edges[:, 0]] > 1) & (degree[edges[:, 1]] > 1)
+        if keep.all():
+            break
+        edges = edges[keep]
+    return edges
+
+
+def getComponents(numPoints, edges):
+    # label of the connected component per point, the smallest point index of the component. The labels of
+    # the ends of every edge are hooked onto the smaller one and shortened by pointer jumping until stable
+    labels = np.arange(numPoints)
+    while True:
+        a, b = labels[edges[:, 0]], labels[edges[:, 1]]
+        hooked = labels.copy()
+        np.minimum.at(hooked, np.maximum(a, b), np.minimum(a, b))
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            return labels
+        labels = hooked
+
+
+def traceOuterRings(points, edges):
+    # counter clockwise outer boundary of every connected part of the planar graph, as point index lists
+    # half edge k runs from tails[k] to heads[k], half edges 2e and 2e+1 are the two directions of edge e
+    tails = edges.ravel()
+    heads = edges[:, ::-1].ravel()
+    directions = points[heads] - points[tails]
+    angles = np.arctan2(directions[:, 1], directions[:, 0])
+
+    # half edges sorted counter clockwise around their tail, position of every half edge in this order
+    order = np.lexsort((angles, tails))
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+    groupStarts = np.searchsorted(tails[order], np.arange(len(points)), 'left')
+    groupEnds = np.searchsorted(tails[order], np.arange(len(points)), 'right')
+
+    # the next half edge after u->v keeps the outside on the right: the one following v->u counter clockwise around v
+    twins = np.arange(len(tails)) ^ 1
+    twinPositions = position[twins]
+    twinTails = tails[twins]
+    nextPositions = twinPositions + 1
+    nextPositions = np.where(nextPositions >= groupEnds[twinTails], groupStarts[twinTails], nextPositions)
+    nextHalfEdges = order[nextPositions]
+
+    # the leftmost, then lowest point of every connected part
+    components = getComponents(len(points), edges)
+    vertices = np.unique(tails)
+    vertices = vertices[np.lexsort((points[vertices, 1], points[vertices, 0], components[vertices]))]
+    firstOfComponent = np.ones(len(vertices), dtype=bool)
+    firstOfComponent[1:] = components[vertices[1:]] != components[vertices[:-1]]
+
+    rings = []
+    for start in vertices[firstOfComponent]:
+        # arriving downwards at the leftmost point, the first half edge is the next counter clockwise after (0, 1)
+        outgoing = order[groupStarts[start]:groupEnds[start]]
+        outgoingAngles = angles[outgoing]
+        later = outgoingAngles > np.pi / 2
+        first = outgoing[later][0] if later.any() else outgoing[0]
+
+        ring = []
+        halfEdge = first
+        for _ in range(len(tails)):
+            ring.append(tails[halfEdge])
+            halfEdge = nextHalfEdges[halfEdge]
+            if halfEdge == first:
+                break
+        rings.append(ring)
+    return rings
+
+
+def removeCollinearPoints(ring, tolerance=1e-6):
+    # drops the points of a closed ring lying on the line between their neighbours
+    while len(ring) > 3:
+        previous, following = np.roll(ring, 1, axis=0), np.roll(ring, -1, axis=0)
+        lengths = np.linalg.norm(following - previous, axis=1)
+        collinear = np.abs(cross2d(ring - previous, following - previous)) <= tolerance * np.maximum(lengths, tolerance)
+        if not collinear.any():
+            break
+        # every second collinear point at most, so neighbouring collinear points are tested again
+        collinear[1:] &= ~collinear[:-1]
+        ring = ring[~collinear]
+    return ring
+
+
+def getRingArea(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+
+
+def isPointInRing(point, ring):
+    x, y = ring[:, 0], ring[:, 1]
+    nextX, nextY = np.roll(x, -1), np.roll(y, -1)
+    crossing = (y > point[1]) != (nextY > point[1])
+    intersectionX = x + (point[1] - y) * (nextX - x) / np.where(crossing, nextY - y, 1.0)
+    return np.count_nonzero(crossing & (point[0] < intersectionX)) % 2 == 1
+
+
+def getOutlineRings(segments, tolerance=1e-6):
+    # outer boundaries of the union of the closed figures formed by the segments (n, 4) [x1, y1, x2, y2].
+    # Returns counter clockwise (k, 2) point arrays without repeated first point, largest first. Parts lying
+    # inside of another part, e.g. columns within the walls, are left out, open chains are ignored
+    return getGraphOutlineRings(buildSegmentGraph(segments, tolerance), tolerance)
+
+
+def getGraphOutlineRings(graph, tolerance=1e-6):
+    # getOutlineRings of a SegmentGraph. The edges are split at their intersections, which adds the
+    # intersection points to the graph, the shared end points stay one point
+    if len(graph.Edges) == 0:
+        return []
+    points, edges = buildSegmentGraph(nodeSegments(graph.Points[graph.Edges].reshape(-1, 4), tolerance), tolerance)
+    edges = removeDanglingEdges(len(points), edges)
+    if len(edges) == 0:
+        return []
+
+    rings = [removeCollinearPoints(points[x], tolerance) for x in traceOuterRings(points, edges)]
+    rings = sorted([x for x in rings if len(x) >= 3 and getRingArea(x) > 0], key=getRingArea, reverse=True)
+    # a ring is tested only against the kept outlines whose bounding box contains its leftmost point
+    outlines = []
+    boxes = np.zeros((len(rings), 4))
+    for ring in rings:
+        point = ring[np.argmin(ring[:, 0])]
+        kept = boxes[:len(outlines)]
+        candidates = np.flatnonzero((kept[:, 0] <= point[0]) & (point[0] <= kept[:, 2]) & (kept[:, 1] <= point[1]) & (point[1] <= kept[:, 3]))
+        if not any(isPointInRing(point, outlines[x]) for x in candidates):
+            boxes[len(outlines)] = [*ring.min(axis=0), *ring.max(axis=0)]
+            outlines.append(ring)
+    return outlines
+
+
+def getOutlineRingsForArguments(arguments):
+    return getOutlineRings(*arguments)
+
+
+def calculateOutlines(segmentLists, tolerance=1e-6, numProcesses=None):
+    # getOutlineRings for many segment lists, e.g. one per storey and height, in worker processes
+    numProcesses = numProcesses if numProcesses else multiprocessing.cpu_count()
+    arguments = [(x, tolerance) for x in segmentLists]
+    if numProcesses <= 1 or len(arguments) <= 1:
+        return [getOutlineRingsForArguments(x) for x in arguments]
+    with multiprocessing.Pool(min(numProcesses, len(arguments))) as pool:
+        return pool.map(getOutlineRingsForArguments, arguments)
+
+
+def getWKTStringFromRings(rings, height):
+    # MULTIPOLYGON Z of the outline rings at the height, POLYGON Z for a single ring
+    polygons = ['(({}))'.format(', '.join(f'{x} {y} {height}' for x, y in np.vstack([ring, ring[:1]]))) for ring in rings]
+    if len(polygons) == 1:
+        return 'POLYGON Z' + polygons[0]
+    return 'MULTIPOLYGON Z({})'.format(', '.join(polygons))
+
+
+def writeWKTStringToFile(wktString, filePath):
+    with open(filePath, 'w') as f:
+        f.write(wktString + '\n')
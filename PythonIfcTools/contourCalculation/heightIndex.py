@@ -0,0 +1,101 @@
+import logging
+import os
+
+import numpy as np
+
+# Index of the vertical extent of the products of a model: lowest and highest z in meter per GlobalId, sorted by
+# the lowest z. Queries for section heights only touch the products crossing the planes. With a geometry cache
+# the index is stored in the model directory of the cache, so later sweeps at other heights create or load
+# the geometry of the crossing products only
+INDEX_FILE_NAME = 'zIndex.npz'
+
+
+class ZIntervalIndex:
+
+    def __init__(self, guids=(), zMins=(), zMaxs=()):
+        zMins = np.asarray(zMins, dtype=np.float64)
+        order = np.argsort(zMins, kind='stable')
+        self.Guids = np.asarray(guids, dtype='U22')[order]
+        self.ZMin = zMins[order]
+        self.ZMax = np.asarray(zMaxs, dtype=np.float64)[order]
+        self.Positions = {x: i for i, x in enumerate(self.Guids.tolist())}
+        # no interval starts lower than MaxExtent below a height crossing it
+        self.MaxExtent = float((self.ZMax - self.ZMin).max()) if len(self.ZMin) else 0.0
+
+    def hasProduct(self, guid):
+        return guid in self.Positions
+
+    def getRange(self, guid):
+        position = self.Positions[guid]
+        return self.ZMin[position], self.ZMax[position]
+
+    def query(self, height):
+        # GlobalIds of the products with zMin <= height <= zMax
+        start = np.searchsorted(self.ZMin, height - self.MaxExtent, 'left')
+        end = np.searchsorted(self.ZMin, height, 'right')
+        return self.Guids[start:end][self.ZMax[start:end] >= height].tolist()
+
+    def queryHeights(self, heights):
+        # GlobalId -> indices of the heights crossing the product, for any number of heights in one pass
+        heights = np.asarray(heights, dtype=np.float64)
+        order = np.argsort(heights)
+        sortedHeights = heights[order]
+        first = np.searchsorted(sortedHeights, self.ZMin, 'left')
+        counts = np.searchsorted(sortedHeights, self.ZMax, 'right') - first
+        crossing = np.flatnonzero(counts > 0)
+        counts = counts[crossing]
+        ends = np.cumsum(counts)
+        heightIndices = order[np.repeat(first[crossing], counts) + np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)]
+        return {guid: heightIndices[end - count:end] for guid, count, end in zip(self.Guids[crossing].tolist(), counts, ends)}
+
+    def getMiddleHeight(self, guids):
+        # middle of the vertical extent of all products of guids found in the index, None if there is none
+        positions = [self.Positions[x] for x in guids if x in self.Positions]
+        if not positions:
+            return None
+        return (self.ZMin[positions].min() + self.ZMax[positions].max()) / 2
+
+    def withRanges(self, ranges):
+        # new index with the ranges {guid: [zMin, zMax]} added, replacing existing entries of the same products
+        if not ranges:
+            return self
+        keep = [i for i, x in enumerate(self.Guids.tolist()) if x not in ranges]
+        guids = self.Guids[keep].tolist() + list(ranges)
+        zMins = np.concatenate([self.ZMin[keep], [x[0] for x in ranges.values()]])
+        zMaxs = np.concatenate([self.ZMax[keep], [x[1] for x in ranges.values()]])
+        return ZIntervalIndex(guids, zMins, zMaxs)
+
+    def save(self, path):
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+        with open(tmpPath, 'wb') as f:
+            np.savez(f, Guids=self.Guids, ZMin=self.ZMin, ZMax=self.ZMax)
+        os.replace(tmpPath, path)
+
+
+def loadIndex(path):
+    # the stored index, an empty one if there is none or it can not be read
+    if path is None or not os.path.exists(path):
+        return ZIntervalIndex()
+    try:
+        with np.load(path) as data:
+            return ZIntervalIndex(data['Guids'], data['ZMin'], data['ZMax'])
+    except Exception as ex:
+        logging.warning(f'height index {path} is unreadable and will be rebuilt: {ex}')
+        return ZIntervalIndex()
+
+
+def getIndexPath(cache):
+    return os.path.join(cache.ModelDir, INDEX_FILE_NAME) if cache is not None else None
+
+
+def getMeshZRange(vertices):
+    return float(vertices[:, 2].min()), float(vertices[:, 2].max())
+
+
+def getShapeZRange(shape):
+    from OCC.Core import Bnd, BRepBndLib
+
+    box = Bnd.Bnd_Box()
+    BRepBndLib.brepbndlib_Add(shape, box)
+    xMin, yMin, zMin, xMax, yMax, zMax = box.Get()
+    return zMin, zMax
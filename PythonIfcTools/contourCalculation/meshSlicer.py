@@ -0,0 +1,150 @@
+import collections
+
+import numpy as np
+
+from common import ifcUtils, selection, transformation
+from contourCalculation import heightIndex
+
+# one horizontal section plane: the storey (index in file order and name), the offset above the storey and
+# the resulting height in meter in world coordinates
+SectionPlane = collections.namedtuple('SectionPlane', ['StoreyIndex', 'Storey', 'Offset', 'Height'])
+
+SECTION_CSV_HEADER = "StoreyIndex;Storey;Offset;Height;ObjectGuid;X1;Y1;X2;Y2"
+CONTOUR_CSV_HEADER = "StoreyIndex;Storey;Offset;Height;Polygon"
+
+# triangle edges as vertex index pairs
+TRIANGLE_EDGES = np.array([[0, 1], [1, 2], [2, 0]])
+
+
+def sliceMesh(vertices, triangles, heights, minLength=1e-9):
+    # cuts the triangles (m, 3) of the vertices (n, 3) with all planes z = heights at once.
+    # Returns [plane indices (k,), segments (k, 2, 3)], the plane index of every segment refers to heights
+    heights = np.asarray(heights, dtype=np.float64)
+    if len(triangles) == 0 or len(heights) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 2, 3))
+
+    order = np.argsort(heights)
+    sortedHeights = heights[order]
+    points = vertices[triangles]
+    z = points[:, :, 2]
+
+    # a vertex is above a plane if z > height, a triangle is cut by the planes with zMin <= height < zMax
+    first = np.searchsorted(sortedHeights, z.min(axis=1), 'left')
+    counts = np.searchsorted(sortedHeights, z.max(axis=1), 'left') - first
+    triangleIndices = np.repeat(np.arange(len(triangles)), counts)
+    if len(triangleIndices) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 2, 3))
+    starts = np.cumsum(counts) - counts
+    sortedPlanes = np.repeat(first, counts) + np.arange(len(triangleIndices)) - np.repeat(starts, counts)
+
+    cutPoints = points[triangleIndices]
+    distances = cutPoints[:, :, 2] - sortedHeights[sortedPlanes][:, None]
+    above = distances > 0
+
+    # exactly two edges of a cut triangle connect a vertex above with one below the plane
+    start, end = TRIANGLE_EDGES[:, 0], TRIANGLE_EDGES[:, 1]
+    crossing = above[:, start] != above[:, end]
+    denominator = distances[:, start] - distances[:, end]
+    t = distances[:, start] / np.where(crossing, denominator, 1.0)
+    edgePoints = cutPoints[:, start] + t[:, :, None] * (cutPoints[:, end] - cutPoints[:, start])
+    crossingEdges = np.argsort(~crossing, axis=1, kind='stable')[:, :2]
+    segments = np.take_along_axis(edgePoints, crossingEdges[:, :, None], axis=1)
+
+    valid = np.linalg.norm(segments[:, 1] - segments[:, 0], axis=1) > minLength
+    return order[sortedPlanes[valid]], segments[valid]
+
+
+def getStoreyPlanes(ifc_file, storeyIndices, offsets):
+    # section planes at the offsets in meter above the storeys. The storey height is the z of its placement,
+    # or its Elevation without placement. Storeys without both are skipped
+    storeys = ifc_file.by_type('IfcBuildingStorey')
+    heightFactor = 1000 if ifcUtils.getLengthUnit(ifc_file) == 'millimeter' else 1
+    resolver = transformation.PlacementResolver(ifc_file)
+    planes, skipped = [], []
+    for index in storeyIndices:
+        storey = storeys[index]
+        if storey.ObjectPlacement is not None:
+            base = resolver.getEntityMatrix(storey)[2, 3] / heightFactor
+        elif storey.Elevation is not None:
+            base = storey.Elevation / heightFactor
+        else:
+            skipped.append(index)
+            continue
+        planes.extend(SectionPlane(index, storey.Name, offset, base + offset) for offset in offsets)
+    return planes, skipped
+
+
+def getProductPlanes(ifc_file, planes, productIds):
+    # product id -> indices of the planes cutting it: the planes of the storey containing the product
+    storeys = ifc_file.by_type('IfcBuildingStorey')
+    storeyPlanes = collections.defaultdict(list)
+    for planeIndex, plane in enumerate(planes):
+        storeyPlanes[plane.StoreyIndex].append(planeIndex)
+
+    productPlanes = {}
+    for storeyIndex, planeIndices in storeyPlanes.items():
+        for productId in selection.getDecompositionIds(storeys[storeyIndex]) & productIds:
+            productPlanes.setdefault(productId, []).extend(planeIndices)
+    return {x: np.array(y, dtype=np.int64) for x, y in productPlanes.items()}
+
+
+def getCrossingProductPlanes(ifc_file, planes, productPlanes, zIndex):
+    # productPlanes reduced to the planes crossing the z range of the products in the heightIndex.ZIntervalIndex.
+    # Products not in the index keep all their planes, products crossing none of them are left out
+    crossing = zIndex.queryHeights([x.Height for x in planes])
+    result = {}
+    for productId, planeIndices in productPlanes.items():
+        guid = ifc_file.by_id(productId).GlobalId
+        if zIndex.hasProduct(guid):
+            planeIndices = np.intersect1d(planeIndices, crossing.get(guid, []))
+        if len(planeIndices):
+            result[productId] = planeIndices
+    return result
+
+
+def sliceProducts(ifc_file, planes, productPlanes, cache=None, zRanges=None):
+    # creates the meshes of the products in world coordinates and cuts each with its planes in one pass.
+    # Yields [product, plane indices, segments]. The z range of every mesh is added to zRanges if given
+    from common import geometryIterator
+
+    heights = np.array([x.Height for x in planes], dtype=np.float64)
+    products = [ifc_file.by_id(x) for x in sorted(productPlanes)]
+    for product, (vertices, triangles) in geometryIterator.iterateShapes(ifc_file, geometryIterator.getMeshIteratorSettings(), include=products, cache=cache):
+        if zRanges is not None and len(vertices):
+            zRanges[product.GlobalId] = heightIndex.getMeshZRange(vertices)
+        planeIndices = productPlanes[product.id()]
+        localIndices, segments = sliceMesh(vertices, triangles, heights[planeIndices])
+        yield product, planeIndices[localIndices], segments
+
+
+def writeSectionsCsv(path, planes, slices):
+    # one row per segment, the z of the segment points is the height of the plane. Returns the number of segments
+    count = 0
+    with open(path, 'w') as f:
+        f.write(SECTION_CSV_HEADER + "\n")
+        for product, planeIndices, segments in slices:
+            for planeIndex, segment in zip(planeIndices, segments):
+                plane = planes[planeIndex]
+                f.write(f"{plane.StoreyIndex};{plane.Storey};{plane.Offset};{plane.Height};{product.GlobalId};"
+                        f"{segment[0, 0]};{segment[0, 1]};{segment[1, 0]};{segment[1, 1]}\n")
+            count += len(segments)
+    return count
+
+
+def collectPlaneSegments(slices, planeSegments):
+    # passes the slices through and appends the 2D segments (n, 4) of every plane to planeSegments[plane index]
+    for product, planeIndices, segments in slices:
+        for planeIndex in np.unique(planeIndices):
+            planeSegments[planeIndex].append(segments[planeIndices == planeIndex][:, :, 0:2].reshape(-1, 4))
+        yield product, planeIndices, segments
+
+
+def writeContoursCsv(path, planes, outlines):
+    # one row per plane with the WKT of its outline rings, see contourHelper.getOutlineRings. Planes without closed contour are left out
+    from contourCalculation import contourHelper
+
+    with open(path, 'w') as f:
+        f.write(CONTOUR_CSV_HEADER + "\n")
+        for plane, rings in zip(planes, outlines):
+            if rings:
+                f.write(f"{plane.StoreyIndex};{plane.Storey};{plane.Offset};{plane.Height};{contourHelper.getWKTStringFromRings(rings, plane.Height)}\n")
@@ -0,0 +1,65 @@
+import argparse
+import importlib
+import multiprocessing
+import os
+import sys
+
+from extractionService import daemonConnection
+
+# module with main() per tool for running without daemon, same names as in extractionApi.TOOLS
+TOOL_MODULES = {
+    'IFCFaceBoxExtractor': 'faceExtraction.IFCFaceBoxExtractor',
+    'contourCalculator': 'contourCalculation.contourCalculator',
+}
+
+
+def runLocal(tool, argv):
+    # runs the tool in this process as if it was started from the command line
+    module = importlib.import_module(TOOL_MODULES[tool])
+    sys.argv = [tool] + argv
+    module.main()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs an extraction tool in the ExtractionDaemon, or in this process if no daemon is running')
+    parser.add_argument('-address', help='Named pipe or unix socket of the daemon. Default is the one of the current user')
+    parser.add_argument('-authkey', help=f'Key of the daemon. Default is the environment variable {daemonConnection.AUTHKEY_VARIABLE} or the key file of the daemon')
+    parser.add_argument('-noFallback', action='store_true', help='Fail if no daemon is running instead of running the tool in this process')
+    parser.add_argument('-status', action='store_true', help='Print the state of the daemon')
+    parser.add_argument('-evict', action='store_true', help='Let the daemon close its models')
+    parser.add_argument('-shutdown', action='store_true', help='Stop the daemon')
+    parser.add_argument('tool', nargs='?', choices=list(TOOL_MODULES), help='The tool to run')
+    parser.add_argument('toolArgs', nargs=argparse.REMAINDER, help='The command line arguments of the tool')
+    args = parser.parse_args()
+
+    for flag, command in [(args.status, 'status'), (args.evict, 'evict'), (args.shutdown, 'shutdown')]:
+        if flag:
+            try:
+                response = daemonConnection.sendRequest({'command': command}, args.address, args.authkey)
+            except (OSError, EOFError):
+                sys.exit('No extraction daemon is running')
+            if response.get('result') is not None:
+                print(response['result'])
+            return
+
+    if args.tool is None:
+        parser.error('a tool is required')
+
+    try:
+        response = daemonConnection.sendRequest({'command': 'run', 'tool': args.tool, 'args': args.toolArgs, 'cwd': os.getcwd()},
+                                                args.address, args.authkey)
+    except (OSError, EOFError):
+        if args.noFallback:
+            sys.exit('No extraction daemon is running')
+        sys.exit(runLocal(args.tool, args.toolArgs))
+
+    print(response.get('output', ''), end='')
+    if response.get('error'):
+        print(response['error'], file=sys.stderr)
+    sys.exit(response['returnCode'])
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from multiprocessing import connection
+
+from common import modelStore
+from common.extractionError import ExtractionError
+from extractionService import daemonConnection, extractionApi
+
+
+class ExtractionDaemon:
+    # Answers the requests of ExtractionClient one after another. The opened models and their geometry are kept
+    # in a ModelStore between the requests. Requests are dictionaries with 'command':
+    #   run: 'tool', 'args' (command line arguments of the tool) and 'cwd' (directory of relative paths)
+    #   ping, status, evict ('path' optional, all models otherwise), shutdown
+    # and are answered with 'returnCode', 'output' (printed messages), 'error' and 'result'
+
+    def __init__(self, address, authkey, maxModels=2, keepGeometry=True, idleTimeout=None):
+        self.Address = address
+        self.AuthKey = authkey
+        self.Store = modelStore.ModelStore(maxModels, keepGeometry)
+        self.IdleTimeout = idleTimeout
+        self.Running = False
+        self.Requests = 0
+        self.Timer = None
+
+    def serve(self):
+        # the key is read or created before the socket exists, so clients can connect as soon as it does
+        self.AuthKey = daemonConnection.getAuthKey(self.AuthKey, create=True)
+        if not self.Address.startswith('\\\\') and os.path.exists(self.Address):
+            # a socket file left by a daemon that was killed, only removed if it belongs to the current user
+            daemonConnection.checkOwner(self.Address)
+            if daemonConnection.isDaemonRunning(self.Address, self.AuthKey):
+                raise RuntimeError(f'a daemon is already listening on {self.Address}')
+            os.remove(self.Address)
+
+        with connection.Listener(self.Address, authkey=self.AuthKey) as listener:
+            logging.info(f'extraction daemon listening on {self.Address}')
+            print(f'extraction daemon listening on {self.Address}')
+            self.Running = True
+            self.restartTimer()
+            while self.Running:
+                try:
+                    client = listener.accept()
+                except (OSError, EOFError, connection.AuthenticationError) as ex:
+                    logging.warning(f'rejected connection: {ex}')
+                    continue
+                if self.Timer is not None:
+                    self.Timer.cancel()
+                with client:
+                    try:
+                        request = client.recv()
+                        client.send(self.handle(request))
+                    except (OSError, EOFError) as ex:
+                        logging.warning(f'lost connection to client: {ex}')
+                self.restartTimer()
+
+        if self.Timer is not None:
+            self.Timer.cancel()
+        logging.info(f'extraction daemon stopped after {self.Requests} requests')
+        print(f'extraction daemon stopped after {self.Requests} requests')
+
+    def restartTimer(self):
+        # stops the daemon by a shutdown request to itself when no request arrived for IdleTimeout seconds
+        if self.Timer is not None:
+            self.Timer.cancel()
+        if self.IdleTimeout:
+            self.Timer = threading.Timer(self.IdleTimeout, daemonConnection.sendRequest, ({'command': 'shutdown'}, self.Address, self.AuthKey))
+            self.Timer.daemon = True
+            self.Timer.start()
+
+    def handle(self, request):
+        command = request.get('command')
+        if command == 'ping':
+            return {'returnCode': 0}
+        if command == 'status':
+            return {'returnCode': 0, 'result': {'pid': os.getpid(), 'requests': self.Requests, 'models': self.Store.getStatus()}}
+        if command == 'evict':
+            self.Store.remove(request.get('path'))
+            return {'returnCode': 0}
+        if command == 'shutdown':
+            self.Running = False
+            return {'returnCode': 0}
+        if command == 'run':
+            self.Requests += 1
+            return self.run(request['tool'], request.get('args', []), request.get('cwd'))
+        return {'returnCode': 1, 'error': f'unknown command {command}'}
+
+    def run(self, tool, argv, cwd):
+        logging.info(f'request {self.Requests}: {tool} {" ".join(argv)}')
+        start = time.time()
+        output = io.StringIO()
+        response = {'returnCode': 0, 'error': None, 'result': None}
+        previousDir = os.getcwd()
+        handler = None
+        try:
+            if cwd:
+                os.chdir(cwd)
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                args = extractionApi.getToolModule(tool).getArgumentParser().parse_args(argv)
+                # the tools write their log file next to the Ifc-File like on the command line
+                if tool in extractionApi.LOG_FILES:
+                    handler = logging.FileHandler(os.path.join(os.path.dirname(os.path.abspath(args.i)), extractionApi.LOG_FILES[tool]), mode='w')
+                    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+                    logging.root.addHandler(handler)
+                response['result'] = extractionApi.runArguments(tool, args, self.Store)
+        except ExtractionError as ex:
+            # the checks and failed steps of the tools
+            response['returnCode'] = 1
+            response['error'] = str(ex)
+        except SystemExit as ex:
+            # argument errors end with sys.exit of argparse
+            response['returnCode'] = ex.code if isinstance(ex.code, int) else 1
+            response['error'] = None if isinstance(ex.code, int) or ex.code is None else str(ex.code)
+        except Exception as ex:
+            logging.exception('request failed')
+            response['returnCode'] = 1
+            response['error'] = f'{ex}\n{traceback.format_exc()}'
+        finally:
+            if handler is not None:
+                logging.root.removeHandler(handler)
+                handler.close()
+            os.chdir(previousDir)
+
+        response['output'] = output.getvalue()
+        logging.info(f'request {self.Requests} finished with code {response["returnCode"]} after {time.time()-start} seconds')
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident process running the extraction tools for ExtractionClient, keeps models and geometry loaded')
+    parser.add_argument('-address', help='Named pipe or unix socket to listen on. Default is one per user')
+    parser.add_argument('-authkey', help=f'Key the clients have to know. Default is the environment variable {daemonConnection.AUTHKEY_VARIABLE} or a random key in {daemonConnection.KEY_FILE_NAME} of the runtime directory')
+    parser.add_argument('-maxModels', help='Number of models kept loaded', default=2, type=int)
+    parser.add_argument('-noGeometry', action='store_true', help='Keep only the parsed models, not the created geometry')
+    parser.add_argument('-idleTimeout', help='Stop after this many minutes without request. Default 0 runs until a shutdown request', default=0, type=float)
+    parser.add_argument('-log', help='The log file of the daemon', default='ExtractionDaemon.log')
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=args.log, filemode='w', format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    daemon = ExtractionDaemon(args.address if args.address else daemonConnection.getDefaultAddress(), args.authkey,
+                              args.maxModels, not args.noGeometry, args.idleTimeout * 60 if args.idleTimeout > 0 else None)
+    daemon.serve()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,83 @@
+import getpass
+import os
+import secrets
+import sys
+import tempfile
+from multiprocessing import connection
+
+# only standard library imports, so the client starts without loading ifcopenshell and OCC
+AUTHKEY_VARIABLE = 'GREEN3DSCAN_DAEMON_KEY'
+KEY_FILE_NAME = 'daemon.key'
+
+
+def checkOwner(path):
+    # the daemon files of another user could answer the client with pickled data of that user
+    if sys.platform != 'win32' and os.lstat(path).st_uid != os.getuid():
+        raise PermissionError(f'{path} is owned by another user')
+
+
+def getRuntimeDir():
+    # private directory of the current user for the socket and the key file, $XDG_RUNTIME_DIR or the temp directory
+    if sys.platform == 'win32':
+        path = os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'Green3DScan')
+        os.makedirs(path, exist_ok=True)
+        return path
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        path = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'green3dscan')
+    else:
+        path = os.path.join(tempfile.gettempdir(), f'green3dscan-{os.getuid()}')
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    checkOwner(path)
+    if os.lstat(path).st_mode & 0o077:
+        raise PermissionError(f'{path} is accessible by other users')
+    return path
+
+
+def getDefaultAddress():
+    # a named pipe on windows, a unix socket in the runtime directory otherwise, one per user
+    if sys.platform == 'win32':
+        user = ''.join(x for x in getpass.getuser() if x.isalnum())
+        return rf'\\.\pipe\Green3DScanExtraction-{user}'
+    return os.path.join(getRuntimeDir(), 'extraction.sock')
+
+
+def getAuthKey(authkey=None, create=False):
+    # the given key, the environment variable or the key in the runtime directory. With create the daemon writes a
+    # random key readable only by the user if there is none. Raises OSError if there is no key
+    if isinstance(authkey, bytes):
+        return authkey
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if authkey is not None:
+        return authkey.encode('utf-8')
+
+    path = os.path.join(getRuntimeDir(), KEY_FILE_NAME)
+    if create and not os.path.exists(path):
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    checkOwner(path)
+    with open(path) as f:
+        return f.read().strip().encode('utf-8')
+
+
+def sendRequest(request, address=None, authkey=None):
+    # sends one request dictionary to the daemon and returns its response. Raises OSError if no daemon is running
+    address = address if address else getDefaultAddress()
+    authkey = getAuthKey(authkey)
+    if sys.platform != 'win32':
+        checkOwner(address)
+    with connection.Client(address, authkey=authkey) as client:
+        client.send(request)
+        return client.recv()
+
+
+def isDaemonRunning(address=None, authkey=None):
+    try:
+        return sendRequest({'command': 'ping'}, address, authkey).get('returnCode') == 0
+    except (OSError, EOFError):
+        return False
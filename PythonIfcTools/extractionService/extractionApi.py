@@ -0,0 +1,70 @@
+import importlib
+import os
+
+# tool name -> [module, function running the parsed arguments]. The modules are imported on first use
+TOOLS = {
+    'IFCFaceBoxExtractor': ('faceExtraction.IFCFaceBoxExtractor', 'extractFacesAndBoxes'),
+    'contourCalculator': ('contourCalculation.contourCalculator', 'calculateContour'),
+}
+
+# log file the tools write next to the Ifc-File when started from the command line
+LOG_FILES = {
+    'IFCFaceBoxExtractor': 'IFCFaceExtractorLog.log',
+}
+
+
+def getToolModule(tool):
+    if tool not in TOOLS:
+        raise ValueError(f'unknown tool {tool}, known are {", ".join(TOOLS)}')
+    return importlib.import_module(TOOLS[tool][0])
+
+
+def runArguments(tool, args, store=None):
+    # runs a tool for parsed arguments. With a common.modelStore.ModelStore the model is taken from the store
+    # and the created geometry is kept there for the next call
+    module = getToolModule(tool)
+    ifc_file, getCache = None, None
+    if store is not None:
+        ifc_file = store.getFile(args.i)
+        getCache = store.getCacheFunction(args.i)
+    return getattr(module, TOOLS[tool][1])(args, ifc_file, getCache)
+
+
+def runTool(tool, argv, store=None):
+    # runs a tool for its command line arguments, e.g. runTool('IFCFaceBoxExtractor', ['-i', 'model.ifc', '-faces'])
+    return runArguments(tool, getToolModule(tool).getArgumentParser().parse_args(argv), store)
+
+
+def extractFacesAndBoxes(ifcPath, store=None, **options):
+    # options are named like the command line flags of IFCFaceBoxExtractor, e.g.
+    # extractFacesAndBoxes('model.ifc', faces=True, faceFile='faces.csv', boxes=True, boxFile='boxes.csv').
+    # Returns the number of extracted products
+    args = getToolModule('IFCFaceBoxExtractor').getArguments(os.path.abspath(ifcPath), **options)
+    return runArguments('IFCFaceBoxExtractor', args, store)
+
+
+def calculateContour(ifcPath, outDir, storey, store=None, **options):
+    # options are named like the command line flags of contourCalculator. Returns the path of the contour file
+    args = getToolModule('contourCalculator').getArguments(os.path.abspath(ifcPath), outDir, storey, **options)
+    return runArguments('contourCalculator', args, store)
+
+
+def iterateProducts(ifc_file, faces=True, boxes=False, boxBuffer=0.0, buildingCS=False, meshFaces=False, include=None, exclude=None,
+                    workers=1, getCache=None):
+    # extraction in memory without output files. Yields [guid, faces, box, error] per product, faces as
+    # [faceId, rings] with one (n, 3) array per ring, box as record of faceExtraction.binaryOutput.BOX_DTYPE
+    from common import geometryIterator, transformation
+    from faceExtraction import productExtraction
+
+    matrix = transformation.getInvertedBuildingMatrix(ifc_file) if buildingCS else None
+    options = productExtraction.ExtractionOptions(faces, boxes, -999, boxBuffer, matrix, 'binary', Mesh=meshFaces)
+    settings = geometryIterator.getMeshIteratorSettings() if meshFaces else geometryIterator.getBRepIteratorSettings()
+    cache = getCache(settings) if getCache is not None else None
+
+    def productShapes():
+        for product, shape in geometryIterator.iterateShapes(ifc_file, settings, include=include, exclude=exclude, cache=cache):
+            yield product.GlobalId, shape
+
+    with productExtraction.ExtractionPool(options, workers) as pool:
+        for guid, faceList, box, error, timing in pool.imap(productShapes()):
+            yield guid, faceList, box, error
@@ -0,0 +1,227 @@
+import argparse
+import collections
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from common import importProfile, metrics
+from common.extractionError import ExtractionError
+
+# one IFC file of a federated project. Name is the value of the source column of the merged output
+# Selection: the parsed EntityList, None without one
+BatchEntry = collections.namedtuple('BatchEntry', ['Path', 'Name', 'StateID', 'EntityList', 'FaceFile', 'BoxFile', 'Size', 'Selection'])
+
+MANIFEST_KEYS = ['path', 'name', 'stateID', 'entityList', 'faceFile', 'boxFile']
+
+
+def getArgumentParser():
+    parser = argparse.ArgumentParser(description='Extract planar faces and BBoxes from several IFC-Files of a project with one shared worker pool')
+    parser.add_argument('ifcFiles', nargs='*', help='the input Ifc-Files, alternatively to -manifest')
+    parser.add_argument('-manifest', help='JSON file listing the Ifc-Files with optional stateID, entityList and output files per file')
+    parser.add_argument('-faces', action='store_true', help='If flag is set, face information are calculated and stored')
+    parser.add_argument('-boxes', action='store_true', help='If flag is set, bounding boxes for products will be calcualted and stored')
+    parser.add_argument('-merge', action='store_true', help='Write all files into -faceFile and -boxFile with a source file column instead of one output per file')
+    parser.add_argument('-faceFile', help='The merged face info output file. Default is ./faceInfo.csv')
+    parser.add_argument('-boxFile', help='The merged box info output file. Default is ./boxInfo.csv')
+    parser.add_argument('-outDir', help='Directory of the outputs per file <name>_faceInfo.csv etc. Default is the current directory', default='.')
+    parser.add_argument('-boxBuffer', help="Size of the buffer arround extracted bounding boxes in meter", default=0.0, type=float)
+    parser.add_argument('-entityList', help='JSON file of IfcProducts that should be processed, used for files without own entityList')
+    parser.add_argument('-buildingCS', action="store_true", help='Generate Patches in Coordinate System of Building NOT Site')
+    parser.add_argument('-stateID', help="the state / phase id, used for files without own stateID", default=-999, type=int)
+    parser.add_argument('-cacheDir', help='Directory of the persistent geometry cache. If not set, no cache is used')
+    parser.add_argument('-cacheSize', help='Maximum size of the geometry cache in MB', default=4096, type=float)
+    parser.add_argument('-outputFormat', choices=['csv', 'binary'], default='csv', help='csv writes semicolon separated text, binary writes memory mappable columns. -merge needs csv')
+    parser.add_argument('-meshFaces', action='store_true', help='Extract the faces from the triangulated geometry instead of BReps. Can not be combined with -boxes')
+    parser.add_argument('-precision', help='Number of decimal places of the face polygon coordinates. Default is full precision', type=int)
+    parser.add_argument('-geometryFormat', choices=['wkt', 'wkb'], default='wkt', help='Format of the face polygons in the csv output, wkb is written as hex string')
+    parser.add_argument('-compress', action='store_true', help='Compress the columns of the binary output')
+    parser.add_argument('-workers', help='Number of processes for the face and box extraction of all files. 0 uses all cores', default=0, type=int)
+    parser.add_argument('-metricsFile', help='If set, wall time, CPU time and peak memory per stage and per entity type are written to this json file')
+    parser.add_argument('-slowest', help='Number of slowest products listed in the -metricsFile', default=20, type=int)
+    return parser
+
+
+def readManifest(path):
+    # {"files": [{"path": "arc.ifc", "name": "ARC", "stateID": 1, "entityList": "arc.json", "faceFile": ..., "boxFile": ...}]}
+    # only path is required, relative paths are relative to the manifest
+    with open(path) as json_file:
+        manifest = json.load(json_file)
+    baseDir = os.path.dirname(os.path.abspath(path))
+    files = []
+    for item in manifest['files']:
+        unknownKeys = [x for x in item if x not in MANIFEST_KEYS]
+        if unknownKeys:
+            raise ValueError(f'unknown keys {unknownKeys} in manifest {path}')
+        files.append({x: os.path.join(baseDir, y) if x in ['path', 'entityList', 'faceFile', 'boxFile'] else y for x, y in item.items()})
+    return files
+
+
+def getBatchEntries(args):
+    # the files of the manifest or the command line, largest file first, so the long running model does not start last.
+    # The entity lists of all files are read here, so that an invalid one fails before any output is written
+    from common import selection
+
+    files = readManifest(args.manifest) if args.manifest else [{'path': x} for x in args.ifcFiles]
+    entries = []
+    for item in files:
+        path = os.path.abspath(item['path'])
+        name = item.get('name', os.path.basename(path))
+        stem = os.path.splitext(name)[0]
+        faceFile = item.get('faceFile', os.path.join(args.outDir, stem + '_' + ('faceInfo.bin' if args.outputFormat == 'binary' else 'faceInfo.csv')))
+        boxFile = item.get('boxFile', os.path.join(args.outDir, stem + '_' + ('boxInfo.bin' if args.outputFormat == 'binary' else 'boxInfo.csv')))
+        entityList = item.get('entityList', args.entityList)
+        entries.append(BatchEntry(path, name, item.get('stateID', args.stateID), entityList, faceFile, boxFile, os.path.getsize(path),
+                                  selection.readSelection(entityList) if entityList else None))
+
+    names = [x.Name for x in entries]
+    duplicates = sorted(set(x for x in names if names.count(x) > 1))
+    if duplicates:
+        raise ValueError(f'the names {duplicates} are used by several files, set unique names in the manifest')
+    return sorted(entries, key=lambda x: -x.Size)
+
+
+def main():
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    args = getArgumentParser().parse_args()
+    importProfile.startFromEnvironment()
+    os.makedirs(args.outDir, exist_ok=True)
+    logFilePath = os.path.join(os.path.abspath(args.outDir), 'IFCBatchExtractorLog.log')
+    logging.basicConfig(filename=logFilePath, filemode='w', format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    try:
+        extractBatch(args)
+    except ExtractionError as ex:
+        sys.exit(str(ex))
+
+
+def extractBatch(args):
+    # runs the extraction of all files of the batch on one worker pool. While the main process creates the geometry
+    # of the next file, the workers still extract the last products of the previous one.
+    # Returns a dictionary name -> number of extracted products
+    totalStart = time.time()
+    recorder = metrics.MetricsRecorder('IFCBatchExtractor', args.slowest, recordProducts=args.metricsFile is not None)
+
+    if not args.faces and not args.boxes:
+        logging.error("No output type specified. Terminating process")
+        raise ExtractionError("No output type specified. Terminating process")
+    if args.meshFaces and args.boxes:
+        logging.error("Boxes can not be calculated from the triangulated geometry. Terminating process")
+        raise ExtractionError("Boxes can not be calculated from the triangulated geometry. Terminating process")
+    if args.merge and args.outputFormat != 'csv':
+        logging.error("Merged output is only supported for csv output. Terminating process")
+        raise ExtractionError("Merged output is only supported for csv output. Terminating process")
+    if not args.manifest and not args.ifcFiles:
+        logging.error("No Ifc-Files specified. Terminating process")
+        raise ExtractionError("No Ifc-Files specified. Terminating process")
+
+    with recorder.stage('import'):
+        import ifcopenshell
+
+        from common import geometryCache, geometryIterator, selection, transformation
+        from faceExtraction import productExtraction, resultWriter
+
+    try:
+        entries = getBatchEntries(args)
+    except (OSError, ValueError, KeyError) as ex:
+        logging.exception("Exception occured")
+        raise ExtractionError(f'Invalid batch: {ex}')
+
+    if args.merge:
+        args.faceFile = args.faceFile if args.faceFile else resultWriter.getDefaultOutputPath('faceInfo', 'csv')
+        args.boxFile = args.boxFile if args.boxFile else resultWriter.getDefaultOutputPath('boxInfo', 'csv')
+    else:
+        os.makedirs(args.outDir, exist_ok=True)
+
+    for entry in entries:
+        logging.info(f'{entry.Name}: {entry.Path} ({entry.Size / 1e6:.1f} MB), stateID {entry.StateID}')
+        print(f'{entry.Name}: {entry.Path} ({entry.Size / 1e6:.1f} MB), stateID {entry.StateID}')
+    recorder.setAttribute('inputs', [entry.Path for entry in entries])
+    recorder.setAttribute('arguments', vars(args))
+
+    iterator_settings = geometryIterator.getMeshIteratorSettings() if args.meshFaces else geometryIterator.getBRepIteratorSettings()
+    # source -> ExtractionOptions, filled when a file is opened
+    sourceOptions = {}
+    productCounts = collections.OrderedDict((entry.Name, 0) for entry in entries)
+
+    def sourceShapes():
+        for entry in entries:
+            logging.info(f'Starting geometry creation for {entry.Name}')
+            print(f'Starting geometry creation for {entry.Name}')
+            with recorder.stage('open'):
+                ifc_file = ifcopenshell.open(entry.Path)
+            with recorder.stage('selection'):
+                includingEntities, excludingEntities = selection.getIteratorArguments(ifc_file, entry.Selection)
+
+            buildingMatrix = None
+            if args.buildingCS:
+                with recorder.stage('transform'):
+                    buildingMatrix = transformation.getInvertedBuildingMatrix(ifc_file)
+            sourceOptions[entry.Name] = productExtraction.ExtractionOptions(args.faces, args.boxes, entry.StateID, args.boxBuffer, buildingMatrix, args.outputFormat,
+                                                                            args.precision, args.geometryFormat, args.meshFaces)
+
+            cache = geometryCache.GeometryCache(args.cacheDir, entry.Path, iterator_settings, args.cacheSize) if args.cacheDir else None
+            for product, shape in recorder.timeIterator(geometryIterator.iterateShapes(ifc_file, iterator_settings, include=includingEntities, exclude=excludingEntities, cache=cache),
+                                                        'geometry iteration', lambda item: ((entry.Name, item[0].GlobalId), item[0].is_a())):
+                yield entry.Name, product.GlobalId, shape
+            if cache is not None:
+                cache.close()
+            del ifc_file
+
+    numWorkers = args.workers if args.workers > 0 else multiprocessing.cpu_count()
+    logging.info(f'Extracting faces and boxes of {len(entries)} files with {numWorkers} worker processes')
+    print(f'Extracting faces and boxes of {len(entries)} files with {numWorkers} worker processes')
+    extraction_start = time.time()
+
+    # the merged csv has the source column and can not be reused by an incremental extraction
+    outputOptions = resultWriter.getOutputOptions(args.buildingCS, args.boxBuffer, args.precision, args.geometryFormat, args.meshFaces)
+    with recorder.stage('geometry iteration, extraction and write'), contextlib.ExitStack() as stack:
+        if args.merge:
+            mergedWriter = stack.enter_context(resultWriter.CsvResultWriter(args.faceFile if args.faces else None, args.boxFile if args.boxes else None, True))
+            writers = {entry.Name: mergedWriter for entry in entries}
+        else:
+            writers = {entry.Name: stack.enter_context(resultWriter.openResultWriter(args.outputFormat, entry.FaceFile if args.faces else None,
+                                                                                     entry.BoxFile if args.boxes else None, entry.StateID,
+                                                                                     'zlib' if args.compress else None, outputOptions))
+                       for entry in entries}
+
+        extractionPool = stack.enter_context(productExtraction.ExtractionPool(sourceOptions, numWorkers))
+        for source, guid, faces, box, error, timing in extractionPool.imapSources(sourceShapes()):
+            if error is not None:
+                logging.error('{}: {}\n'.format(source, error))
+                print(source, error)
+            recorder.addProductTiming((source, guid), timing)
+            writeWatch = metrics.Stopwatch()
+            if args.merge:
+                writers[source].write(guid, faces, box, source)
+            else:
+                writers[source].write(guid, faces, box)
+            recorder.addProductTime((source, guid), 'write', *writeWatch.elapsed())
+            recorder.finishProduct((source, guid))
+            productCounts[source] += 1
+
+    for name, count in productCounts.items():
+        logging.info(f'{name}: {count} products')
+        print(f'{name}: {count} products')
+    logging.info(f"Extraction and writing of {sum(productCounts.values())} products took {time.time()-extraction_start} seconds")
+    print(f"Extraction and writing of {sum(productCounts.values())} products took {time.time()-extraction_start} seconds")
+
+    if args.metricsFile:
+        recorder.setAttribute('products', productCounts)
+        recorder.write(args.metricsFile)
+        logging.info(f"Wrote metrics to {args.metricsFile}")
+        print(f"Wrote metrics to {args.metricsFile}")
+
+    logging.info(f"Finished batch after {time.time()-totalStart} seconds")
+    print(f"Finished batch after {time.time()-totalStart} seconds")
+    return productCounts
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
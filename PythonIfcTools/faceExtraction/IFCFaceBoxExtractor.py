@@ -1,5 +1,5 @@
 import argparse
-import json
+import contextlib
 import logging
 import multiprocessing
 import os
@@ -7,199 +7,372 @@ import sys
 import time
 import traceback
 
-import OCC.Core.Bnd
-import ifcopenshell
-from OCC.Core import BRepBndLib, BRepBuilderAPI
-from OCC.Extend import TopologyUtils
-from ifcopenshell import geom
+from common import importProfile, metrics
+from common.extractionError import ExtractionError
+
+
+def getProductInfo(item):
+    product, shape = item
+    return product.GlobalId, product.is_a()
+
+
+def getArgumentParser():
+    parser = argparse.ArgumentParser(description='Extract planar faces with parameters and BBoxes from IFC-File')
+    parser.add_argument('-i', required=True, help='the input Ifc-File')
+    parser.add_argument('-faces', action='store_true', help='If flag is set, face information are calculated and stored in file -faceFile')
+    parser.add_argument('-faceFile', help='The path to the face info output file. Default is ./faceInfo.csv or ./faceInfo.bin')
+    parser.add_argument('-boxes', action='store_true', help='If flag is set, bounding boxes for products will be calcualted and stord in file -boxFile')
+    parser.add_argument('-boxFile', help='The path to the box info output file. Default is ./boxInfo.csv or ./boxInfo.bin')
+    parser.add_argument('-boxBuffer', help="Size of the buffer arround extracted bounding boxes in meter", default=0.0, type=float)
+    parser.add_argument('-entityList', help='JSON file of IfcProducts that should be processed or excluded')
+    parser.add_argument('-buildingCS', action="store_true", help='Generate Patches in Coordinate System of Building NOT Site')
+    parser.add_argument('-stateID', help="the state / phase id for the analyzed IFC file", default=-999, type=int)
+    parser.add_argument('-stream', action='store_true', help='Extract and write faces and boxes product by product while the iterator runs to keep memory bounded')
+    parser.add_argument('-cacheDir', help='Directory of the persistent geometry cache. If not set, no cache is used')
+    parser.add_argument('-cacheSize', help='Maximum size of the geometry cache in MB', default=4096, type=float)
+    parser.add_argument('-prevIfc', help='Previous revision of the Ifc-File. If set, only new and changed products are extracted')
+    parser.add_argument('-prevFaceFile', help='The face info output file of the previous revision, in the format of -outputFormat')
+    parser.add_argument('-prevBoxFile', help='The box info output file of the previous revision, in the format of -outputFormat')
+    parser.add_argument('-outputFormat', choices=['csv', 'binary'], default='csv', help='csv writes semicolon separated text, binary writes memory mappable columns (see binaryOutput.py)')
+    parser.add_argument('-meshFaces', action='store_true', help='Extract the faces from the triangulated geometry instead of BReps. Can not be combined with -boxes')
+    parser.add_argument('-precision', help='Number of decimal places of the face polygon coordinates. Default is full precision', type=int)
+    parser.add_argument('-geometryFormat', choices=['wkt', 'wkb'], default='wkt', help='Format of the face polygons in the csv output, wkb is written as hex string')
+    parser.add_argument('-compress', action='store_true', help='Compress the columns of the binary output')
+    parser.add_argument('-voxelResolution', help='If set, the voxels of this size in meter overlapping each oriented box are written to -voxelFile', type=float)
+    parser.add_argument('-voxelFile', help='The path to the voxel index output file. Default is <boxFile>_voxels.bin')
+    parser.add_argument('-boxTree', action='store_true', help='If flag is set, a bounding volume hierarchy over the boxes is written to -boxTreeFile')
+    parser.add_argument('-boxTreeFile', help='The path to the box tree output file. Default is <boxFile>_tree.bin')
+    parser.add_argument('-workers', help='Number of processes for the face and box extraction. 0 uses all cores, 1 extracts in the main process', default=0, type=int)
+    parser.add_argument('-metricsFile', help='If set, wall time, CPU time and peak memory per stage and per entity type are written to this json file')
+    parser.add_argument('-slowest', help='Number of slowest products listed in the -metricsFile', default=20, type=int)
+    parser.add_argument('-partition', choices=['storey', 'building'], help='Extract the products of every storey or building in a separate process and merge the results')
+    parser.add_argument('-partitionWorkers', help='Number of partitions extracted at the same time. 0 runs as many as fit into the available memory, each parses the whole model', default=0, type=int)
+    parser.add_argument('-partitionMemoryMB', help='Memory limit of every partition process in MB (address space, not on windows)', type=float)
+    parser.add_argument('-instancing', action='store_true', help='Create the geometry of products sharing an IfcRepresentationMap once and place the faces and boxes of the other instances')
+    return parser
+
+
+def getArguments(ifcPath, **options):
+    # the command line defaults for ifcPath, overwritten by options named like the command line flags, e.g. faces=True
+    args = getArgumentParser().parse_args(['-i', ifcPath])
+    for name, value in options.items():
+        if not hasattr(args, name):
+            raise TypeError(f'unknown option {name}')
+        setattr(args, name, value)
+    return args
+
+
+def main():
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    args = getArgumentParser().parse_args()
+    importProfile.startFromEnvironment()
+    logFilePath = os.path.join(os.path.dirname(os.path.abspath(args.i)), 'IFCFaceExtractorLog.log')
+    logging.basicConfig(filename=logFilePath, filemode='w', format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 
-from common import transformation
-from faceExtraction import wktExtraction
-
-for handler in logging.root.handlers[:]:
-    logging.root.removeHandler(handler)
-
-totalStart = time.time()
-
-parser = argparse.ArgumentParser(description='Extract planar faces with parameters and BBoxes from IFC-File')
-parser.add_argument('-i', required=True, help='the input Ifc-File')
-parser.add_argument('-faces', action='store_true', help='If flag is set, face information are calculated and stored in file -faceFile')
-parser.add_argument('-faceFile', default='./faceInfo.csv', help='The path to the face info output csv file')
-parser.add_argument('-boxes', action='store_true', help='If flag is set, bounding boxes for products will be calcualted and stord in file -boxFile')
-parser.add_argument('-boxFile', default='./boxInfo.csv', help='The path to the box info output csv file')
-parser.add_argument('-boxBuffer', help="Size of the buffer arround extracted bounding boxes in meter", default=0.0, type=float)
-parser.add_argument('-entityList', help='JSON file of IfcProducts that should be processed or excluded')
-parser.add_argument('-buildingCS', action="store_true", help='Generate Patches in Coordinate System of Building NOT Site')
-parser.add_argument('-stateID', help="the state / phase id for the analyzed IFC file", default=-999, type=int)
-
-
-args = parser.parse_args()
-ifc_path = os.path.abspath(args.i)
-
-calc_faces = args.faces
-calc_boxes = args.boxes
-enlarge_boxes = True if args.boxBuffer != 0.0 else False
-
-if calc_faces and calc_boxes == False:
-    logging.error("No output type specified. Terminating process")
-    sys.exit("No output type specified. Terminating process")
-
-
-outFileFolder = os.path.dirname(ifc_path)
-logFilePath = os.path.join(outFileFolder, 'IFCFaceExtractorLog.log')
-
-logging.basicConfig(filename=logFilePath, filemode='w', format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
-
-logging.info('starting IFCExtractor for file ' + ifc_path)
-print('starting IFCExtractor for file ' + ifc_path)
-
-ifc_file = ifcopenshell.open(ifc_path)
-logging.info('finished opening IFC file')
-print('finished opening IFC file')
-
-includingEntities, excludingEntities = None, None
-products = []
-if args.entityList:
-    try:
-        with open(args.entityList) as json_file:
-            entityList = json.load(json_file)
-
-        includingEntities = entityList['includeList']
-        excludingEntities = entityList['excludeList']
-        if len(includingEntities) > 0 and len(excludingEntities) == 0:
-            includingEntities = includingEntities
-            excludingEntities = None
-        elif len(excludingEntities) > 0 and len(includingEntities) == 0:
-            excludingEntities = excludingEntities
-            includingEntities = None
-        elif len(includingEntities) > 0 and len(excludingEntities) > 0:
-            logging.error('Can not specify including and excluding entites simultaneously. Stopping process')
-            sys.exit('Can not specify including and excluding entites simultaneously. Stopping process')
-
-    except Exception as ex:
-        traceback.print_exc()
-        logging.exception("Exception occured")
-        sys.exit()
-
-#keine JSON spezifiziert
-else:
-    products = ifc_file.by_type('IfcProduct')
-    logging.info(f'No selection restrictions are given. Proceeding for all {len(products)} IfcProducts')
-    print(f'No selection restrictions are given. Proceeding for all {len(products)} IfcProducts')
-
-
-shapes_iterator = []
-product_geom_dict = {}
-
-iterator_settings = ifcopenshell.geom.settings()
-iterator_settings.set(iterator_settings.USE_PYTHON_OPENCASCADE, True)
-iterator_settings.set(iterator_settings.DISABLE_TRIANGULATION, False)
-iterator_settings.set(iterator_settings.USE_BREP_DATA, True)
-
-iterator_start = time.time()
-
-iterator = ifcopenshell.geom.iterator(iterator_settings, ifc_file, multiprocessing.cpu_count(),
-                                      include=includingEntities, exclude=excludingEntities)
-
-if iterator.initialize():
-    logging.info('Starting geometry creation with iterator')
-    print('Starting geometry creation with iterator')
-    while True:
-        shape_tuple = iterator.get()
-        product_geom_dict[shape_tuple.data.guid] = [ifc_file.by_guid(shape_tuple.data.guid), shape_tuple.geometry]
-        if not iterator.next():
-            break
-
-iterator_end = time.time()
-
-logging.info(f"Iterator took {iterator_end-iterator_start} seconds for geometry creation")
-print(f"Iterator took {iterator_end-iterator_start} seconds for geometry creation")
-
-
-if args.buildingCS:
-    logging.info("Starting to transform geometries into building coordinate system")
-    print("Starting to transform geometries into building coordinate system")
-
-    building = ifc_file.by_type('IfcBuilding')[0]
-    buildingTrsfMatrix = transformation.getCombinedAxis2Plc(building).getTrsfMatrix().Inverted()
-    brepTransformator = BRepBuilderAPI.BRepBuilderAPI_Transform(buildingTrsfMatrix)
-
-    transformed_shape_dict = {}
-    for guid, shape in product_geom_dict.values():
-        brepTransformator.Perform(shape)
-        transformed_shape_dict[guid] = [ifc_file.by_guid(guid), brepTransformator.Shape()]
-
-    product_geom_dict = transformed_shape_dict
-
-logging.info("Starting with extraction of geometric properties for products")
-print("Starting with extraction of geometric properties for products")
-
-allBIMFaces = []
-allBoxes = {}
-allOBBoxes = {}
-for product_geom_list in product_geom_dict.values():
     try:
+        extractFacesAndBoxes(args)
+    except ExtractionError as ex:
+        sys.exit(str(ex))
+
+
+def extractFacesAndBoxes(args, ifc_file=None, getCache=None):
+    # runs the extraction for the arguments of getArgumentParser. A model opened already and a function returning
+    # the geometry cache for the iterator settings can be passed, e.g. by the extraction daemon. Returns the number of extracted products
+    totalStart = time.time()
+    recorder = metrics.MetricsRecorder('IFCFaceBoxExtractor', args.slowest, recordProducts=args.metricsFile is not None)
+    ifc_path = os.path.abspath(args.i)
+
+    calc_faces = args.faces
+    calc_boxes = args.boxes
+    enlarge_boxes = True if args.boxBuffer != 0.0 else False
+
+    if not calc_faces and not calc_boxes:
+        logging.error("No output type specified. Terminating process")
+        raise ExtractionError("No output type specified. Terminating process")
+    if args.voxelResolution is not None and (not calc_boxes or args.voxelResolution <= 0):
+        logging.error("The voxel index needs -boxes and a positive -voxelResolution. Terminating process")
+        raise ExtractionError("The voxel index needs -boxes and a positive -voxelResolution. Terminating process")
+    if args.boxTree and not calc_boxes:
+        logging.error("The box tree needs -boxes. Terminating process")
+        raise ExtractionError("The box tree needs -boxes. Terminating process")
+    if args.meshFaces and calc_boxes:
+        logging.error("Boxes can not be calculated from the triangulated geometry. Terminating process")
+        raise ExtractionError("Boxes can not be calculated from the triangulated geometry. Terminating process")
+    if args.partition and args.prevIfc:
+        logging.error("Partitioned extraction can not be combined with incremental extraction. Terminating process")
+        raise ExtractionError("Partitioned extraction can not be combined with incremental extraction. Terminating process")
+    if args.partition and args.instancing:
+        logging.error("Partitioned extraction can not be combined with instancing. Terminating process")
+        raise ExtractionError("Partitioned extraction can not be combined with instancing. Terminating process")
+
+    # the heavy modules are imported after the argument checks, OCC only by the BRep extraction in productExtraction
+    with recorder.stage('import'):
+        import ifcopenshell
+
+        from common import geometryCache, geometryIterator, revisionDiff, selection, transformation
+        from faceExtraction import binaryOutput, boxFile, boxTree, instanceExtraction, partitionedExtraction, productExtraction, resultWriter, voxelIndex
+
+    if args.faceFile is None:
+        args.faceFile = resultWriter.getDefaultOutputPath('faceInfo', args.outputFormat)
+    if args.boxFile is None:
+        args.boxFile = resultWriter.getDefaultOutputPath('boxInfo', args.outputFormat)
+    if args.voxelResolution is not None and args.voxelFile is None:
+        args.voxelFile = os.path.splitext(args.boxFile)[0] + '_voxels.bin'
+    if args.boxTree and args.boxTreeFile is None:
+        args.boxTreeFile = os.path.splitext(args.boxFile)[0] + '_tree.bin'
+
+    logging.info('starting IFCExtractor for file ' + ifc_path)
+    print('starting IFCExtractor for file ' + ifc_path)
+
+    recorder.setAttribute('input', ifc_path)
+    recorder.setAttribute('arguments', vars(args))
+    with recorder.stage('open'):
+        if ifc_file is None:
+            ifc_file = ifcopenshell.open(ifc_path)
+    logging.info('finished opening IFC file')
+    print('finished opening IFC file')
+
+    productSelection = None
+    if args.entityList:
+        try:
+            productSelection = selection.readSelection(args.entityList)
+        except Exception as ex:
+            traceback.print_exc()
+            logging.exception("Exception occured")
+            raise ExtractionError(f'The entity list {args.entityList} can not be read: {ex}') from ex
+
+    # the selection is passed to the iterator as include list, so products that are not selected are never tessellated
+    with recorder.stage('selection'):
+        includingEntities, excludingEntities = selection.getIteratorArguments(ifc_file, productSelection)
+    if includingEntities is None:
+        products = ifc_file.by_type('IfcProduct')
+        logging.info(f'No selection restrictions are given. Proceeding for all {len(products)} IfcProducts')
+        print(f'No selection restrictions are given. Proceeding for all {len(products)} IfcProducts')
+    else:
+        logging.info(f'Selected {len(includingEntities)} IfcProducts by {selection.describeSelection(productSelection)}')
+        print(f'Selected {len(includingEntities)} IfcProducts by {selection.describeSelection(productSelection)}')
+
+
+    if args.meshFaces:
+        iterator_settings = geometryIterator.getMeshIteratorSettings()
+    else:
+        iterator_settings = geometryIterator.getBRepIteratorSettings()
+
+    cache = getCache(iterator_settings) if getCache is not None else None
+    if cache is None and args.cacheDir:
+        cache = geometryCache.GeometryCache(args.cacheDir, ifc_path, iterator_settings, args.cacheSize)
+        logging.info(f'Using geometry cache {cache.ModelDir}')
+        print(f'Using geometry cache {cache.ModelDir}')
+
+    outputOptions = resultWriter.getOutputOptions(args.buildingCS, args.boxBuffer, args.precision, args.geometryFormat, args.meshFaces)
+    reuseGuids = set()
+    if args.prevIfc:
+        if (calc_faces and not args.prevFaceFile) or (calc_boxes and not args.prevBoxFile):
+            logging.error("Incremental extraction needs the previous output file for every output type. Terminating process")
+            raise ExtractionError("Incremental extraction needs the previous output file for every output type. Terminating process")
+        if (calc_faces and os.path.abspath(args.prevFaceFile) == os.path.abspath(args.faceFile)) or \
+                (calc_boxes and os.path.abspath(args.prevBoxFile) == os.path.abspath(args.boxFile)):
+            logging.error("The previous output files can not be overwritten by the incremental extraction. Terminating process")
+            raise ExtractionError("The previous output files can not be overwritten by the incremental extraction. Terminating process")
+        for prevPath in [args.prevFaceFile if calc_faces else None, args.prevBoxFile if calc_boxes else None]:
+            if prevPath and resultWriter.readOutputOptions(prevPath, args.outputFormat) != outputOptions:
+                logging.error(f"{prevPath} was not written with the options {outputOptions} of this run. Terminating process")
+                raise ExtractionError(f"{prevPath} was not written with the options {outputOptions} of this run. Terminating process")
+
+        logging.info('Comparing with previous revision ' + os.path.abspath(args.prevIfc))
+        print('Comparing with previous revision ' + os.path.abspath(args.prevIfc))
+        diff_start = time.time()
+        diffWatch = metrics.Stopwatch()
+
+        prev_ifc_file = ifcopenshell.open(args.prevIfc)
+        changedProducts, reuseGuids, removedGuids = revisionDiff.compareRevisions(prev_ifc_file, ifc_file, includingEntities, excludingEntities)
+        del prev_ifc_file
+
+        # products without faces or a box in the previous result have to be extracted again, their extraction may have failed
+        prevGuidSets = []
         if calc_faces:
-            faceId = 0
-            for face in TopologyUtils.TopologyExplorer(product_geom_list[1]).faces():
-                allBIMFaces.append(wktExtraction.getBIMFaceInfo(face, product_geom_list[0], args.stateID, faceId))
-                faceId += 1
+            prevGuidSets.append(binaryOutput.readFaceGuids(args.prevFaceFile) if args.outputFormat == 'binary' else revisionDiff.readGuidsFromCsv(args.prevFaceFile, 1))
         if calc_boxes:
-            bbox = OCC.Core.Bnd.Bnd_Box()
-            BRepBndLib.brepbndlib.Add(product_geom_list[1], bbox)
-            if enlarge_boxes:
-                bbox.Enlarge(args.boxBuffer)
-            allBoxes[product_geom_list[0].GlobalId] = bbox
-
-            obbox = OCC.Core.Bnd.Bnd_OBB()
-            BRepBndLib.brepbndlib.AddOBB(product_geom_list[1], obbox, True, True, True)
-            if enlarge_boxes:
-                obbox.Enlarge(args.boxBuffer)
-            allOBBoxes[product_geom_list[0].GlobalId] = obbox
-
-    except Exception as ex:
-        logging.error('{}\n'.format(ex))
-        print(ex)
-
-if calc_faces and args.boxBuffer != 0.0:
-    logging.info(f"Enlarged boxes by {args.boxBuffer} meters")
-    print(f"Enlarged box by {args.boxBuffer} meters")
-
-logging.info("Finished with extraction of geometric properties for products")
-print("Finished with extraction of geometric properties for products")
-
-
-logging.info("Writing results to file")
-print("Writing results to file")
-
-if calc_faces:
-    with open(args.faceFile, 'w') as f:#, open(args.boxFile, 'w') as box_file:
-        f.write("StateId;ObjectGuid;FaceId;Polygon\n")
-        f.write("\n".join([x.toCSVString() for x in allBIMFaces if x is not None]))
-
-if calc_boxes:
-    with open(args.boxFile, 'w') as box_file:
-        box_file.write("Oriented;StateId;ObjectGuid;Element;BBoxMinX;BBoxMinY;BBoxMinZ;BBoxMaxX;BBoxMaxY;BBoxMaxZ;OBoxCenterX;OBoxCenterY;OBoxCenterZ;" +
-                       "OBoxXDirX;OBoxXDirY;OBoxXDirZ;OBoxYDirX;OBoxYDirY;OBoxYDirZ;OBoxZDirX;OBoxZDirY;OBoxZDirZ;" +
-                       "OBoxXHSize;OBoxYHSize;OBoxZHSize\n")
-
-        for guid, box in allBoxes.items():
-            xmin, ymin, zmin, xmax, ymax, zmax = box.Get()
-
-            center_obox = allOBBoxes[guid].Center()
-            xDir = allOBBoxes[guid].XDirection()
-            yDir = allOBBoxes[guid].YDirection()
-            zDir = allOBBoxes[guid].ZDirection()
-
-            xSize = allOBBoxes[guid].XHSize()
-            ySize = allOBBoxes[guid].YHSize()
-            zSize = allOBBoxes[guid].ZHSize()
-
-            box_file.write(f"True;{args.stateID};{guid};0;{xmin};{ymin};{zmin};{xmax};{ymax};{zmax};{center_obox.X()};{center_obox.Y()};{center_obox.Z()};" +
-                           f"{xDir.X()};{xDir.Y()};{xDir.Z()};{yDir.X()};{yDir.Y()};{yDir.Z()};{zDir.X()};{zDir.Y()};{zDir.Z()};" +
-                           f"{xSize};{ySize};{zSize}\n")
-
-        #box_file.write("\n".join([wktExtraction.box_to_string(value, key, args.stateID) for key, value in allBoxes.items()]))
-
-logging.info("Finished Program")
-print("Finished Program")
\ No newline at end of file
+            prevGuidSets.append(binaryOutput.readBoxGuids(args.prevBoxFile) if args.outputFormat == 'binary' else revisionDiff.readGuidsFromCsv(args.prevBoxFile, 2))
+        missingGuids = set()
+        for prevGuids in prevGuidSets:
+            missingGuids |= reuseGuids - prevGuids
+        changedProducts.extend(ifc_file.by_guid(x) for x in missingGuids)
+        reuseGuids -= missingGuids
+
+        includingEntities, excludingEntities = changedProducts, None
+        recorder.addStage('revision comparison', *diffWatch.elapsed())
+
+        logging.info(f'{len(changedProducts)} new or changed products, {len(reuseGuids)} reused, {len(removedGuids)} removed. Comparison took {time.time()-diff_start} seconds')
+        print(f'{len(changedProducts)} new or changed products, {len(reuseGuids)} reused, {len(removedGuids)} removed. Comparison took {time.time()-diff_start} seconds')
+
+
+    # the building coordinate system is applied to the extracted coordinates, the BReps are not copied
+    buildingMatrix = None
+    if args.buildingCS:
+        with recorder.stage('transform'):
+            buildingMatrix = transformation.getInvertedBuildingMatrix(ifc_file)
+
+    options = productExtraction.ExtractionOptions(calc_faces, calc_boxes, args.stateID, args.boxBuffer, buildingMatrix, args.outputFormat,
+                                                  args.precision, args.geometryFormat, args.meshFaces)
+    numWorkers = args.workers if args.workers > 0 else multiprocessing.cpu_count()
+
+    # only the prototype of every group of instances is passed to the iterator
+    instanceGroups = []
+    if args.instancing:
+        with recorder.stage('instancing'):
+            candidates = geometryCache.getCandidateProducts(ifc_file, includingEntities, excludingEntities)
+            instanceGroups = instanceExtraction.getInstanceGroups(ifc_file, candidates)
+            instanceIds = {x.id() for group in instanceGroups for x in group.Instances}
+            includingEntities, excludingEntities = [x for x in candidates if x.id() not in instanceIds], None
+        del candidates
+        for group in instanceGroups:
+            for instance in group.Instances:
+                recorder.setProductType(instance.GlobalId, instance.is_a())
+        options = options._replace(TemplateGuids=frozenset(x.Prototype.GlobalId for x in instanceGroups))
+        logging.info(f'{len(instanceIds)} products are placed instances of {len(instanceGroups)} prototypes')
+        print(f'{len(instanceIds)} products are placed instances of {len(instanceGroups)} prototypes')
+
+    failedPartitions = []
+    if args.partition:
+        # the model is only used for the partitioning here, the geometry is created in the partition processes
+        with recorder.stage('partitioning'):
+            candidates = geometryCache.getCandidateProducts(ifc_file, includingEntities, excludingEntities)
+            partitions = partitionedExtraction.getPartitions(ifc_file, candidates, args.partition)
+        del candidates
+
+        # every partition process parses the whole model again, the peak memory of this process after parsing is
+        # the estimate of what one of them needs. The model of this process is released before they start
+        modelMemoryMB = metrics.getPeakRSSMB()
+        if args.partitionMemoryMB and modelMemoryMB and args.partitionMemoryMB < modelMemoryMB:
+            logging.warning(f'-partitionMemoryMB {args.partitionMemoryMB} is below the {modelMemoryMB} MB needed to parse the model, the partitions will likely fail')
+            print(f'-partitionMemoryMB {args.partitionMemoryMB} is below the {modelMemoryMB} MB needed to parse the model, the partitions will likely fail')
+        ifc_file = productSelection = includingEntities = excludingEntities = products = None
+        if cache is not None:
+            cache.close()
+            cache = None
+        numPartitionProcesses = args.partitionWorkers
+        if numPartitionProcesses <= 0:
+            numPartitionProcesses = partitionedExtraction.getProcessCount(args.partitionMemoryMB if args.partitionMemoryMB else modelMemoryMB)
+        logging.info(f"Extracting {len(partitions)} partitions by {args.partition} in {numPartitionProcesses} processes")
+        print(f"Extracting {len(partitions)} partitions by {args.partition} in {numPartitionProcesses} processes")
+
+        extraction_start = time.time()
+        with recorder.stage('partitioned extraction and merge'):
+            productCounter, failedPartitions = partitionedExtraction.extractPartitions(ifc_path, partitions, options, args.faceFile if calc_faces else None,
+                                                                                        args.boxFile if calc_boxes else None, 'zlib' if args.compress else None,
+                                                                                        numPartitionProcesses, args.partitionMemoryMB, args.cacheDir,
+                                                                                        args.cacheSize, recorder, outputOptions)
+
+    else:
+        logging.info(f'Extracting faces and boxes with {numWorkers} worker processes')
+        print(f'Extracting faces and boxes with {numWorkers} worker processes')
+
+        if args.stream:
+            # extract and write every product as soon as the iterator yields it. Only the shapes of the
+            # chunks currently processed by the workers are alive
+            logging.info('Starting streamed geometry creation and extraction with iterator')
+            print('Starting streamed geometry creation and extraction with iterator')
+
+            def productShapes():
+                for product, shape in recorder.timeIterator(geometryIterator.iterateShapes(ifc_file, iterator_settings, include=includingEntities, exclude=excludingEntities, cache=cache),
+                                                            'geometry iteration', getProductInfo):
+                    yield product.GlobalId, shape
+
+        else:
+            product_geom_dict = {}
+
+            iterator_start = time.time()
+
+            logging.info('Starting geometry creation with iterator')
+            print('Starting geometry creation with iterator')
+            with recorder.stage('geometry iteration'):
+                for product, shape in recorder.timeIterator(geometryIterator.iterateShapes(ifc_file, iterator_settings, include=includingEntities, exclude=excludingEntities, cache=cache),
+                                                            'geometry iteration', getProductInfo):
+                    product_geom_dict[product.GlobalId] = [product, shape]
+
+            iterator_end = time.time()
+
+            logging.info(f"Iterator took {iterator_end-iterator_start} seconds for geometry creation")
+            print(f"Iterator took {iterator_end-iterator_start} seconds for geometry creation")
+
+            # the multithreaded iterator yields the products in arbitrary order, the output is ordered by step id
+            productShapes = lambda: [(product.GlobalId, shape) for product, shape in sorted(product_geom_dict.values(), key=lambda x: x[0].id())]
+
+        logging.info("Starting with extraction of geometric properties for products")
+        print("Starting with extraction of geometric properties for products")
+        extraction_start = time.time()
+        productCounter = 0
+
+        with recorder.stage('extraction and write' if not args.stream else 'geometry iteration, extraction and write'), contextlib.ExitStack() as stack:
+            writer = stack.enter_context(resultWriter.openResultWriter(args.outputFormat, args.faceFile if calc_faces else None,
+                                                                       args.boxFile if calc_boxes else None, args.stateID,
+                                                                       'zlib' if args.compress else None, outputOptions))
+            if args.prevIfc:
+                writer.writeReusedRows(args.prevFaceFile, args.prevBoxFile, reuseGuids, args.stateID)
+
+            extractionPool = stack.enter_context(productExtraction.ExtractionPool(options, numWorkers))
+            results = extractionPool.imap(productShapes())
+            if instanceGroups:
+                results = instanceExtraction.expandInstances(results, instanceGroups, options)
+            for guid, faces, box, error, timing in results:
+                if error is not None:
+                    logging.error('{}\n'.format(error))
+                    print(error)
+                recorder.addProductTiming(guid, timing)
+                writeWatch = metrics.Stopwatch()
+                writer.write(guid, faces, box)
+                recorder.addProductTime(guid, 'write', *writeWatch.elapsed())
+                recorder.finishProduct(guid)
+                productCounter += 1
+
+        if cache is not None:
+            cache.close()
+
+    if calc_boxes and enlarge_boxes:
+        logging.info(f"Enlarged boxes by {args.boxBuffer} meters")
+        print(f"Enlarged box by {args.boxBuffer} meters")
+
+    logging.info(f"Extraction and writing of {productCounter} products took {time.time()-extraction_start} seconds")
+    print(f"Extraction and writing of {productCounter} products took {time.time()-extraction_start} seconds")
+
+    # the box file also contains the rows reused from a previous revision
+    if args.boxTree or args.voxelResolution is not None:
+        with recorder.stage('read boxes'):
+            boxes = boxFile.readBoxFile(args.boxFile)
+
+    if args.boxTree:
+        tree_start = time.time()
+        with recorder.stage('box tree'):
+            numNodes = boxTree.writeBoxTree(args.boxTreeFile, boxes)
+        logging.info(f"Wrote box tree with {numNodes} nodes for {len(boxes.Guids)} boxes in {time.time()-tree_start} seconds")
+        print(f"Wrote box tree with {numNodes} nodes for {len(boxes.Guids)} boxes in {time.time()-tree_start} seconds")
+
+    if args.voxelResolution is not None:
+        voxel_start = time.time()
+        with recorder.stage('voxel index'):
+            boxVoxels = voxelIndex.computeBoxVoxels(boxes, args.voxelResolution, numWorkers)
+            numVoxels = voxelIndex.writeVoxelIndex(args.voxelFile, boxes.Guids, boxVoxels, args.voxelResolution, 'zlib' if args.compress else None)
+        logging.info(f"Wrote {numVoxels} voxels of {len(boxes.Guids)} boxes at resolution {args.voxelResolution} in {time.time()-voxel_start} seconds")
+        print(f"Wrote {numVoxels} voxels of {len(boxes.Guids)} boxes at resolution {args.voxelResolution} in {time.time()-voxel_start} seconds")
+
+    if args.metricsFile:
+        recorder.setAttribute('products', productCounter)
+        recorder.write(args.metricsFile)
+        logging.info(f"Wrote metrics to {args.metricsFile}")
+        print(f"Wrote metrics to {args.metricsFile}")
+
+    if failedPartitions:
+        logging.error(f"The partitions {failedPartitions} failed, their products are missing in the output")
+        raise ExtractionError(f"The partitions {failedPartitions} failed, their products are missing in the output")
+
+    logging.info("Finished Program")
+    print("Finished Program")
+    return productCounter
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
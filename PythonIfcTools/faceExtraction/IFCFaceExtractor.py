@@ -1,16 +1,9 @@
 import argparse
-import itertools
-import json
 import logging
 import os
 import time
 
-import ifcopenshell
-from OCC.Extend import TopologyUtils
-from ifcopenshell import geom
-
-import wktExtraction
-from common import transformation
+from common import importProfile
 
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
@@ -23,9 +16,20 @@ parser.add_argument('-o', required=True, help='the output csv-File')
 parser.add_argument('-entityList', help='JSON List of IfcProducts that should be processed')
 parser.add_argument('-buildingCS', action="store_true", help='Generate Patches in Coordinate System of Building NOT Site')
 parser.add_argument('-stateID', help="the state / phase id for the analyzed IFC file", default=-999)
+parser.add_argument('-cacheDir', help='Directory of the persistent geometry cache. If not set, no cache is used')
+parser.add_argument('-cacheSize', help='Maximum size of the geometry cache in MB', default=4096, type=float)
 
 args = parser.parse_args()
 
+# the heavy modules are imported after the arguments are parsed, so -h returns immediately
+importProfile.startFromEnvironment()
+import ifcopenshell
+from ifcopenshell import geom
+
+import wktExtraction
+from common import geometryCache, selection, transformation
+from faceExtraction import faceTable
+
 outFileName = args.o
 outFileFolder = os.path.dirname(os.path.abspath(outFileName))
 logFilePath = os.path.join(outFileFolder, 'IFCFaceExtractorLog.log')
@@ -39,34 +43,16 @@ ifc_file = ifcopenshell.open(args.i)
 settings = geom.settings()
 settings.set(settings.USE_PYTHON_OPENCASCADE, True)
 
-products = []
+cache = None
+if args.cacheDir:
+    cache = geometryCache.GeometryCache(args.cacheDir, args.i, settings, args.cacheSize)
+    logging.info('using geometry cache {}'.format(cache.ModelDir))
+
 if args.entityList:
-    with open(args.entityList) as json_file:
-        entityList = json.load(json_file)
-
-    #JSON enthält Entitäten, die selektiert werden sollen
-    if len(entityList['includeList']) > 0 and len(entityList['excludeList'])== 0:
-        for entType in entityList['includeList']:
-            try:
-                selectedElems = ifc_file.by_type(entType)
-                logging.info('{} instances of {} have been found in the Ifc-File'.format(len(selectedElems), entType))
-                products.append(selectedElems)
-            except Exception as ex:
-                logging.warning('specified entity type {} was not found in selectd IFC-File'.format(entType))
-                print('specified entity type {} was not found in selectd IFC-File'.format(entType))
-                print(ex)
-                logging.exception("Exception occured")
-        # chain entities in one flat list
-        products = list(itertools.chain.from_iterable(products))
-
-    #JSON enthält Entitäten die ausgeschlossen werden sollen
-    elif len(entityList['excludeList']) > 0:
-        products = ifc_file.by_type('IfcProduct')
-        entitiesToExclude = []
-        for elemType in entityList['excludeList']:
-            entitiesToExclude.append(ifc_file.by_type(elemType))
-        entitiesToExclude = list(itertools.chain.from_iterable(entitiesToExclude))
-        products = [x for x in products if x not in entitiesToExclude]
+    # JSON mit Entitätstypen, GlobalIds, Geschossen und Eigenschaften, siehe common/selection.py
+    productSelection = selection.readSelection(args.entityList)
+    products = selection.selectProducts(ifc_file, productSelection)
+    logging.info('{} IfcProducts selected by {}'.format(len(products), selection.describeSelection(productSelection)))
 
 #keine JSON spezifiziert
 else:
@@ -82,23 +68,20 @@ shapes = []
 for product in products:
     try:
         if product.Representation is not None:
-            shapes.append([geom.create_shape(settings, product).geometry, product])
+            shapes.append([geometryCache.createShape(cache, settings, product), product])
     except Exception as ex:
         failureCounter += 1
         print(product)
         print(ex)
         logging.exception(ex)
 
-if args.buildingCS:
-    building = ifc_file.by_type('IfcBuilding')[0]
-    buildingTrsfMatrix = transformation.getCombinedAxis2Plc(building).getTrsfMatrix().Inverted()
-
-    shapesToTransform = [x[0] for x in shapes]
-    ifcEntities = [x[1] for x in shapes]
-    transformedShapes = transformation.transformListOfOCCShape(shapesToTransform, buildingTrsfMatrix)
+if cache is not None:
+    cache.close()
 
-    #zip returns list of tuples; map calls list on each tuple of the list
-    shapes = list(map(list, zip(transformedShapes, ifcEntities)))
+# the building coordinate system is applied to the extracted coordinates, the BReps are not copied
+buildingMatrix = None
+if args.buildingCS:
+    buildingMatrix = transformation.getInvertedBuildingMatrix(ifc_file)
 
 shapeCreateEnd = time.time()
 
@@ -109,15 +92,13 @@ logging.info('a total of {} shapes were created'.format(len(shapes)))
 
 StateID = args.stateID
 
-allBIMFaces = []
+# the faces of all shapes in flat arrays, the polygons are formatted when the file is written
+faces = faceTable.FaceTable(StateID)
 patchInfoStart = time.time()
 
 for shape in shapes:
     try:
-        faceId = 0
-        for face in TopologyUtils.TopologyExplorer(shape[0]).faces():
-            allBIMFaces.append(wktExtraction.getBIMFaceInfo(face, shape[1], StateID, faceId))
-            faceId += 1
+        faces.addFaces(shape[1].GlobalId, *wktExtraction.getFacePlanesForShape(shape[0], buildingMatrix))
     except Exception as ex:
         logging.error('{}\n'.format(ex))
 
@@ -127,8 +108,7 @@ print('patch info extraction finished after {} seconds'.format(patchInfoEnd-patc
 logging.info('patch info extraction finished after {} seconds'.format(patchInfoEnd-patchInfoStart))
 
 with open(args.o, 'w') as f:
-    f.write("StateId;ObjectGuid;FaceId;Polygon\n")
-    f.write("\n".join([x.toCSVString() for x in allBIMFaces if x is not None]))
+    faces.writeCsv(f)
 
 totalEnd = time.time()
 print('whole process took {} seconds'.format(totalEnd-totalStart))
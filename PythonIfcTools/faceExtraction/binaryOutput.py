@@ -0,0 +1,169 @@
+import collections
+
+import numpy as np
+
+from common import columnarFile
+
+# one fixed width record per product, same content as a row of the box csv file
+BOX_DTYPE = np.dtype([('Oriented', '?'), ('StateId', '<i4'), ('ObjectGuid', 'S22'), ('Element', '<i4'),
+                      ('BBoxMin', '<f8', (3,)), ('BBoxMax', '<f8', (3,)), ('OBoxCenter', '<f8', (3,)),
+                      ('OBoxXDir', '<f8', (3,)), ('OBoxYDir', '<f8', (3,)), ('OBoxZDir', '<f8', (3,)),
+                      ('OBoxHSize', '<f8', (3,))], align=True)
+
+BOX_FORMAT = 'Green3DScan.Boxes.1'
+FACE_FORMAT = 'Green3DScan.Faces.1'
+
+# Faces are stored as columns: the rings of face i are FaceRingOffsets[i]:FaceRingOffsets[i+1], the first of
+# them is the outer ring. The points of ring j are Coordinates[RingPointOffsets[j]:RingPointOffsets[j+1]],
+# rings are not closed, i.e. the first point is not repeated
+FaceData = collections.namedtuple('FaceData', ['Guids', 'FaceGuidIndex', 'FaceStateId', 'FaceId',
+                                               'FaceRingOffsets', 'RingPointOffsets', 'Coordinates'])
+
+
+class BinaryBoxWriter:
+
+    def __init__(self, path, compression=None, bufferSize=4096):
+        self.Writer = columnarFile.ColumnarWriter(path, compression)
+        self.Writer.addColumn('Boxes', BOX_DTYPE)
+        self.Writer.setAttribute('format', BOX_FORMAT)
+        self.Buffer = []
+        self.BufferSize = bufferSize
+
+    def write(self, record):
+        self.Buffer.append(record)
+        if len(self.Buffer) >= self.BufferSize:
+            self.flush()
+
+    def writeRecords(self, records):
+        self.flush()
+        self.Writer.append('Boxes', records)
+
+    def flush(self):
+        if self.Buffer:
+            self.Writer.append('Boxes', np.array(self.Buffer, dtype=BOX_DTYPE))
+            self.Buffer = []
+
+    def close(self):
+        self.flush()
+        self.Writer.close()
+
+
+class BinaryFaceWriter:
+
+    def __init__(self, path, compression=None):
+        self.Writer = columnarFile.ColumnarWriter(path, compression)
+        self.Writer.addColumn('Guids', 'S22')
+        self.Writer.addColumn('FaceGuidIndex', '<i4')
+        self.Writer.addColumn('FaceStateId', '<i4')
+        self.Writer.addColumn('FaceId', '<i4')
+        self.Writer.addColumn('FaceRingOffsets', '<i8')
+        self.Writer.addColumn('RingPointOffsets', '<i8')
+        self.Writer.addColumn('Coordinates', '<f8', (3,))
+        self.Writer.setAttribute('format', FACE_FORMAT)
+
+        self.GuidCount = 0
+        self.RingCount = 0
+        self.PointCount = 0
+        self.Writer.append('FaceRingOffsets', [0])
+        self.Writer.append('RingPointOffsets', [0])
+
+    def writeFaces(self, guid, stateId, faces):
+        # faces: list of [faceId, [outerRing, innerRings]] with (n, 3) arrays
+        if not faces:
+            return
+        guidIndex = self.GuidCount
+        self.Writer.append('Guids', [guid.encode('ascii')])
+        self.GuidCount += 1
+
+        rings = [ring for faceId, (outer, inners) in faces for ring in [outer] + list(inners)]
+        ringsPerFace = np.array([1 + len(inners) for faceId, (outer, inners) in faces], dtype=np.int64)
+        pointsPerRing = np.array([len(x) for x in rings], dtype=np.int64)
+
+        self.Writer.append('FaceGuidIndex', np.full(len(faces), guidIndex))
+        self.Writer.append('FaceStateId', np.full(len(faces), stateId))
+        self.Writer.append('FaceId', [faceId for faceId, rings in faces])
+        self.Writer.append('FaceRingOffsets', self.RingCount + np.cumsum(ringsPerFace))
+        self.Writer.append('RingPointOffsets', self.PointCount + np.cumsum(pointsPerRing))
+        self.Writer.append('Coordinates', np.concatenate(rings))
+
+        self.RingCount += int(ringsPerFace.sum())
+        self.PointCount += int(pointsPerRing.sum())
+
+    def writeFaceData(self, faceData):
+        # appends all faces of a FaceData read by readFaces, e.g. to merge files
+        self.Writer.append('Guids', faceData.Guids)
+        self.Writer.append('FaceGuidIndex', self.GuidCount + np.asarray(faceData.FaceGuidIndex))
+        self.Writer.append('FaceStateId', faceData.FaceStateId)
+        self.Writer.append('FaceId', faceData.FaceId)
+        self.Writer.append('FaceRingOffsets', self.RingCount + np.asarray(faceData.FaceRingOffsets[1:]))
+        self.Writer.append('RingPointOffsets', self.PointCount + np.asarray(faceData.RingPointOffsets[1:]))
+        self.Writer.append('Coordinates', faceData.Coordinates)
+
+        self.GuidCount += len(faceData.Guids)
+        self.RingCount += int(faceData.FaceRingOffsets[-1])
+        self.PointCount += int(faceData.RingPointOffsets[-1])
+
+    def close(self):
+        self.Writer.close()
+
+
+def readBoxes(path):
+    # structured array view of the box records, memory mapped
+    data = columnarFile.ColumnarFile(path)
+    if data.Attributes.get('format') != BOX_FORMAT:
+        raise ValueError(f'{path} is not a binary box file')
+    return data.column('Boxes')
+
+
+def readFaces(path):
+    data = columnarFile.ColumnarFile(path)
+    if data.Attributes.get('format') != FACE_FORMAT:
+        raise ValueError(f'{path} is not a binary face file')
+    return FaceData(*[data.column(x) for x in FaceData._fields])
+
+
+def getRangeIndices(starts, counts):
+    # indices of the ranges starts[i]:starts[i]+counts[i] one after another
+    counts = np.asarray(counts, dtype=np.int64)
+    ends = np.cumsum(counts)
+    return np.repeat(np.asarray(starts, dtype=np.int64) - ends + counts, counts) + np.arange(ends[-1] if len(ends) else 0)
+
+
+def readBoxGuids(path):
+    return set(np.char.decode(readBoxes(path)['ObjectGuid'], 'ascii').tolist())
+
+
+def readFaceGuids(path):
+    return set(np.char.decode(np.asarray(readFaces(path).Guids), 'ascii').tolist())
+
+
+def selectBoxes(boxes, guids, stateId):
+    # copy of the box records of the products guids with the new state id
+    selected = boxes[np.isin(boxes['ObjectGuid'], [x.encode('ascii') for x in guids])].copy()
+    selected['StateId'] = stateId
+    return selected
+
+
+def selectFaces(faceData, guids, stateId):
+    # FaceData of the faces of the products guids with the new state id, e.g. to reuse them in a new file
+    guidMask = np.isin(faceData.Guids, [x.encode('ascii') for x in guids])
+    faceIndices = np.flatnonzero(guidMask[faceData.FaceGuidIndex])
+    guidIndices, faceGuidIndex = np.unique(np.asarray(faceData.FaceGuidIndex)[faceIndices], return_inverse=True)
+
+    faceRingOffsets = np.asarray(faceData.FaceRingOffsets)
+    ringPointOffsets = np.asarray(faceData.RingPointOffsets)
+    ringsPerFace = np.diff(faceRingOffsets)[faceIndices]
+    ringIndices = getRangeIndices(faceRingOffsets[faceIndices], ringsPerFace)
+    pointsPerRing = np.diff(ringPointOffsets)[ringIndices]
+    pointIndices = getRangeIndices(ringPointOffsets[ringIndices], pointsPerRing)
+
+    return FaceData(np.asarray(faceData.Guids)[guidIndices], faceGuidIndex.astype(np.int32), np.full(len(faceIndices), stateId, dtype=np.int32),
+                    np.asarray(faceData.FaceId)[faceIndices], np.concatenate([[0], np.cumsum(ringsPerFace)]),
+                    np.concatenate([[0], np.cumsum(pointsPerRing)]), np.asarray(faceData.Coordinates)[pointIndices])
+
+
+def getFaceRings(faceData, faceIndex):
+    # list of (n, 3) coordinate views of the rings of one face, outer ring first
+    ringStart, ringEnd = faceData.FaceRingOffsets[faceIndex], faceData.FaceRingOffsets[faceIndex + 1]
+    offsets = faceData.RingPointOffsets[ringStart:ringEnd + 1]
+    return [faceData.Coordinates[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
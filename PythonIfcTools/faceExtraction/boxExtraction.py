@@ -0,0 +1,124 @@
+import numpy as np
+from OCC.Core import Bnd, BRep, BRepBndLib, GeomAbs, gp
+from OCC.Core.BRepAdaptor import BRepAdaptor_Surface
+from OCC.Extend import TopologyUtils
+
+from common import transformation
+from faceExtraction import boxFile
+
+
+BOX_CSV_HEADER = boxFile.BOX_CSV_HEADER
+
+
+def getBoxesForShape(shape, boxBuffer=0.0, matrix=None):
+    # matrix: optional 4x4 array, the boxes are transformed instead of the shape
+    if matrix is None:
+        bbox = Bnd.Bnd_Box()
+        BRepBndLib.brepbndlib.Add(shape, bbox)
+    obbox = Bnd.Bnd_OBB()
+    BRepBndLib.brepbndlib.AddOBB(shape, obbox, True, True, True)
+
+    if matrix is not None:
+        obbox = transformOBB(obbox, matrix)
+        bbox = getTransformedBBox(shape, obbox, matrix)
+
+    if boxBuffer != 0.0:
+        bbox.Enlarge(boxBuffer)
+        obbox.Enlarge(boxBuffer)
+
+    return bbox, obbox
+
+
+def transformOBB(obbox, matrix):
+    # an oriented box stays exact under a rigid transformation
+    center = obbox.Center()
+    center = transformation.transformPoints(matrix, np.array([[center.X(), center.Y(), center.Z()]]))[0]
+    directions = np.array([obbox.XDirection().Coord(), obbox.YDirection().Coord(), obbox.ZDirection().Coord()])
+    xDir, yDir, zDir = transformation.transformDirections(matrix, directions)
+
+    return Bnd.Bnd_OBB(gp.gp_Pnt(*center), gp.gp_Dir(*xDir), gp.gp_Dir(*yDir), gp.gp_Dir(*zDir),
+                       obbox.XHSize(), obbox.YHSize(), obbox.ZHSize())
+
+
+def getOBBCorners(obbox):
+    center = np.array(obbox.Center().Coord())
+    axes = np.array([np.array(obbox.XDirection().Coord()) * obbox.XHSize(),
+                     np.array(obbox.YDirection().Coord()) * obbox.YHSize(),
+                     np.array(obbox.ZDirection().Coord()) * obbox.ZHSize()])
+    signs = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=np.float64)
+    return center + np.matmul(signs, axes)
+
+
+def isPlanarShape(shape):
+    return all(BRepAdaptor_Surface(x).GetType() == GeomAbs.GeomAbs_Plane for x in TopologyUtils.TopologyExplorer(shape).faces())
+
+
+def getShapeVertices(shape):
+    return np.array([BRep.BRep_Tool.Pnt(x).Coord() for x in TopologyUtils.TopologyExplorer(shape).vertices()], dtype=np.float64)
+
+
+def getBBoxFromPoints(points):
+    bbox = Bnd.Bnd_Box()
+    bbox.Update(*points.min(axis=0), *points.max(axis=0))
+    return bbox
+
+
+def getTransformedBBox(shape, transformedOBB, matrix):
+    # for planar shapes the axis aligned box is spanned by the transformed vertices. Curved faces may bulge
+    # out between their vertices, then the corners of the (already transformed) oriented box are used
+    if isPlanarShape(shape):
+        points = transformation.transformPoints(matrix, getShapeVertices(shape))
+    else:
+        points = getOBBCorners(transformedOBB)
+    return getBBoxFromPoints(points)
+
+
+def getBoxTemplate(shape):
+    # the oriented box as arrays [center, axes as rows, half sizes] and the points spanning the axis aligned box
+    # as in getTransformedBBox, so the boxes of instances of the shape can be placed without OCC, see getBoxesFromTemplate
+    obbox = Bnd.Bnd_OBB()
+    BRepBndLib.brepbndlib.AddOBB(shape, obbox, True, True, True)
+    points = getShapeVertices(shape) if isPlanarShape(shape) else getOBBCorners(obbox)
+    axes = np.array([obbox.XDirection().Coord(), obbox.YDirection().Coord(), obbox.ZDirection().Coord()])
+    return (np.array(obbox.Center().Coord()), axes, np.array([obbox.XHSize(), obbox.YHSize(), obbox.ZHSize()])), points
+
+
+def getBoxesFromTemplate(obbTemplate, points, boxBuffer=0.0, matrix=None):
+    # [bbox, obbox] of getBoxesForShape from a getBoxTemplate, placed by the rigid matrix
+    center, axes, halfSizes = obbTemplate
+    obbox = Bnd.Bnd_OBB(gp.gp_Pnt(*center), gp.gp_Dir(*axes[0]), gp.gp_Dir(*axes[1]), gp.gp_Dir(*axes[2]), *halfSizes)
+    if matrix is not None:
+        obbox = transformOBB(obbox, matrix)
+        points = transformation.transformPoints(matrix, points)
+    bbox = getBBoxFromPoints(points)
+
+    if boxBuffer != 0.0:
+        bbox.Enlarge(boxBuffer)
+        obbox.Enlarge(boxBuffer)
+
+    return bbox, obbox
+
+
+def boxesToCSVString(guid, bbox, obbox, stateID=-999):
+    xmin, ymin, zmin, xmax, ymax, zmax = bbox.Get()
+
+    center_obox = obbox.Center()
+    xDir = obbox.XDirection()
+    yDir = obbox.YDirection()
+    zDir = obbox.ZDirection()
+
+    xSize = obbox.XHSize()
+    ySize = obbox.YHSize()
+    zSize = obbox.ZHSize()
+
+    return (f"True;{stateID};{guid};0;{xmin};{ymin};{zmin};{xmax};{ymax};{zmax};{center_obox.X()};{center_obox.Y()};{center_obox.Z()};" +
+            f"{xDir.X()};{xDir.Y()};{xDir.Z()};{yDir.X()};{yDir.Y()};{yDir.Z()};{zDir.X()};{zDir.Y()};{zDir.Z()};" +
+            f"{xSize};{ySize};{zSize}")
+
+
+def boxesToRecord(guid, bbox, obbox, stateID=-999):
+    # same values as boxesToCSVString as a tuple matching binaryOutput.BOX_DTYPE
+    center_obox = obbox.Center()
+    return (True, stateID, guid.encode('ascii'), 0, bbox.Get()[0:3], bbox.Get()[3:6],
+            center_obox.Coord(), obbox.XDirection().Coord(), obbox.YDirection().Coord(), obbox.ZDirection().Coord(),
+            (obbox.XHSize(), obbox.YHSize(), obbox.ZHSize()))
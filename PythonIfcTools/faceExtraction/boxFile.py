@@ -0,0 +1,42 @@
+import collections
+import csv
+
+import numpy as np
+
+from common import columnarFile
+from faceExtraction import binaryOutput
+
+BOX_CSV_HEADER = ("Oriented;StateId;ObjectGuid;Element;BBoxMinX;BBoxMinY;BBoxMinZ;BBoxMaxX;BBoxMaxY;BBoxMaxZ;OBoxCenterX;OBoxCenterY;OBoxCenterZ;" +
+                  "OBoxXDirX;OBoxXDirY;OBoxXDirZ;OBoxYDirX;OBoxYDirY;OBoxYDirZ;OBoxZDirX;OBoxZDirY;OBoxZDirZ;" +
+                  "OBoxXHSize;OBoxYHSize;OBoxZHSize")
+
+# Axes: (n, 3, 3), the rows are the x, y and z direction of each box
+OrientedBoxes = collections.namedtuple('OrientedBoxes', ['Guids', 'Centers', 'Axes', 'HalfSizes'])
+
+BOX_COLUMNS = ['OBoxCenterX', 'OBoxCenterY', 'OBoxCenterZ', 'OBoxXDirX', 'OBoxXDirY', 'OBoxXDirZ',
+               'OBoxYDirX', 'OBoxYDirY', 'OBoxYDirZ', 'OBoxZDirX', 'OBoxZDirY', 'OBoxZDirZ',
+               'OBoxXHSize', 'OBoxYHSize', 'OBoxZHSize']
+
+
+def readBoxFile(path, boxBuffer=0.0):
+    # oriented boxes of IFCFaceBoxExtractor -boxes, csv or binary output
+    with open(path, 'rb') as f:
+        isBinary = f.read(len(columnarFile.MAGIC)) == columnarFile.MAGIC
+
+    if isBinary:
+        records = binaryOutput.readBoxes(path)
+        guids = [x.decode('ascii') for x in records['ObjectGuid']]
+        values = np.column_stack([records['OBoxCenter'], records['OBoxXDir'], records['OBoxYDir'], records['OBoxZDir'], records['OBoxHSize']])
+    else:
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f, delimiter=';')
+            rows = list(reader)
+        guids = [x['ObjectGuid'] for x in rows]
+        values = np.array([[float(x[column]) for column in BOX_COLUMNS] for x in rows], dtype=np.float64).reshape(-1, len(BOX_COLUMNS))
+
+    return OrientedBoxes(guids, values[:, 0:3].copy(), values[:, 3:12].reshape(-1, 3, 3).copy(), values[:, 12:15] + boxBuffer)
+
+
+def getAxisAlignedExtents(boxes):
+    # half extents of the axis aligned boxes around the oriented boxes
+    return np.einsum('nij,nj->ni', np.abs(np.transpose(boxes.Axes, (0, 2, 1))), boxes.HalfSizes)
@@ -0,0 +1,156 @@
+import numpy as np
+
+from common import columnarFile
+from faceExtraction import boxFile, voxelIndex
+
+TREE_FORMAT = 'Green3DScan.BoxTree.1'
+
+
+def buildBoxTree(boxMin, boxMax, leafSize=4):
+    # Bounding volume hierarchy over axis aligned boxes, split at the median of the longest axis.
+    # Nodes are stored in depth first order: the left child of node n is n + 1, the right child is NodeRight[n].
+    # Leaves have NodeCount > 0 and reference BoxOrder[NodeStart:NodeStart + NodeCount]
+    centers = 0.5 * (boxMin + boxMax)
+    order = np.arange(len(boxMin), dtype=np.int64)
+    nodeMin, nodeMax, nodeRight, nodeStart, nodeCount = [], [], [], [], []
+
+    # [start, end, parent whose right child this is]
+    stack = [(0, len(order), -1)] if len(order) > 0 else []
+    while stack:
+        start, end, rightOf = stack.pop()
+        node = len(nodeMin)
+        if rightOf >= 0:
+            nodeRight[rightOf] = node
+
+        boxes = order[start:end]
+        nodeMin.append(boxMin[boxes].min(axis=0))
+        nodeMax.append(boxMax[boxes].max(axis=0))
+        nodeRight.append(-1)
+        if end - start <= leafSize:
+            nodeStart.append(start)
+            nodeCount.append(end - start)
+            continue
+
+        nodeStart.append(0)
+        nodeCount.append(0)
+        axis = int(np.argmax(centers[boxes].max(axis=0) - centers[boxes].min(axis=0)))
+        middle = (start + end) // 2
+        order[start:end] = boxes[np.argpartition(centers[boxes, axis], middle - start)]
+        # the left child is popped first and therefore gets the next index
+        stack.append((middle, end, node))
+        stack.append((start, middle, -1))
+
+    return (np.array(nodeMin, dtype=np.float64).reshape(-1, 3), np.array(nodeMax, dtype=np.float64).reshape(-1, 3),
+            np.array(nodeRight, dtype=np.int32), np.array(nodeStart, dtype=np.int32), np.array(nodeCount, dtype=np.int32), order.astype(np.int32))
+
+
+def writeBoxTree(path, boxes, leafSize=4):
+    # boxes: faceExtraction.boxFile.OrientedBoxes. The tree is built over the axis aligned boxes around them
+    extents = boxFile.getAxisAlignedExtents(boxes)
+    boxMin, boxMax = boxes.Centers - extents, boxes.Centers + extents
+    nodeMin, nodeMax, nodeRight, nodeStart, nodeCount, boxOrder = buildBoxTree(boxMin, boxMax, leafSize)
+
+    with columnarFile.ColumnarWriter(path) as writer:
+        for name, dtype, shape, values in [('Guids', 'S22', (), [x.encode('ascii') for x in boxes.Guids]),
+                                           ('Centers', '<f8', (3,), boxes.Centers), ('Axes', '<f8', (3, 3), boxes.Axes),
+                                           ('HalfSizes', '<f8', (3,), boxes.HalfSizes), ('BoxMin', '<f8', (3,), boxMin),
+                                           ('BoxMax', '<f8', (3,), boxMax), ('NodeMin', '<f8', (3,), nodeMin),
+                                           ('NodeMax', '<f8', (3,), nodeMax), ('NodeRight', '<i4', (), nodeRight),
+                                           ('NodeStart', '<i4', (), nodeStart), ('NodeCount', '<i4', (), nodeCount),
+                                           ('BoxOrder', '<i4', (), boxOrder)]:
+            writer.addColumn(name, dtype, shape)
+            writer.append(name, values)
+        writer.setAttribute('format', TREE_FORMAT)
+        writer.setAttribute('leafSize', leafSize)
+
+    return len(nodeMin)
+
+
+def isOrientedBoxOverlappingBox(center, axes, halfSizes, queryMin, queryMax):
+    # separating axis test of an oriented box against an axis aligned box, the world axes are tested by the caller
+    queryCenter, queryHalf = 0.5 * (queryMin + queryMax), 0.5 * (queryMax - queryMin)
+    testAxes = voxelIndex.getSeparatingAxes(axes)
+    distances = np.abs(testAxes @ (queryCenter - center))
+    radii = np.abs(testAxes @ axes.T) @ halfSizes + np.abs(testAxes) @ queryHalf
+    return bool(np.all(distances <= radii))
+
+
+class BoxTree:
+    # Memory mapped bounding volume hierarchy written by writeBoxTree. Pickling only transfers the path,
+    # so worker processes map the file themselves
+
+    def __init__(self, path):
+        self.Path = path
+        data = columnarFile.ColumnarFile(path)
+        if data.Attributes.get('format') != TREE_FORMAT:
+            raise ValueError(f'{path} is not a box tree file')
+        self.Guids = [x.decode('ascii') for x in data.column('Guids')]
+        for name in ['Centers', 'Axes', 'HalfSizes', 'BoxMin', 'BoxMax', 'NodeMin', 'NodeMax', 'NodeRight', 'NodeStart', 'NodeCount', 'BoxOrder']:
+            setattr(self, name, data.column(name))
+
+    def __getstate__(self):
+        return self.Path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def getLeafBoxes(self, node):
+        return self.BoxOrder[self.NodeStart[node]:self.NodeStart[node] + self.NodeCount[node]]
+
+    def queryBox(self, queryMin, queryMax, exact=True):
+        # ids of the boxes overlapping the axis aligned query box. exact=False only tests the axis aligned boxes
+        queryMin, queryMax = np.asarray(queryMin, dtype=np.float64), np.asarray(queryMax, dtype=np.float64)
+        result = []
+        stack = [0] if len(self.NodeMin) > 0 else []
+        while stack:
+            node = stack.pop()
+            if np.any(self.NodeMin[node] > queryMax) or np.any(self.NodeMax[node] < queryMin):
+                continue
+            if self.NodeCount[node] > 0:
+                for box in self.getLeafBoxes(node).tolist():
+                    if np.any(self.BoxMin[box] > queryMax) or np.any(self.BoxMax[box] < queryMin):
+                        continue
+                    if not exact or isOrientedBoxOverlappingBox(self.Centers[box], self.Axes[box], self.HalfSizes[box], queryMin, queryMax):
+                        result.append(box)
+            else:
+                stack.append(self.NodeRight[node])
+                stack.append(node + 1)
+
+        return result
+
+    def queryPoint(self, point):
+        # ids of the oriented boxes containing the point
+        pointIds, boxIds = self.findPointsInBoxes(np.asarray(point, dtype=np.float64).reshape(1, 3))
+        return boxIds.tolist()
+
+    def findPointsInBoxes(self, points):
+        # [pointIds, boxIds] of all points inside an oriented box. All points descend the tree together, one
+        # level per iteration. Same interface as pointCloudFragmentation.boxIndex.BoxGrid
+        pointIds = np.arange(len(points), dtype=np.int64)
+        nodeIds = np.zeros(len(points), dtype=np.int64)
+        if len(self.NodeMin) == 0:
+            pointIds, nodeIds = pointIds[:0], nodeIds[:0]
+        resultPoints, resultBoxes = [], []
+        while len(pointIds) > 0:
+            current = points[pointIds]
+            inside = np.all((current >= self.NodeMin[nodeIds]) & (current <= self.NodeMax[nodeIds]), axis=1)
+            pointIds, nodeIds = pointIds[inside], nodeIds[inside]
+
+            isLeaf = self.NodeCount[nodeIds] > 0
+            leafPoints, leafNodes = pointIds[isLeaf], nodeIds[isLeaf]
+            counts = self.NodeCount[leafNodes].astype(np.int64)
+            within = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+            candidateBoxes = self.BoxOrder[np.repeat(self.NodeStart[leafNodes], counts) + within].astype(np.int64)
+            candidatePoints = np.repeat(leafPoints, counts)
+            local = np.einsum('nij,nj->ni', self.Axes[candidateBoxes], points[candidatePoints] - self.Centers[candidateBoxes])
+            isInside = np.all(np.abs(local) <= self.HalfSizes[candidateBoxes], axis=1)
+            resultPoints.append(candidatePoints[isInside])
+            resultBoxes.append(candidateBoxes[isInside])
+
+            innerPoints, innerNodes = pointIds[~isLeaf], nodeIds[~isLeaf]
+            pointIds = np.concatenate([innerPoints, innerPoints])
+            nodeIds = np.concatenate([innerNodes + 1, self.NodeRight[innerNodes].astype(np.int64)])
+
+        if not resultPoints:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(resultPoints), np.concatenate(resultBoxes)
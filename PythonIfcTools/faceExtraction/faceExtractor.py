@@ -1,15 +1,13 @@
 import argparse
-import itertools
-import json
 import logging
 import time
 
 import ifcopenshell
-from OCC.Extend import TopologyUtils
 from ifcopenshell import geom
 
 import wktExtraction
-from common import transformation
+from common import selection, transformation
+from faceExtraction import faceTable
 
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
@@ -30,34 +28,11 @@ ifc_file = ifcopenshell.open(args.i)
 settings = geom.settings()
 settings.set(settings.USE_PYTHON_OPENCASCADE, True)
 
-products = []
 if args.entityList:
-    with open(args.entityList) as json_file:
-        entityList = json.load(json_file)
-
-    #JSON enthält Entitäten, die selektiert werden sollen
-    if len(entityList['includeList']) > 0 and len(entityList['excludeList'])== 0:
-        for entType in entityList['includeList']:
-            try:
-                selectedElems = ifc_file.by_type(entType)
-                logging.info('{} instances of {} have been found in the Ifc-File'.format(len(selectedElems), entType))
-                products.append(selectedElems)
-            except Exception as ex:
-                logging.warning('specified entity type {} was not found in selectd IFC-File'.format(entType))
-                print('specified entity type {} was not found in selectd IFC-File'.format(entType))
-                print(ex)
-                logging.exception("Exception occured")
-        # chain entities in one flat list
-        products = list(itertools.chain.from_iterable(products))
-
-    #JSON enthält Entitäten die ausgeschlossen werden sollen
-    elif len(entityList['excludeList']) > 0:
-        products = ifc_file.by_type('IfcProduct')
-        entitiesToExclude = []
-        for elemType in entityList['excludeList']:
-            entitiesToExclude.append(ifc_file.by_type(elemType))
-        entitiesToExclude = list(itertools.chain.from_iterable(entitiesToExclude))
-        products = [x for x in products if x not in entitiesToExclude]
+    # JSON mit Entitätstypen, GlobalIds, Geschossen und Eigenschaften, siehe common/selection.py
+    productSelection = selection.readSelection(args.entityList)
+    products = selection.selectProducts(ifc_file, productSelection)
+    logging.info('{} IfcProducts selected by {}'.format(len(products), selection.describeSelection(productSelection)))
 
 #keine JSON spezifiziert
 else:
@@ -99,15 +74,13 @@ logging.info('a total of {} shapes were created'.format(len(shapes)))
 # Todo: implement usefull stateId
 stateId = "12345"
 
-allPatchInfo = []
+# the faces of all shapes in flat arrays, the polygons are formatted when the file is written
+faces = faceTable.FaceTable(stateId, patchInfo=True)
 patchInfoStart = time.time()
 
 for shape in shapes:
     try:
-        faceId = 0
-        for face in TopologyUtils.TopologyExplorer(shape[0]).faces():
-            allPatchInfo.append(wktExtraction.getPatchInfoFromFace(face, shape[1], faceId, stateId))
-            faceId += 1
+        faces.addFaces(shape[1].GlobalId, *wktExtraction.getFacePlanesForShape(shape[0], withBoxes=True))
     except Exception as ex:
         logging.error('{}\n'.format(ex))
 
@@ -117,8 +90,7 @@ print('patch info extraction finished after {} seconds'.format(patchInfoEnd-patc
 logging.info('patch info extraction finished after {} seconds'.format(patchInfoEnd-patchInfoStart))
 
 with open(args.o, 'w') as f:
-    f.write("StateId;ObjectGuid;FaceId;Normal;Position;BBoxMin;BBoxMax;Polygon\n")
-    f.write("\n".join([x.toString() for x in allPatchInfo if x is not None]))
+    faces.writePatchCsv(f)
 
 totalEnd = time.time()
 print('whole process took {} seconds'.format(totalEnd-totalStart))
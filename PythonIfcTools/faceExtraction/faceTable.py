@@ -0,0 +1,148 @@
+import numpy as np
+
+from faceExtraction import binaryOutput, polygonSerializer
+
+# columns of the face csv of faceExtractor
+PATCH_CSV_HEADER = "StateId;ObjectGuid;FaceId;Normal;Position;BBoxMin;BBoxMax;Polygon"
+
+
+class GrowableArray:
+    # append only array, the capacity is doubled when it is full
+
+    def __init__(self, dtype, shape=(), capacity=1024):
+        self.Data = np.empty((capacity,) + tuple(shape), dtype=dtype)
+        self.Size = 0
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self.Data.dtype).reshape((-1,) + self.Data.shape[1:])
+        end = self.Size + len(values)
+        if end > len(self.Data):
+            data = np.empty((max(end, 2 * len(self.Data)),) + self.Data.shape[1:], dtype=self.Data.dtype)
+            data[:self.Size] = self.Data[:self.Size]
+            self.Data = data
+        self.Data[self.Size:end] = values
+        self.Size = end
+
+    def view(self):
+        return self.Data[:self.Size]
+
+
+def getNewellNormals(coordinates, pointsPerRing, ringIndices):
+    # unit normals of the rings ringIndices by Newell's method, counter clockwise rings point towards the viewer
+    ringStarts = np.cumsum(pointsPerRing) - pointsPerRing
+    following = np.arange(len(coordinates)) + 1
+    following[np.cumsum(pointsPerRing) - 1] = ringStarts
+    current, nextPoints = coordinates, coordinates[following]
+    terms = np.column_stack([(current[:, 1] - nextPoints[:, 1]) * (current[:, 2] + nextPoints[:, 2]),
+                             (current[:, 2] - nextPoints[:, 2]) * (current[:, 0] + nextPoints[:, 0]),
+                             (current[:, 0] - nextPoints[:, 0]) * (current[:, 1] + nextPoints[:, 1])])
+    normals = np.add.reduceat(terms, ringStarts, axis=0)[ringIndices]
+    lengths = np.linalg.norm(normals, axis=1)
+    return normals / np.where(lengths > 0, lengths, 1.0)[:, None]
+
+
+class FaceTable:
+    # The planar faces of many products in flat arrays instead of one object with preformatted strings per face.
+    # Guids has one entry per addFaces call, FaceGuidIndex refers to it. The rings of face i are
+    # FaceRingOffsets[i]:FaceRingOffsets[i+1], the first is the outer ring, the points of ring j are
+    # Coordinates[RingPointOffsets[j]:RingPointOffsets[j+1]], as in binaryOutput.FaceData.
+    # The plane of face i is Normals[i] . x = Offsets[i]. With patchInfo the plane location and the box of every
+    # face as given to addFaces are kept for writePatchCsv
+
+    def __init__(self, stateId=-999, patchInfo=False):
+        self.StateId = stateId
+        self.Guids = GrowableArray('S22', capacity=256)
+        self.FaceGuidIndex = GrowableArray(np.int32)
+        self.FaceId = GrowableArray(np.int32)
+        self.Normals = GrowableArray(np.float64, (3,))
+        self.Offsets = GrowableArray(np.float64)
+        self.FaceRingOffsets = GrowableArray(np.int64)
+        self.RingPointOffsets = GrowableArray(np.int64)
+        self.Coordinates = GrowableArray(np.float64, (3,))
+        self.FaceRingOffsets.append([0])
+        self.RingPointOffsets.append([0])
+        self.Locations = GrowableArray(np.float64, (3,)) if patchInfo else None
+        self.Boxes = GrowableArray(np.float64, (2, 3)) if patchInfo else None
+
+    def getFaceCount(self):
+        return self.FaceId.Size
+
+    def addFaces(self, guid, faces, normals=None, locations=None, boxes=None):
+        # faces: [faceId, [outerRing, innerRings]] with (n, 3) arrays as returned by wktExtraction.getFaceRingsForShape.
+        # Without normals the plane normals are computed from the outer rings. locations (n, 3) and boxes (n, 2, 3)
+        # are required with patchInfo
+        if not faces:
+            return
+        coordinates, pointsPerRing, ringsPerFace = polygonSerializer.getFaceArrays(faces)
+        outerRings = np.cumsum(ringsPerFace) - ringsPerFace
+        if normals is None:
+            normals = getNewellNormals(coordinates, pointsPerRing, outerRings)
+        normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+        firstPoints = coordinates[(np.cumsum(pointsPerRing) - pointsPerRing)[outerRings]]
+
+        if self.Locations is not None:
+            self.Locations.append(locations)
+            self.Boxes.append(boxes)
+        self.FaceGuidIndex.append(np.full(len(faces), self.Guids.Size))
+        self.Guids.append([guid.encode('ascii')])
+        self.FaceId.append([faceId for faceId, rings in faces])
+        self.Normals.append(normals)
+        self.Offsets.append(np.einsum('ij,ij->i', normals, firstPoints))
+        self.FaceRingOffsets.append(self.RingPointOffsets.Size - 1 + np.cumsum(ringsPerFace))
+        self.RingPointOffsets.append(self.Coordinates.Size + np.cumsum(pointsPerRing))
+        self.Coordinates.append(coordinates)
+
+    def getFaceArrays(self, start, end):
+        # [coordinates, points per ring, rings per face] of the faces start:end, see polygonSerializer.getFaceArrays
+        faceRingOffsets = self.FaceRingOffsets.view()[start:end + 1]
+        ringPointOffsets = self.RingPointOffsets.view()[faceRingOffsets[0]:faceRingOffsets[-1] + 1]
+        coordinates = self.Coordinates.view()[ringPointOffsets[0]:ringPointOffsets[-1]]
+        return coordinates, np.diff(ringPointOffsets), np.diff(faceRingOffsets)
+
+    def getPolygonStrings(self, start, end, precision=None, geometryFormat='wkt'):
+        return polygonSerializer.arraysToPolygonStrings(*self.getFaceArrays(start, end), precision, geometryFormat)
+
+    def getGuidStrings(self, start, end):
+        return np.char.decode(self.Guids.view()[self.FaceGuidIndex.view()[start:end]], 'ascii').tolist()
+
+    def iterateBatches(self, batchSize):
+        for start in range(0, self.getFaceCount(), batchSize):
+            yield start, min(start + batchSize, self.getFaceCount())
+
+    def writeRows(self, f, header, rowsOfBatch, batchSize):
+        # the header and the rows separated by newlines without one after the last row, as IFCFaceExtractor and
+        # faceExtractor wrote them before. The strings of only one batch of faces exist at a time
+        f.write(header + "\n")
+        for start, end in self.iterateBatches(batchSize):
+            if start > 0:
+                f.write("\n")
+            f.write("\n".join(rowsOfBatch(start, end)))
+
+    def writeCsv(self, f, precision=None, geometryFormat='wkt', batchSize=10000):
+        # the face csv of IFCFaceExtractor to an open file
+        def rowsOfBatch(start, end):
+            polygons = self.getPolygonStrings(start, end, precision, geometryFormat)
+            return [f"{self.StateId};{guid};{faceId};{polygon}"
+                    for guid, faceId, polygon in zip(self.getGuidStrings(start, end), self.FaceId.view()[start:end].tolist(), polygons)]
+
+        self.writeRows(f, polygonSerializer.FACE_CSV_HEADER, rowsOfBatch, batchSize)
+
+    def writePatchCsv(self, f, batchSize=10000):
+        # the csv of faceExtractor with the plane and box of every face, needs patchInfo
+        def rowsOfBatch(start, end):
+            polygons = self.getPolygonStrings(start, end)
+            return ["{};{};{};{} {} {};POINT({} {} {});POINT({} {} {});POINT({} {} {});{}".format(self.StateId, guid, faceId, *normal, *location, *low, *high, polygon)
+                    for guid, faceId, normal, location, (low, high), polygon in zip(self.getGuidStrings(start, end), self.FaceId.view()[start:end].tolist(),
+                                                                                    self.Normals.view()[start:end].tolist(), self.Locations.view()[start:end].tolist(),
+                                                                                    self.Boxes.view()[start:end].tolist(), polygons)]
+
+        self.writeRows(f, PATCH_CSV_HEADER, rowsOfBatch, batchSize)
+
+    def toFaceData(self):
+        return binaryOutput.FaceData(self.Guids.view(), self.FaceGuidIndex.view(), np.full(self.getFaceCount(), int(self.StateId), dtype=np.int32),
+                                     self.FaceId.view(), self.FaceRingOffsets.view(), self.RingPointOffsets.view(), self.Coordinates.view())
+
+    def writeBinary(self, path, compression=None):
+        writer = binaryOutput.BinaryFaceWriter(path, compression)
+        writer.writeFaceData(self.toFaceData())
+        writer.close()
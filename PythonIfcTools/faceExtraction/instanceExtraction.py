@@ -0,0 +1,142 @@
+import collections
+import logging
+
+import numpy as np
+
+from common import ifcUtils, metrics, transformation
+from faceExtraction import polygonSerializer
+
+# Instancing: products whose body is one IfcMappedItem of the same IfcRepresentationMap, with the same scale and
+# handedness, have the same geometry up to a rigid transformation. Only the first of them by step id (the
+# prototype) is created by the iterator, its faces and boxes are extracted once as an InstanceTemplate and
+# placed for the other instances by their matrices relative to the prototype.
+# Products with openings or projections are cut individually and therefore never instances
+InstanceGroup = collections.namedtuple('InstanceGroup', ['Prototype', 'Instances', 'Matrices'])
+
+# Faces: [faceId, rings] in world coordinates of the prototype, Box: boxExtraction.getBoxTemplate or None
+InstanceTemplate = collections.namedtuple('InstanceTemplate', ['Faces', 'Box'])
+
+BODY_IDENTIFIERS = ['Body', 'Facetation', None]
+
+# geometry of the iterator is in meter
+LENGTH_FACTORS = {'meter': 1.0, 'millimeter': 0.001}
+
+
+def getMappedItem(product):
+    # the IfcMappedItem of a body representation consisting of only this item, None otherwise
+    if product.Representation is None or getattr(product, 'HasOpenings', None) or getattr(product, 'HasProjections', None):
+        return None
+    bodies = [x for x in product.Representation.Representations if x.RepresentationIdentifier in BODY_IDENTIFIERS]
+    if len(bodies) != 1 or len(bodies[0].Items) != 1 or not bodies[0].Items[0].is_a('IfcMappedItem'):
+        return None
+    return bodies[0].Items[0]
+
+
+def hasLocalPlacement(product):
+    # the placement resolver only supports IfcLocalPlacement chains
+    placement = product.ObjectPlacement
+    while placement is not None:
+        if not placement.is_a('IfcLocalPlacement'):
+            return False
+        placement = placement.PlacementRelTo
+    return product.ObjectPlacement is not None
+
+
+def getInstanceGroups(ifc_file, products):
+    # InstanceGroups of the products, Matrices: (n, 4, 4) in meter from the prototype to each instance
+    lengthFactor = LENGTH_FACTORS.get(ifcUtils.getLengthUnit(ifc_file))
+    if lengthFactor is None:
+        logging.warning('instancing needs meter or millimeter as length unit, all products are created separately')
+        return []
+
+    resolver = transformation.PlacementResolver(ifc_file)
+    members = collections.defaultdict(list)
+    for product in sorted(products, key=lambda x: x.id()):
+        item = getMappedItem(product)
+        if item is None or not hasLocalPlacement(product):
+            continue
+        matrix = np.matmul(resolver.getEntityMatrix(product), transformation.getOperatorMatrix(item.MappingTarget))
+        scales = np.round(np.linalg.norm(matrix[:3, :3], axis=0), 9)
+        key = (item.MappingSource.id(), *scales.tolist(), bool(np.linalg.det(matrix[:3, :3]) > 0))
+        matrix[:3, 3] *= lengthFactor
+        members[key].append((product, matrix))
+
+    groups = []
+    for entries in members.values():
+        if len(entries) < 2:
+            continue
+        prototype, prototypeMatrix = entries[0]
+        matrices = np.matmul(np.array([x[1] for x in entries[1:]]), np.linalg.inv(prototypeMatrix))
+        groups.append(InstanceGroup(prototype, [x[0] for x in entries[1:]], matrices))
+    return groups
+
+
+def getTemplate(shape, options):
+    # InstanceTemplate of the prototype shape, runs in the extraction workers instead of productExtraction.extractProduct
+    faces, box = [], None
+    if options.CalcFaces:
+        if options.Mesh:
+            from faceExtraction import meshFaceExtraction
+            faces = meshFaceExtraction.getFaceRingsForMesh(shape)
+        else:
+            from faceExtraction import wktExtraction
+            faces = wktExtraction.getFaceRingsForShape(shape)
+    if options.CalcBoxes:
+        from faceExtraction import boxExtraction
+        box = boxExtraction.getBoxTemplate(shape)
+    return InstanceTemplate(faces, box)
+
+
+def transformFaces(faces, matrix):
+    return [(faceId, [transformation.transformPoints(matrix, outer), [transformation.transformPoints(matrix, x) for x in inners]])
+            for faceId, (outer, inners) in faces]
+
+
+def extractInstance(guid, template, matrix, options):
+    # [faces, box, timing] as productExtraction.extractProduct for the product placed by matrix relative to the
+    # prototype, None for the prototype itself
+    if options.Matrix is not None:
+        matrix = options.Matrix if matrix is None else np.matmul(options.Matrix, matrix)
+    faces, box = [], None
+    faceTime, boxTime = (0.0, 0.0), (0.0, 0.0)
+    binary = options.OutputFormat == 'binary'
+    if options.CalcFaces:
+        watch = metrics.Stopwatch()
+        faces = transformFaces(template.Faces, matrix) if matrix is not None else template.Faces
+        if not binary:
+            faces = polygonSerializer.facesToCSVLines(guid, options.StateID, faces, options.Precision, options.GeometryFormat)
+        faceTime = watch.elapsed()
+    if options.CalcBoxes:
+        watch = metrics.Stopwatch()
+        from faceExtraction import boxExtraction
+        bbox, obbox = boxExtraction.getBoxesFromTemplate(*template.Box, options.BoxBuffer, matrix)
+        if binary:
+            box = boxExtraction.boxesToRecord(guid, bbox, obbox, options.StateID)
+        else:
+            box = boxExtraction.boxesToCSVString(guid, bbox, obbox, options.StateID)
+        boxTime = watch.elapsed()
+
+    return faces, box, metrics.ProductTiming(*faceTime, *boxTime)
+
+
+def expandInstances(results, groups, options):
+    # passes the [guid, faces, box, error, timing] of ExtractionPool.imap through and replaces the template of
+    # every prototype by the results of the prototype and its instances
+    groupsByGuid = {x.Prototype.GlobalId: x for x in groups}
+    for guid, faces, box, error, timing in results:
+        group = groupsByGuid.get(guid)
+        if group is None:
+            yield guid, faces, box, error, timing
+            continue
+        if not isinstance(faces, InstanceTemplate):
+            yield guid, faces, box, error, timing
+            for instance in group.Instances:
+                yield instance.GlobalId, [], None, f'{instance.GlobalId}: extraction of the prototype {guid} failed', metrics.ProductTiming()
+            continue
+
+        for instanceGuid, matrix in [(guid, None)] + [(x.GlobalId, y) for x, y in zip(group.Instances, group.Matrices)]:
+            try:
+                instanceFaces, instanceBox, instanceTiming = extractInstance(instanceGuid, faces, matrix, options)
+                yield instanceGuid, instanceFaces, instanceBox, None, instanceTiming if matrix is not None else timing
+            except Exception as ex:
+                yield instanceGuid, [], None, '{}: {}'.format(instanceGuid, ex), metrics.ProductTiming()
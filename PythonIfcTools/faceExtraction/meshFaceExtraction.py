@@ -0,0 +1,180 @@
+import logging
+
+import numpy as np
+
+from common import transformation
+from contourCalculation import contourHelper
+
+# tolerances in meters (the iterator converts the geometry to SI units) and for unit normals
+WELD_TOLERANCE = 1e-6
+NORMAL_TOLERANCE = 1e-3
+DISTANCE_TOLERANCE = 1e-4
+COLLINEAR_TOLERANCE = 1e-6
+
+
+def weldVertices(vertices, triangles, tolerance=WELD_TOLERANCE):
+    keys = np.round(vertices / tolerance).astype(np.int64)
+    uniqueKeys, firstIndex, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return vertices[firstIndex], inverse.reshape(-1)[triangles]
+
+
+def getTrianglePlanes(vertices, triangles):
+    # unit normals, plane offsets and a mask of the non degenerated triangles
+    p0, p1, p2 = vertices[triangles[:, 0]], vertices[triangles[:, 1]], vertices[triangles[:, 2]]
+    normals = np.cross(p1 - p0, p2 - p0)
+    lengths = np.linalg.norm(normals, axis=1)
+    valid = lengths > WELD_TOLERANCE * WELD_TOLERANCE
+    normals[valid] /= lengths[valid, None]
+    offsets = np.einsum('ij,ij->i', normals, p0)
+    return normals, offsets, valid
+
+
+def getTriangleNeighbours(triangles):
+    # [first, second, opposite of first, opposite of second]: the indices of every two triangles sharing an edge
+    # and the vertices of the triangles opposite to the shared edge. Edge j of a triangle is opposite to vertex j-1
+    edges = triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    opposites = triangles[:, [2, 0, 1]].reshape(-1)
+    keys = np.sort(edges, axis=1)
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+    sortedKeys = keys[order]
+    shared = np.flatnonzero((sortedKeys[1:] == sortedKeys[:-1]).all(axis=1))
+    first, second = order[shared], order[shared + 1]
+    return first // 3, second // 3, opposites[first], opposites[second]
+
+
+def groupTrianglesByPlane(vertices, triangles, normals, offsets):
+    # the connected parts of triangles whose neighbours have (nearly) the same plane get the same group id.
+    # Neighbours are compared instead of rounded plane parameters, so noisy coplanar triangles are not split at a
+    # rounding boundary: their normals may differ by NORMAL_TOLERANCE per component and the opposite vertex of
+    # each has to be within DISTANCE_TOLERANCE of the plane of the other
+    first, second, firstOpposites, secondOpposites = getTriangleNeighbours(triangles)
+    compatible = (np.abs(normals[first] - normals[second]).max(axis=1) <= NORMAL_TOLERANCE) & \
+                 (np.abs(np.einsum('ij,ij->i', normals[first], vertices[secondOpposites]) - offsets[first]) <= DISTANCE_TOLERANCE) & \
+                 (np.abs(np.einsum('ij,ij->i', normals[second], vertices[firstOpposites]) - offsets[second]) <= DISTANCE_TOLERANCE)
+    labels = contourHelper.getComponents(len(triangles), np.column_stack((first, second))[compatible])
+    return np.unique(labels, return_inverse=True)[1].reshape(-1)
+
+
+def getBoundaryEdges(triangles, groups):
+    # directed edges that belong to only one triangle of their plane group, for all groups at once
+    edges = triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    edgeGroups = np.repeat(groups, 3)
+    keys = np.column_stack((edgeGroups, edges.min(axis=1), edges.max(axis=1)))
+    uniqueKeys, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    isBoundary = counts[inverse.reshape(-1)] == 1
+    return edges[isBoundary], edgeGroups[isBoundary]
+
+
+def traceLoops(edges):
+    # closed vertex index loops from directed boundary edges. Open chains of non manifold meshes are dropped
+    successors = {}
+    for i, start in enumerate(edges[:, 0].tolist()):
+        successors.setdefault(start, []).append(i)
+
+    ends = edges[:, 1].tolist()
+    starts = edges[:, 0].tolist()
+    visited = [False] * len(edges)
+    loops = []
+    for first in range(len(edges)):
+        if visited[first]:
+            continue
+        loop = []
+        current = first
+        while current is not None and not visited[current]:
+            visited[current] = True
+            loop.append(starts[current])
+            if ends[current] == starts[first]:
+                loops.append(loop)
+                break
+            current = next((x for x in successors.get(ends[current], []) if not visited[x]), None)
+
+    return loops
+
+
+def removeCollinearPoints(ring):
+    previous, following = np.roll(ring, 1, axis=0), np.roll(ring, -1, axis=0)
+    toPrevious, toFollowing = ring - previous, following - ring
+    sines = np.linalg.norm(np.cross(toPrevious, toFollowing), axis=1)
+    lengths = np.linalg.norm(toPrevious, axis=1) * np.linalg.norm(toFollowing, axis=1)
+    return ring[sines > COLLINEAR_TOLERANCE * lengths]
+
+
+def getPlaneAxes(normal):
+    helper = np.array([1.0, 0.0, 0.0]) if abs(normal[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    xAxis = np.cross(helper, normal)
+    xAxis /= np.linalg.norm(xAxis)
+    return np.column_stack((xAxis, np.cross(normal, xAxis)))
+
+
+def getSignedArea(ring2d):
+    x, y = ring2d[:, 0], ring2d[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def isPointInRing(point, ring2d):
+    xi, yi = ring2d[:, 0], ring2d[:, 1]
+    xj, yj = np.roll(xi, 1), np.roll(yi, 1)
+    crosses = (yi > point[1]) != (yj > point[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xCross = (xj - xi) * (point[1] - yi) / (yj - yi) + xi
+    return np.count_nonzero(crosses & (point[0] < xCross)) % 2 == 1
+
+
+def getPolygonsForPlane(vertices, loops, normal):
+    # the triangles are oriented counter clockwise around the normal, so outer loops have a positive
+    # and inner loops a negative area in the plane. Every inner loop belongs to the smallest outer loop around it
+    axes = getPlaneAxes(normal)
+    outers, inners = [], []
+    for loop in loops:
+        ring = removeCollinearPoints(vertices[loop])
+        if len(ring) < 3:
+            continue
+        ring2d = np.matmul(ring, axes)
+        area = getSignedArea(ring2d)
+        if area > 0:
+            outers.append([ring, ring2d, area, []])
+        elif area < 0:
+            inners.append([ring, ring2d])
+
+    for ring, ring2d in inners:
+        containing = [x for x in outers if isPointInRing(ring2d[0], x[1])]
+        if containing:
+            min(containing, key=lambda x: x[2])[3].append(ring)
+        else:
+            logging.warning('Inner boundary of a mesh face without outer boundary is skipped')
+
+    return [[ring, holes] for ring, ring2d, area, holes in outers]
+
+
+def getFaceRingsForMesh(mesh, matrix=None):
+    # [faceId, rings] for the planar patches of a triangulated shape, same structure as
+    # wktExtraction.getFaceRingsForShape. mesh: [vertices, triangles] as yielded by the mesh iterator
+    vertices, triangles = mesh
+    if len(triangles) == 0:
+        return []
+    if matrix is not None:
+        vertices = transformation.transformPoints(matrix, vertices)
+
+    vertices, triangles = weldVertices(vertices, triangles)
+    normals, offsets, valid = getTrianglePlanes(vertices, triangles)
+    triangles, normals, offsets = triangles[valid], normals[valid], offsets[valid]
+    if len(triangles) == 0:
+        return []
+
+    groups = groupTrianglesByPlane(vertices, triangles, normals, offsets)
+    boundaryEdges, edgeGroups = getBoundaryEdges(triangles, groups)
+
+    # the first triangle of a group defines the normal of its plane
+    groupIds, firstTriangle = np.unique(groups, return_index=True)
+    order = np.argsort(edgeGroups, kind='stable')
+    splits = np.searchsorted(edgeGroups[order], groupIds)
+
+    faceRings = []
+    for i, groupId in enumerate(groupIds.tolist()):
+        groupEdges = boundaryEdges[order[splits[i]:splits[i + 1] if i + 1 < len(splits) else len(order)]]
+        if len(groupEdges) == 0:
+            continue
+        for polygon in getPolygonsForPlane(vertices, traceLoops(groupEdges), normals[firstTriangle[i]]):
+            faceRings.append((len(faceRings), polygon))
+
+    return faceRings
@@ -0,0 +1,257 @@
+import collections
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import tempfile
+
+from common import metrics, selection
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Extraction of large models in partitions, each in its own process with its own memory limit. A partition
+# are the products of one IfcBuildingStorey or IfcBuilding, including the parts of aggregated products.
+# The processes open the Ifc-File themselves and only create the geometry of their partition
+Partition = collections.namedtuple('Partition', ['Name', 'Guids'])
+
+# Options: productExtraction.ExtractionOptions, Compression: None or 'zlib' for the binary output
+PartitionTask = collections.namedtuple('PartitionTask', ['Name', 'IfcPath', 'Guids', 'Options', 'FaceFile', 'BoxFile', 'Compression',
+                                                         'CacheDir', 'CacheSize', 'NumThreads', 'RecordTimes'])
+
+# ProductTimes: [guid, ifcType, iteration wall, iteration cpu, metrics.ProductTiming, write wall, write cpu] per product,
+# only with RecordTimes of the task
+PartitionResult = collections.namedtuple('PartitionResult', ['Name', 'Products', 'Errors', 'Error', 'WallTime', 'CPUTime', 'PeakRSSMB', 'ProductTimes'])
+
+
+def getPartitions(ifc_file, products, partitionType='storey'):
+    # splits the products into one partition per storey or building in file order. Products outside of all
+    # of them, e.g. on site level, form the last partition. Empty partitions are dropped
+    productIds = {x.id() for x in products}
+    containers = ifc_file.by_type('IfcBuildingStorey' if partitionType == 'storey' else 'IfcBuilding')
+    assigned = set()
+    partitions = []
+    for index, container in enumerate(containers):
+        ids = sorted((selection.getDecompositionIds(container) & productIds) - assigned)
+        assigned.update(ids)
+        if ids:
+            name = container.Name if container.Name else container.GlobalId
+            partitions.append(Partition(f'{index}: {name}', [ifc_file.by_id(x).GlobalId for x in ids]))
+
+    rest = sorted(productIds - assigned)
+    if rest:
+        partitions.append(Partition(f'not in any {partitionType}', [ifc_file.by_id(x).GlobalId for x in rest]))
+    return partitions
+
+
+def setMemoryLimit(memoryLimitMB):
+    # limits the address space of the process, allocations beyond raise MemoryError. Not available on windows
+    if not memoryLimitMB:
+        return
+    if resource is None or not hasattr(resource, 'RLIMIT_AS'):
+        logging.warning('memory limit of the partition processes is not supported on this platform')
+        return
+    limit = int(memoryLimitMB * 1024 * 1024)
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+
+
+def getProcessCount(memoryPerProcessMB, maxProcesses=None):
+    # number of partition processes fitting into the available memory if each needs memoryPerProcessMB,
+    # at most maxProcesses or the number of cores. 1 if the memory is unknown
+    maxProcesses = maxProcesses if maxProcesses else multiprocessing.cpu_count()
+    availableMB = metrics.getAvailableMemoryMB()
+    if not availableMB or not memoryPerProcessMB:
+        return 1
+    return max(1, min(maxProcesses, int(availableMB // memoryPerProcessMB)))
+
+
+def extractPartition(task):
+    # runs in a partition process, writes the faces and boxes of the partition to the files of the task
+    watch = metrics.Stopwatch()
+    productTimes, errors = [], []
+    productCounter = 0
+    try:
+        import ifcopenshell
+
+        from common import geometryCache, geometryIterator
+        from faceExtraction import productExtraction, resultWriter
+
+        ifc_file = ifcopenshell.open(task.IfcPath)
+        products = [ifc_file.by_guid(x) for x in task.Guids]
+        if task.Options.Mesh:
+            iterator_settings = geometryIterator.getMeshIteratorSettings()
+        else:
+            iterator_settings = geometryIterator.getBRepIteratorSettings()
+        cache = geometryCache.GeometryCache(task.CacheDir, task.IfcPath, iterator_settings, task.CacheSize) if task.CacheDir else None
+
+        with resultWriter.openResultWriter(task.Options.OutputFormat, task.FaceFile, task.BoxFile, task.Options.StateID, task.Compression) as writer:
+            iterationWatch = metrics.Stopwatch()
+            for product, shape in geometryIterator.iterateShapes(ifc_file, iterator_settings, include=products, numThreads=task.NumThreads, cache=cache):
+                iterationTime = iterationWatch.elapsed()
+                faces, box, error, timing = productExtraction.extractProductSafe(product.GlobalId, shape, task.Options)
+                del shape
+                if error is not None:
+                    errors.append(error)
+                writeWatch = metrics.Stopwatch()
+                writer.write(product.GlobalId, faces, box)
+                if task.RecordTimes:
+                    productTimes.append((product.GlobalId, product.is_a(), *iterationTime, timing, *writeWatch.elapsed()))
+                productCounter += 1
+                iterationWatch = metrics.Stopwatch()
+
+        if cache is not None:
+            cache.close()
+        error = None
+    except MemoryError:
+        error = 'memory limit exceeded'
+    except Exception as ex:
+        error = f'{type(ex).__name__}: {ex}'
+
+    return PartitionResult(task.Name, productCounter, errors, error, *watch.elapsed(), metrics.getPeakRSSMB(), productTimes)
+
+
+def runPartitionProcess(connection, task, memoryLimitMB):
+    # entry point of a partition process, sends the PartitionResult to the parent
+    setMemoryLimit(memoryLimitMB)
+    connection.send(extractPartition(task))
+    connection.close()
+
+
+def runPartitionProcesses(tasks, numProcesses, memoryLimitMB=None):
+    # runs every task in a fresh spawned process, at most numProcesses at once, so the address space of a partition
+    # neither contains this process nor the partitions before it. Yields the PartitionResults in the order of the tasks
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    running = {}
+    nextTask = 0
+    nextResult = 0
+    while nextResult < len(tasks):
+        while nextTask < len(tasks) and len(running) < numProcesses:
+            parentConnection, childConnection = context.Pipe(duplex=False)
+            process = context.Process(target=runPartitionProcess, args=(childConnection, tasks[nextTask], memoryLimitMB))
+            process.start()
+            childConnection.close()
+            running[nextTask] = (process, parentConnection)
+            nextTask += 1
+
+        multiprocessing.connection.wait([x[1] for x in running.values()] + [x[0].sentinel for x in running.values()])
+        for index, (process, connection) in list(running.items()):
+            if connection.poll():
+                try:
+                    result = connection.recv()
+                except EOFError:
+                    result = None
+            elif not process.is_alive():
+                result = None
+            else:
+                continue
+            process.join()
+            connection.close()
+            if result is None:
+                # the process died, e.g. killed by the operating system
+                result = PartitionResult(tasks[index].Name, 0, [], f'process terminated with exit code {process.exitcode}', 0.0, 0.0, None, [])
+            results[index] = result
+            del running[index]
+
+        while nextResult in results:
+            yield results.pop(nextResult)
+            nextResult += 1
+
+
+def mergeCsvFiles(paths, outPath):
+    # concatenates csv files with the same header
+    with open(outPath, 'w') as out:
+        for index, path in enumerate(paths):
+            with open(path) as f:
+                header = f.readline()
+                if index == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+
+
+def mergeBinaryFiles(paths, outPath, outputType, compression=None, outputOptions=None):
+    from faceExtraction import binaryOutput, resultWriter
+
+    if outputType == 'faces':
+        writer = binaryOutput.BinaryFaceWriter(outPath, compression)
+        for path in paths:
+            writer.writeFaceData(binaryOutput.readFaces(path))
+    else:
+        writer = binaryOutput.BinaryBoxWriter(outPath, compression)
+        for path in paths:
+            writer.writeRecords(binaryOutput.readBoxes(path))
+    if outputOptions is not None:
+        writer.Writer.setAttribute(resultWriter.OPTIONS_ATTRIBUTE, outputOptions)
+    writer.close()
+
+
+def extractPartitions(ifcPath, partitions, options, faceFile, boxFile, compression=None, numProcesses=None, memoryLimitMB=None,
+                      cacheDir=None, cacheSize=4096, recorder=None, outputOptions=None):
+    # extracts the partitions in numProcesses processes and merges their results into faceFile and boxFile in the
+    # order of the partitions. Every process is started fresh for its partition, so its memory is freed afterwards.
+    # Every process parses the whole Ifc-File. Returns [number of products, names of the failed partitions]
+    numProcesses = min(numProcesses if numProcesses else 1, max(len(partitions), 1))
+    numThreads = max(1, multiprocessing.cpu_count() // numProcesses)
+    binary = options.OutputFormat == 'binary'
+    extension = '.bin' if binary else '.csv'
+    tempDir = tempfile.mkdtemp(prefix='partitions_', dir=os.path.dirname(os.path.abspath(faceFile if faceFile else boxFile)))
+
+    tasks = [PartitionTask(partition.Name, ifcPath, partition.Guids, options,
+                           os.path.join(tempDir, f'faces_{index}{extension}') if faceFile else None,
+                           os.path.join(tempDir, f'boxes_{index}{extension}') if boxFile else None,
+                           compression, cacheDir, cacheSize, numThreads, recorder is not None and recorder.RecordProducts)
+             for index, partition in enumerate(partitions)]
+
+    productCounter = 0
+    failed = []
+    partitionMetrics = []
+    try:
+        for task, result in zip(tasks, runPartitionProcesses(tasks, numProcesses, memoryLimitMB)):
+            for error in result.Errors:
+                logging.error('{}\n'.format(error))
+                print(error)
+            if result.Error is not None:
+                failed.append(task.Name)
+                logging.error(f'partition {task.Name} failed: {result.Error}')
+                print(f'partition {task.Name} failed: {result.Error}')
+            else:
+                logging.info(f'partition {task.Name}: {result.Products} products in {result.WallTime} seconds, peak memory {result.PeakRSSMB} MB')
+                print(f'partition {task.Name}: {result.Products} products in {result.WallTime} seconds, peak memory {result.PeakRSSMB} MB')
+                productCounter += result.Products
+            partitionMetrics.append({'name': task.Name, 'products': result.Products, 'error': result.Error, 'wallTime': result.WallTime,
+                                     'cpuTime': result.CPUTime, 'peakRSSMB': result.PeakRSSMB})
+
+            if recorder is not None:
+                for guid, ifcType, iterationWall, iterationCPU, timing, writeWall, writeCPU in result.ProductTimes:
+                    recorder.setProductType(guid, ifcType)
+                    recorder.addProductTime(guid, 'geometry iteration', iterationWall, iterationCPU)
+                    recorder.addProductTiming(guid, timing)
+                    recorder.addProductTime(guid, 'write', writeWall, writeCPU)
+                    recorder.finishProduct(guid)
+
+        if recorder is not None:
+            recorder.setAttribute('partitions', partitionMetrics)
+
+        # the results of failed partitions are dropped, they may be incomplete
+        for outPath, outputType in [(faceFile, 'faces'), (boxFile, 'boxes')]:
+            if not outPath:
+                continue
+            paths = [x.FaceFile if outputType == 'faces' else x.BoxFile for x in tasks if x.Name not in failed]
+            if not paths:
+                from faceExtraction import resultWriter
+                resultWriter.openResultWriter(options.OutputFormat, outPath if outputType == 'faces' else None,
+                                              outPath if outputType == 'boxes' else None, options.StateID, compression, outputOptions).close()
+            elif binary:
+                mergeBinaryFiles(paths, outPath, outputType, compression, outputOptions)
+            else:
+                from faceExtraction import resultWriter
+                mergeCsvFiles(paths, outPath)
+                resultWriter.writeCsvOptions(outPath, outputOptions)
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+    return productCounter, failed
@@ -0,0 +1,124 @@
+import functools
+import re
+import struct
+
+import numpy as np
+
+FACE_CSV_HEADER = "StateId;ObjectGuid;FaceId;Polygon"
+
+# ISO WKB type code of POLYGON Z, little endian
+WKB_POLYGON_Z = 1003
+
+TRAILING_ZEROS = re.compile(r'\.?0+(?=[ ,)])')
+
+
+def getCoordinateFormat(precision=None):
+    # None keeps the full repr precision, the same output as buildWKTPolyFromPtList
+    if precision is None:
+        return '%r %r %r'
+    return ' '.join(['%.{}f'.format(precision)] * 3)
+
+
+@functools.lru_cache(maxsize=4096)
+def getPolygonTemplate(pointsPerRing, coordinateFormat):
+    # %-format template of one polygon, most faces of a model share a few ring sizes
+    ringTemplates = ['(' + ', '.join([coordinateFormat] * n) + ')' for n in pointsPerRing]
+    return "POLYGON Z(" + ",".join(ringTemplates) + ")"
+
+
+def getFaceArrays(faces):
+    # [coordinates (n, 3), points per ring, rings per face] of a list of [faceId, [outerRing, innerRings]]
+    rings = [ring for faceId, (outer, inners) in faces for ring in [outer] + list(inners)]
+    pointsPerRing = np.array([len(x) for x in rings], dtype=np.int64)
+    ringsPerFace = np.array([1 + len(inners) for faceId, (outer, inners) in faces], dtype=np.int64)
+    return np.concatenate(rings).astype(np.float64, copy=False), pointsPerRing, ringsPerFace
+
+
+def closeRings(coordinates, pointsPerRing, precision=None):
+    # the coordinates with the first point of every ring repeated at its end, [closed coordinates, points per closed ring]
+    ringEnds = np.cumsum(pointsPerRing)
+    closed = np.insert(coordinates, ringEnds, coordinates[ringEnds - pointsPerRing], axis=0)
+
+    if precision is not None:
+        # adding 0.0 turns -0.0 into 0.0
+        closed = np.round(closed, precision) + 0.0
+
+    return closed, pointsPerRing + 1
+
+
+def getClosedCoordinates(faces, precision=None):
+    # all rings of all faces as one (n, 3) array with the first point of every ring repeated at its end
+    coordinates, pointsPerRing, ringsPerFace = getFaceArrays(faces)
+    return closeRings(coordinates, pointsPerRing, precision)
+
+
+def arraysToWKT(coordinates, pointsPerRing, ringsPerFace, precision=None):
+    # WKT per face of rings given as arrays, see getFaceArrays. All polygons are formatted with one %-operation
+    if len(ringsPerFace) == 0:
+        return []
+
+    closed, pointsPerRing = closeRings(coordinates, pointsPerRing, precision)
+    coordinateFormat = getCoordinateFormat(precision)
+    ringStarts = (np.cumsum(ringsPerFace) - ringsPerFace).tolist()
+    pointsPerRing = pointsPerRing.tolist()
+    templates = [getPolygonTemplate(tuple(pointsPerRing[start:start + count]), coordinateFormat) for start, count in zip(ringStarts, ringsPerFace.tolist())]
+
+    text = "\n".join(templates) % tuple(closed.ravel().tolist())
+    if precision is not None and precision > 0:
+        text = TRAILING_ZEROS.sub('', text)
+
+    return text.split("\n")
+
+
+def facesToWKT(faces, precision=None):
+    # faces: list of [faceId, [outerRing, innerRings]] with (n, 3) arrays, the rings are not closed
+    if not faces:
+        return []
+    return arraysToWKT(*getFaceArrays(faces), precision)
+
+
+def arraysToWKB(coordinates, pointsPerRing, ringsPerFace, precision=None):
+    # ISO WKB (little endian POLYGON Z) per face of rings given as arrays
+    if len(ringsPerFace) == 0:
+        return []
+
+    closed, pointsPerRing = closeRings(coordinates, pointsPerRing, precision)
+    data = closed.astype('<f8', copy=False).tobytes()
+    ringOffsets = np.concatenate([[0], np.cumsum(pointsPerRing)]) * 24
+
+    wkbs = []
+    ringIndex = 0
+    for ringCount in ringsPerFace.tolist():
+        parts = [struct.pack('<BII', 1, WKB_POLYGON_Z, ringCount)]
+        for i in range(ringIndex, ringIndex + ringCount):
+            parts.append(struct.pack('<I', pointsPerRing[i]))
+            parts.append(data[ringOffsets[i]:ringOffsets[i + 1]])
+        wkbs.append(b''.join(parts))
+        ringIndex += ringCount
+
+    return wkbs
+
+
+def facesToWKB(faces, precision=None):
+    if not faces:
+        return []
+    return arraysToWKB(*getFaceArrays(faces), precision)
+
+
+def arraysToPolygonStrings(coordinates, pointsPerRing, ringsPerFace, precision=None, geometryFormat='wkt'):
+    # geometryFormat 'wkb' returns the WKB as upper case hex string, as written by PostGIS
+    if geometryFormat == 'wkb':
+        return [x.hex().upper() for x in arraysToWKB(coordinates, pointsPerRing, ringsPerFace, precision)]
+    return arraysToWKT(coordinates, pointsPerRing, ringsPerFace, precision)
+
+
+def facesToPolygonStrings(faces, precision=None, geometryFormat='wkt'):
+    if not faces:
+        return []
+    return arraysToPolygonStrings(*getFaceArrays(faces), precision, geometryFormat)
+
+
+def facesToCSVLines(guid, stateId, faces, precision=None, geometryFormat='wkt'):
+    # same lines as BIMFace.toCSVString
+    polygons = facesToPolygonStrings(faces, precision, geometryFormat)
+    return ["{};{};{};{}".format(stateId, guid, faceId, polygon) for (faceId, rings), polygon in zip(faces, polygons)]
@@ -0,0 +1,156 @@
+import collections
+import logging
+import multiprocessing
+
+from common import metrics
+from faceExtraction import polygonSerializer
+
+# Matrix: optional 4x4 array applied to the extracted coordinates, e.g. into the building coordinate system
+# OutputFormat: 'csv' returns CSV lines, 'binary' returns [faceId, rings] per face and a box record
+# Precision: decimal places of the csv face polygons, None keeps full precision. GeometryFormat: 'wkt' or 'wkb'
+# Mesh: the shapes are [vertices, triangles] arrays of the mesh iterator instead of BReps, only faces are supported
+# TemplateGuids: prototypes of instanceExtraction, an InstanceTemplate is returned as faces for them
+ExtractionOptions = collections.namedtuple('ExtractionOptions', ['CalcFaces', 'CalcBoxes', 'StateID', 'BoxBuffer', 'Matrix', 'OutputFormat', 'Precision', 'GeometryFormat', 'Mesh',
+                                                                 'TemplateGuids'],
+                                           defaults=[None, 'csv', None, 'wkt', False, None])
+
+
+def extractProduct(guid, shape, options):
+    # returns [faces, box, metrics.ProductTiming]
+    if options.TemplateGuids and guid in options.TemplateGuids:
+        from faceExtraction import instanceExtraction
+        watch = metrics.Stopwatch()
+        template = instanceExtraction.getTemplate(shape, options)
+        return template, None, metrics.ProductTiming(*watch.elapsed())
+
+    faces, box = [], None
+    faceTime, boxTime = (0.0, 0.0), (0.0, 0.0)
+    binary = options.OutputFormat == 'binary'
+    # the extraction modules are imported on first use, mesh faces do not need OCC
+    if options.CalcFaces:
+        watch = metrics.Stopwatch()
+        if options.Mesh:
+            from faceExtraction import meshFaceExtraction
+            faces = meshFaceExtraction.getFaceRingsForMesh(shape, options.Matrix)
+        else:
+            from faceExtraction import wktExtraction
+            faces = wktExtraction.getFaceRingsForShape(shape, options.Matrix)
+        if not binary:
+            faces = polygonSerializer.facesToCSVLines(guid, options.StateID, faces, options.Precision, options.GeometryFormat)
+        faceTime = watch.elapsed()
+    if options.CalcBoxes:
+        watch = metrics.Stopwatch()
+        from faceExtraction import boxExtraction
+        bbox, obbox = boxExtraction.getBoxesForShape(shape, options.BoxBuffer, options.Matrix)
+        if binary:
+            box = boxExtraction.boxesToRecord(guid, bbox, obbox, options.StateID)
+        else:
+            box = boxExtraction.boxesToCSVString(guid, bbox, obbox, options.StateID)
+        boxTime = watch.elapsed()
+
+    return faces, box, metrics.ProductTiming(*faceTime, *boxTime)
+
+
+def extractProductSafe(guid, shape, options):
+    # returns [faces, box, error, timing] instead of raising, so one broken product does not stop a whole chunk
+    try:
+        faces, box, timing = extractProduct(guid, shape, options)
+        return faces, box, None, timing
+    except Exception as ex:
+        return [], None, '{}: {}'.format(guid, ex), metrics.ProductTiming()
+
+
+workerOptions = None
+
+
+def initWorker(options):
+    global workerOptions
+    workerOptions = options
+
+
+def extractChunk(chunk, options=None):
+    # options default to the ones of the worker process
+    options = workerOptions if options is None else options
+    return [extractProductSafe(guid, shape, options) for guid, shape in chunk]
+
+
+def extractSourceChunk(chunk, options):
+    # chunk of [source, guid, shape] of several models, options maps the sources to their ExtractionOptions
+    return [extractProductSafe(guid, shape, options[source]) for source, guid, shape in chunk]
+
+
+class ExtractionPool:
+    # Runs the face and box extraction of [guid, shape] pairs in worker processes. The shapes are pickled
+    # into the workers (BRep serialization of pythonOCC). Results are returned in the order of the input,
+    # and only a bounded number of chunks is in flight, so a streaming producer stays bounded as well.
+    # For the products of several models options is a dictionary source -> ExtractionOptions, which can be
+    # extended while imapSources runs, e.g. when the next model is opened. The options are sent with the chunks then
+
+    def __init__(self, options, numProcesses=None, chunkSize=8, maxPendingChunks=None):
+        self.Options = options
+        self.NumProcesses = numProcesses if numProcesses else multiprocessing.cpu_count()
+        self.ChunkSize = chunkSize
+        self.MaxPendingChunks = maxPendingChunks if maxPendingChunks else 4 * self.NumProcesses
+        self.Pool = None
+        if self.NumProcesses > 1:
+            self.Pool = multiprocessing.Pool(self.NumProcesses, initializer=initWorker, initargs=(options,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.Pool is not None:
+            self.Pool.close()
+            self.Pool.join()
+            self.Pool = None
+
+    def imap(self, productShapes):
+        # productShapes yields [guid, shape], the generator yields [guid, faces, box, error, timing]
+        for (guid, shape), result in self.mapChunks(productShapes, extractChunk):
+            yield (guid,) + tuple(result)
+
+    def imapSources(self, sourceShapes):
+        # sourceShapes yields [source, guid, shape], the generator yields [source, guid, faces, box, error, timing]
+        getChunkOptions = lambda chunk: {x[0]: self.Options[x[0]] for x in chunk}
+        for (source, guid, shape), result in self.mapChunks(sourceShapes, extractSourceChunk, getChunkOptions):
+            yield (source, guid) + tuple(result)
+
+    def mapChunks(self, items, chunkFunction, getChunkOptions=None):
+        # yields [item, result] of chunkFunction. Without getChunkOptions the workers use the options of initWorker
+        if self.Pool is None:
+            for item in items:
+                yield item, chunkFunction([item], self.Options)[0]
+            return
+
+        pending = collections.deque()
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= self.ChunkSize:
+                pending.append((chunk, self.submit(chunkFunction, chunk, getChunkOptions)))
+                chunk = []
+            while len(pending) >= self.MaxPendingChunks:
+                yield from self.collect(*pending.popleft(), chunkFunction)
+
+        if chunk:
+            pending.append((chunk, self.submit(chunkFunction, chunk, getChunkOptions)))
+        while pending:
+            yield from self.collect(*pending.popleft(), chunkFunction)
+
+    def submit(self, chunkFunction, chunk, getChunkOptions):
+        if getChunkOptions is None:
+            return self.Pool.apply_async(chunkFunction, (chunk,))
+        return self.Pool.apply_async(chunkFunction, (chunk, getChunkOptions(chunk)))
+
+    def collect(self, chunk, asyncResult, chunkFunction):
+        try:
+            results = asyncResult.get()
+        except Exception as ex:
+            # e.g. a shape that can not be serialized, extract this chunk in the main process
+            logging.warning(f'extraction of chunk failed in worker, falling back to main process: {ex}')
+            results = chunkFunction(chunk, self.Options)
+
+        yield from zip(chunk, results)
@@ -0,0 +1,141 @@
+import json
+import os
+
+from common import columnarFile, revisionDiff
+from faceExtraction import binaryOutput, boxFile, polygonSerializer
+
+
+# the parameter boxFile of CsvResultWriter hides the module
+BOX_CSV_HEADER = boxFile.BOX_CSV_HEADER
+
+# last column of the merged csv output of several models, see IFCBatchExtractor
+SOURCE_COLUMN = 'SourceFile'
+
+# attribute of the binary output files with the options of getOutputOptions, csv files have them in a sidecar file
+OPTIONS_ATTRIBUTE = 'extractionOptions'
+
+
+def getOutputOptions(buildingCS, boxBuffer, precision, geometryFormat, meshFaces):
+    # the options changing the content of the output files. They are stored with the files, so that an incremental
+    # extraction only reuses the rows of a previous output written with the same options
+    return {'buildingCS': bool(buildingCS), 'boxBuffer': float(boxBuffer), 'precision': precision,
+            'geometryFormat': geometryFormat, 'meshFaces': bool(meshFaces)}
+
+
+def getOptionsPath(csvPath):
+    return csvPath + '.options.json'
+
+
+def writeCsvOptions(csvPath, outputOptions):
+    # without outputOptions a sidecar file of an earlier output is removed, the file can not be reused then
+    optionsPath = getOptionsPath(csvPath)
+    if outputOptions is None:
+        if os.path.exists(optionsPath):
+            os.remove(optionsPath)
+        return
+    with open(optionsPath, 'w') as f:
+        json.dump(outputOptions, f)
+
+
+def readOutputOptions(path, outputFormat):
+    # the options of getOutputOptions the file was written with, None for files written without them
+    if outputFormat == 'binary':
+        return columnarFile.ColumnarFile(path).Attributes.get(OPTIONS_ATTRIBUTE)
+    if not os.path.exists(getOptionsPath(path)):
+        return None
+    with open(getOptionsPath(path)) as f:
+        return json.load(f)
+
+
+class CsvResultWriter:
+    # with sourceColumn the source passed to write is appended to every row. outputOptions of getOutputOptions
+    # are written next to the files
+
+    def __init__(self, faceFile=None, boxFile=None, sourceColumn=False, outputOptions=None):
+        self.FaceFile = open(faceFile, 'w') if faceFile else None
+        self.BoxFile = open(boxFile, 'w') if boxFile else None
+        self.SourceColumn = sourceColumn
+        headerSuffix = ';' + SOURCE_COLUMN if sourceColumn else ''
+        if self.FaceFile is not None:
+            self.FaceFile.write(polygonSerializer.FACE_CSV_HEADER + headerSuffix + "\n")
+        if self.BoxFile is not None:
+            self.BoxFile.write(BOX_CSV_HEADER + headerSuffix + "\n")
+        for path in [faceFile, boxFile]:
+            if path:
+                writeCsvOptions(path, outputOptions)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def writeReusedRows(self, prevFaceFile, prevBoxFile, guids, stateID):
+        # rows of unchanged products from the output files of a previous revision
+        if self.FaceFile is not None:
+            revisionDiff.copyRowsForGuids(prevFaceFile, self.FaceFile, 1, 0, guids, stateID)
+        if self.BoxFile is not None:
+            revisionDiff.copyRowsForGuids(prevBoxFile, self.BoxFile, 2, 1, guids, stateID)
+
+    def write(self, guid, faces, box, source=None):
+        if self.SourceColumn:
+            faces = [x + ';' + source for x in faces]
+            box = box + ';' + source if box is not None else None
+        if faces:
+            self.FaceFile.write("\n".join(faces) + "\n")
+        if box is not None:
+            self.BoxFile.write(box + "\n")
+
+    def close(self):
+        if self.FaceFile is not None:
+            self.FaceFile.close()
+        if self.BoxFile is not None:
+            self.BoxFile.close()
+
+
+class BinaryResultWriter:
+
+    def __init__(self, faceFile=None, boxFile=None, stateID=-999, compression=None, outputOptions=None):
+        self.StateID = stateID
+        self.FaceWriter = binaryOutput.BinaryFaceWriter(faceFile, compression) if faceFile else None
+        self.BoxWriter = binaryOutput.BinaryBoxWriter(boxFile, compression) if boxFile else None
+        if outputOptions is not None:
+            for writer in [self.FaceWriter, self.BoxWriter]:
+                if writer is not None:
+                    writer.Writer.setAttribute(OPTIONS_ATTRIBUTE, outputOptions)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def writeReusedRows(self, prevFaceFile, prevBoxFile, guids, stateID):
+        # faces and boxes of unchanged products from the binary output files of a previous revision
+        if self.FaceWriter is not None:
+            self.FaceWriter.writeFaceData(binaryOutput.selectFaces(binaryOutput.readFaces(prevFaceFile), guids, stateID))
+        if self.BoxWriter is not None:
+            self.BoxWriter.writeRecords(binaryOutput.selectBoxes(binaryOutput.readBoxes(prevBoxFile), guids, stateID))
+
+    def write(self, guid, faces, box):
+        if faces:
+            self.FaceWriter.writeFaces(guid, self.StateID, faces)
+        if box is not None:
+            self.BoxWriter.write(box)
+
+    def close(self):
+        if self.FaceWriter is not None:
+            self.FaceWriter.close()
+        if self.BoxWriter is not None:
+            self.BoxWriter.close()
+
+
+def getDefaultOutputPath(outputType, outputFormat):
+    # ./faceInfo.csv, ./boxInfo.bin, ...
+    return os.path.join('.', outputType + ('.bin' if outputFormat == 'binary' else '.csv'))
+
+
+def openResultWriter(outputFormat, faceFile=None, boxFile=None, stateID=-999, compression=None, outputOptions=None):
+    if outputFormat == 'binary':
+        return BinaryResultWriter(faceFile, boxFile, stateID, compression, outputOptions)
+    return CsvResultWriter(faceFile, boxFile, outputOptions=outputOptions)
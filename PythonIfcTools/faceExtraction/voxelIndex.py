@@ -0,0 +1,152 @@
+import multiprocessing
+
+import numpy as np
+
+from common import columnarFile
+
+VOXEL_FORMAT = 'Green3DScan.Voxels.1'
+
+# voxel (i, j, k) covers [i, i + 1) * resolution etc. in the coordinate system of the boxes. The indices are
+# packed into one int64 key with KEY_BITS per axis, which allows +-2^20 voxels per axis
+KEY_BITS = 21
+KEY_OFFSET = 1 << (KEY_BITS - 1)
+KEY_MASK = (1 << KEY_BITS) - 1
+
+# number of candidate voxels tested at once per box
+MAX_CANDIDATES = 1 << 20
+
+
+def packVoxelKeys(voxels):
+    voxels = np.asarray(voxels, dtype=np.int64) + KEY_OFFSET
+    if np.any(voxels < 0) or np.any(voxels > KEY_MASK):
+        raise ValueError('voxel indices exceed the packable range, use a coarser resolution')
+    return (voxels[:, 0] << (2 * KEY_BITS)) | (voxels[:, 1] << KEY_BITS) | voxels[:, 2]
+
+
+def unpackVoxelKeys(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    return np.column_stack(((keys >> (2 * KEY_BITS)) & KEY_MASK, (keys >> KEY_BITS) & KEY_MASK, keys & KEY_MASK)) - KEY_OFFSET
+
+
+def getSeparatingAxes(axes):
+    # the 15 axes of the separating axis test between an oriented box and axis aligned voxels:
+    # world axes, box axes and their cross products. Parallel cross products are dropped
+    crossAxes = np.cross(np.eye(3)[:, None, :], axes[None, :, :]).reshape(-1, 3)
+    crossAxes = crossAxes[np.linalg.norm(crossAxes, axis=1) > 1e-9]
+    return np.concatenate([axes, crossAxes])
+
+
+def getOBBVoxels(center, axes, halfSizes, resolution):
+    # keys of all voxels overlapping the oriented box (rows of axes are its directions), exact by separating axes
+    extents = np.abs(axes.T) @ halfSizes
+    low = np.floor((center - extents) / resolution).astype(np.int64)
+    high = np.floor((center + extents) / resolution).astype(np.int64)
+
+    # the world axes are covered by the candidate range, the other axes are tested
+    testAxes = getSeparatingAxes(axes)
+    boxRadii = np.abs(testAxes @ axes.T) @ halfSizes
+    voxelRadii = 0.5 * resolution * np.abs(testAxes).sum(axis=1)
+
+    keys = []
+    # the candidates are processed in slices along x, so large boxes at fine resolutions stay bounded in memory
+    sliceSize = max(1, MAX_CANDIDATES // int((high[1] - low[1] + 1) * (high[2] - low[2] + 1)))
+    for x in range(low[0], high[0] + 1, sliceSize):
+        candidates = np.mgrid[x:min(x + sliceSize, high[0] + 1), low[1]:high[1] + 1, low[2]:high[2] + 1].reshape(3, -1).T
+        distances = np.abs(((candidates + 0.5) * resolution - center) @ testAxes.T)
+        overlaps = np.all(distances <= boxRadii + voxelRadii, axis=1)
+        keys.append(packVoxelKeys(candidates[overlaps]))
+
+    return np.concatenate(keys)
+
+
+def getVoxelsForBox(task):
+    center, axes, halfSizes, resolution = task
+    return getOBBVoxels(center, axes, halfSizes, resolution)
+
+
+def computeBoxVoxels(boxes, resolution, numProcesses=1):
+    # list of sorted voxel keys per box of a faceExtraction.boxFile.OrientedBoxes
+    tasks = [(boxes.Centers[i], boxes.Axes[i], boxes.HalfSizes[i], resolution) for i in range(len(boxes.Guids))]
+    if numProcesses > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(numProcesses) as pool:
+            return pool.map(getVoxelsForBox, tasks, chunksize=max(1, len(tasks) // (4 * numProcesses)))
+    return [getVoxelsForBox(x) for x in tasks]
+
+
+def writeVoxelIndex(path, guids, boxVoxels, resolution, compression=None):
+    # Columns: the box -> voxel map as BoxVoxelOffsets / BoxVoxelKeys and the inverse voxel -> box map with the
+    # sorted unique VoxelKeys and VoxelBoxOffsets / VoxelBoxes. Boxes are referenced by their row in Guids
+    counts = np.array([len(x) for x in boxVoxels], dtype=np.int64)
+    allKeys = np.concatenate(boxVoxels) if boxVoxels else np.empty(0, dtype=np.int64)
+    allBoxes = np.repeat(np.arange(len(boxVoxels), dtype=np.int32), counts)
+
+    order = np.lexsort((allBoxes, allKeys))
+    voxelKeys, voxelCounts = np.unique(allKeys[order], return_counts=True)
+
+    with columnarFile.ColumnarWriter(path, compression) as writer:
+        writer.addColumn('Guids', 'S22')
+        writer.addColumn('BoxVoxelOffsets', '<i8')
+        writer.addColumn('BoxVoxelKeys', '<i8')
+        writer.addColumn('VoxelKeys', '<i8')
+        writer.addColumn('VoxelBoxOffsets', '<i8')
+        writer.addColumn('VoxelBoxes', '<i4')
+        writer.setAttribute('format', VOXEL_FORMAT)
+        writer.setAttribute('resolution', resolution)
+
+        writer.append('Guids', [x.encode('ascii') for x in guids])
+        writer.append('BoxVoxelOffsets', np.concatenate([[0], np.cumsum(counts)]))
+        writer.append('BoxVoxelKeys', allKeys)
+        writer.append('VoxelKeys', voxelKeys)
+        writer.append('VoxelBoxOffsets', np.concatenate([[0], np.cumsum(voxelCounts)]))
+        writer.append('VoxelBoxes', allBoxes[order])
+
+    return len(voxelKeys)
+
+
+class VoxelIndex:
+    # Memory mapped voxel index. Pickling only transfers the path, so worker processes map the file themselves
+
+    def __init__(self, path):
+        self.Path = path
+        data = columnarFile.ColumnarFile(path)
+        if data.Attributes.get('format') != VOXEL_FORMAT:
+            raise ValueError(f'{path} is not a voxel index file')
+        self.Resolution = data.Attributes['resolution']
+        self.Guids = [x.decode('ascii') for x in data.column('Guids')]
+        self.BoxVoxelOffsets = data.column('BoxVoxelOffsets')
+        self.BoxVoxelKeys = data.column('BoxVoxelKeys')
+        self.VoxelKeys = data.column('VoxelKeys')
+        self.VoxelBoxOffsets = data.column('VoxelBoxOffsets')
+        self.VoxelBoxes = data.column('VoxelBoxes')
+
+    def __getstate__(self):
+        return self.Path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def getVoxelsForBox(self, boxId):
+        # (n, 3) voxel indices covered by a box
+        return unpackVoxelKeys(self.BoxVoxelKeys[self.BoxVoxelOffsets[boxId]:self.BoxVoxelOffsets[boxId + 1]])
+
+    def getBoxesForVoxel(self, voxel):
+        key = packVoxelKeys(np.array([voxel]))[0]
+        position = np.searchsorted(self.VoxelKeys, key)
+        if position == len(self.VoxelKeys) or self.VoxelKeys[position] != key:
+            return np.empty(0, dtype=np.int32)
+        return self.VoxelBoxes[self.VoxelBoxOffsets[position]:self.VoxelBoxOffsets[position + 1]]
+
+    def findPointsInBoxes(self, points):
+        # [pointIds, boxIds] for every box whose voxels contain a point, by a lookup of the voxel of each point.
+        # Same interface as pointCloudFragmentation.boxIndex.BoxGrid, but at voxel accuracy
+        voxels = np.floor(points / self.Resolution).astype(np.int64)
+        inRange = np.all(np.abs(voxels) < KEY_OFFSET, axis=1)
+        keys = packVoxelKeys(voxels[inRange])
+        positions = np.minimum(np.searchsorted(self.VoxelKeys, keys), max(len(self.VoxelKeys) - 1, 0))
+        found = self.VoxelKeys[positions] == keys if len(self.VoxelKeys) else np.zeros(len(keys), dtype=bool)
+
+        pointIds = np.flatnonzero(inRange)[found]
+        starts = self.VoxelBoxOffsets[positions[found]]
+        counts = self.VoxelBoxOffsets[positions[found] + 1] - starts
+        within = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(pointIds, counts), self.VoxelBoxes[np.repeat(starts, counts) + within].astype(np.int64)
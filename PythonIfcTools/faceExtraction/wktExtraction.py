@@ -1,11 +1,20 @@
 import logging
 
+import numpy as np
 from OCC.Core import BRepTools, BRep, GeomAbs, Bnd, BRepBndLib, gp
 from OCC.Core.BRepAdaptor import BRepAdaptor_Surface
 from OCC.Extend import TopologyUtils
 
+from common import transformation
+from faceExtraction import polygonSerializer
+
+
+FACE_CSV_HEADER = polygonSerializer.FACE_CSV_HEADER
+
 
 class patchInfo:
+    __slots__ = ('StateId', 'ObjectGuid', 'FaceId', 'Normal', 'Position', 'BBoxMin', 'BBoxMax', 'Polygon')
+
     def __init__(self, StateId, ObjectGuid, FaceId, Normal, Position, BBoxMin, BBoxMax, Polygon):
         self.StateId = StateId
         self.ObjectGuid = ObjectGuid
@@ -20,6 +29,8 @@ class patchInfo:
         return "{};{};{};{};{};{};{};{}".format(self.StateId, self.ObjectGuid, self.FaceId, self.Normal, self.Position, self.BBoxMin, self.BBoxMax, self.Polygon)
 
 class BIMFace:
+    __slots__ = ('StateID', 'ObjectGuid', 'FaceID', 'Polygon')
+
     def __init__(self, StateID, ObjectGuid, FaceID, Polygon):
         self.StateID = StateID
         self.ObjectGuid = ObjectGuid
@@ -75,6 +86,18 @@ def buildWKTPolyFromPtList(ptList):
     return WKTRep
 
 
+def getWireCoordinatesFromFace(face):
+    # same as getWirePointListFromFace, but rings as (n, 3) arrays
+    outerWirePointList, innerWirePointList = getWirePointListFromFace(face)
+    outerRing = np.array([pt.Coord() for pt in outerWirePointList], dtype=np.float64)
+    innerRings = [np.array([pt.Coord() for pt in ring], dtype=np.float64) for ring in innerWirePointList]
+    return [outerRing, innerRings]
+
+
+def transformWireCoordinates(rings, matrix):
+    return [transformation.transformPoints(matrix, rings[0]), [transformation.transformPoints(matrix, x) for x in rings[1]]]
+
+
 def getPatchInfoFromFace(face, entity, faceId, stateId):
     try:
         ptList = getWirePointListFromFace(face)
@@ -115,6 +138,48 @@ def getBIMFaceInfo(face,entity, stateId, faceId):
         print(ex)
         logging.exception(ex)
 
+def getFaceRingsForShape(shape, matrix=None):
+    # [faceId, rings] for the planar faces of a shape, faceId is the index of the face in the TopologyExplorer including skipped faces
+    return getFacePlanesForShape(shape, matrix)[0]
+
+def getFacePlanesForShape(shape, matrix=None, withBoxes=False):
+    # [faces, normals, locations, boxes]: the faces as getFaceRingsForShape, the (n, 3) unit normals and locations of
+    # their planes and withBoxes the (n, 2, 3) OCC bounding boxes of the faces as in getPatchInfoFromFace,
+    # otherwise None. The boxes are not transformed by matrix
+    faceRings = []
+    normals = []
+    locations = []
+    boxes = []
+    faceId = 0
+    for face in TopologyUtils.TopologyExplorer(shape).faces():
+        try:
+            surf = BRepAdaptor_Surface(face)
+            if surf.GetType() == GeomAbs.GeomAbs_Plane:
+                rings = getWireCoordinatesFromFace(face)
+                if min(len(x) for x in [rings[0]] + rings[1]) == 0:
+                    logging.warning('Face without vertices in one of its wires is skipped')
+                else:
+                    if matrix is not None:
+                        rings = transformWireCoordinates(rings, matrix)
+                    faceRings.append((faceId, rings))
+                    plane = surf.Plane()
+                    normals.append(plane.Axis().Direction().Coord())
+                    locations.append(plane.Location().Coord())
+                    if withBoxes:
+                        boxes.append([x.Coord() for x in getBBoxPointsForFace(face)])
+            else:
+                logging.warning('Face is not planar. Such faces are not implemented yet.')
+        except Exception as ex:
+            logging.exception(ex)
+        faceId += 1
+
+    normals = np.array(normals, dtype=np.float64).reshape(-1, 3)
+    locations = np.array(locations, dtype=np.float64).reshape(-1, 3)
+    if matrix is not None:
+        normals = transformation.transformDirections(matrix, normals)
+        locations = transformation.transformPoints(matrix, locations)
+    return faceRings, normals, locations, np.array(boxes, dtype=np.float64).reshape(-1, 2, 3) if withBoxes else None
+
 def getBBoxForFace(face):
     box = Bnd.Bnd_Box()
     BRepBndLib.brepbndlib_Add(face, box)
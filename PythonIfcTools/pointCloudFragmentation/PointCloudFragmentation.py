@@ -0,0 +1,180 @@
+import argparse
+import collections
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from faceExtraction import boxFile, boxTree, voxelIndex
+from pointCloudFragmentation import boxIndex, pcdFile
+
+# rough number of bytes needed per point of a chunk in addition to the record itself: float64 coordinates,
+# candidate pairs and the matched copy of the record
+BYTES_PER_POINT = 96
+
+workerGrid = None
+workerReader = None
+
+
+def initWorker(grid, pcdPath):
+    global workerGrid, workerReader
+    workerGrid = grid
+    workerReader = pcdFile.PcdReader(pcdPath) if pcdPath else None
+
+
+def fragmentChunk(task):
+    # task: [start, count] of a memory mapped binary file or the records of an ascii file.
+    # Returns the box ids with their number of points and the matched records sorted by box
+    if isinstance(task, tuple):
+        records = workerReader.readChunk(*task)
+    else:
+        records = task
+
+    points = np.column_stack((records['x'], records['y'], records['z'])).astype(np.float64)
+    pointIds, boxIds = workerGrid.findPointsInBoxes(points)
+    order = np.argsort(boxIds, kind='stable')
+    uniqueBoxes, counts = np.unique(boxIds[order], return_counts=True)
+    return uniqueBoxes, counts, records[pointIds[order]]
+
+
+class FragmentWriter:
+    # Buffers the points of every box and appends them to the point files when the buffer is full
+
+    def __init__(self, outDir, header, guids, bufferBytes):
+        self.BufferBytes = bufferBytes
+        self.BufferedBytes = 0
+        self.Buffers = collections.defaultdict(list)
+        # boxes of the same product write into the same file
+        self.Writers = {}
+        self.BoxWriters = []
+        for guid in guids:
+            if guid not in self.Writers:
+                self.Writers[guid] = pcdFile.PcdWriter(os.path.join(outDir, guid + '.pcd'), header)
+            self.BoxWriters.append(self.Writers[guid])
+
+    def add(self, boxIds, counts, records):
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        for i, boxId in enumerate(boxIds.tolist()):
+            self.Buffers[boxId].append(records[offsets[i]:offsets[i + 1]])
+        self.BufferedBytes += records.nbytes
+        if self.BufferedBytes > self.BufferBytes:
+            self.flush()
+
+    def flush(self):
+        for boxId, parts in self.Buffers.items():
+            self.BoxWriters[boxId].append(np.concatenate(parts))
+        self.Buffers = collections.defaultdict(list)
+        self.BufferedBytes = 0
+
+    def close(self):
+        self.flush()
+        for writer in self.Writers.values():
+            writer.close()
+
+
+def iterTasks(reader, chunkSize):
+    if reader.Header.Data == 'binary':
+        for start in range(0, reader.NumPoints, chunkSize):
+            yield (start, min(chunkSize, reader.NumPoints - start))
+    else:
+        for start, records in reader.iterChunks(chunkSize):
+            yield records
+
+
+def fragmentPointCloud(pcdPath, guids, grid, outDir, numWorkers=None, memoryMB=2048):
+    # writes <ObjectGuid>.pcd with the points inside the boxes into outDir and returns the point counts.
+    # grid: boxIndex.BoxGrid or voxelIndex.VoxelIndex, guids: ObjectGuid of each of its boxes
+    numWorkers = numWorkers if numWorkers else multiprocessing.cpu_count()
+    reader = pcdFile.PcdReader(pcdPath)
+
+    # a quarter of the budget buffers the output, the rest is shared by the chunks in flight
+    memoryBytes = memoryMB * 1024 * 1024
+    maxPendingChunks = 2 * numWorkers
+    chunkSize = max(10000, int(0.75 * memoryBytes / maxPendingChunks / (2 * reader.Dtype.itemsize + BYTES_PER_POINT)))
+    logging.info(f'{reader.NumPoints} points, {len(guids)} boxes, {numWorkers} workers, chunks of {chunkSize} points')
+
+    writer = FragmentWriter(outDir, reader.Header, guids, memoryBytes // 4)
+    pcdForWorkers = pcdPath if reader.Header.Data == 'binary' else None
+    try:
+        if numWorkers == 1:
+            initWorker(grid, pcdForWorkers)
+            for task in iterTasks(reader, chunkSize):
+                writer.add(*fragmentChunk(task))
+        else:
+            with multiprocessing.Pool(numWorkers, initializer=initWorker, initargs=(grid, pcdForWorkers)) as pool:
+                pending = collections.deque()
+                for task in iterTasks(reader, chunkSize):
+                    pending.append(pool.apply_async(fragmentChunk, (task,)))
+                    while len(pending) >= maxPendingChunks:
+                        writer.add(*pending.popleft().get())
+                while pending:
+                    writer.add(*pending.popleft().get())
+    finally:
+        writer.close()
+        reader.close()
+
+    return {guid: x.NumPoints for guid, x in writer.Writers.items()}
+
+
+def main():
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    parser = argparse.ArgumentParser(description='Split a point cloud into one PCD file per oriented box of IFCFaceBoxExtractor')
+    parser.add_argument('-pcd', required=True, help='The input point cloud, binary or ascii PCD')
+    parser.add_argument('-boxFile', help='The box info file of IFCFaceBoxExtractor -boxes, csv or binary')
+    parser.add_argument('-boxTree', help='The box tree of IFCFaceBoxExtractor -boxTree. Used instead of -boxFile')
+    parser.add_argument('-voxelFile', help='The voxel index of IFCFaceBoxExtractor -voxelResolution. Used instead of -boxFile, points are assigned by their voxel')
+    parser.add_argument('-outDir', required=True, help='Directory of the <ObjectGuid>.pcd output files')
+    parser.add_argument('-boxBuffer', help='Additional buffer around the oriented boxes in meter, only with -boxFile', default=0.0, type=float)
+    parser.add_argument('-workers', help='Number of processes. 0 uses all cores', default=0, type=int)
+    parser.add_argument('-memory', help='Memory budget in MB for chunks and output buffers', default=2048, type=float)
+    args = parser.parse_args()
+
+    os.makedirs(args.outDir, exist_ok=True)
+    logging.basicConfig(filename=os.path.join(args.outDir, 'PointCloudFragmentationLog.log'), filemode='w',
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    inputFiles = [x for x in [args.boxFile, args.boxTree, args.voxelFile] if x is not None]
+    if len(inputFiles) != 1:
+        logging.error("Specify one of -boxFile, -boxTree or -voxelFile. Terminating process")
+        sys.exit("Specify one of -boxFile, -boxTree or -voxelFile. Terminating process")
+    # the boxes of the box tree and the voxel index are fixed when IFCFaceBoxExtractor writes them
+    if args.boxBuffer != 0.0 and not args.boxFile:
+        logging.error("-boxBuffer is only supported with -boxFile, use IFCFaceBoxExtractor -boxBuffer for the box tree and the voxel index. Terminating process")
+        sys.exit("-boxBuffer is only supported with -boxFile, use IFCFaceBoxExtractor -boxBuffer for the box tree and the voxel index. Terminating process")
+
+    start = time.time()
+    if args.voxelFile:
+        grid = voxelIndex.VoxelIndex(args.voxelFile)
+        guids = grid.Guids
+    elif args.boxTree:
+        grid = boxTree.BoxTree(args.boxTree)
+        guids = grid.Guids
+    else:
+        boxes = boxFile.readBoxFile(args.boxFile, args.boxBuffer)
+        guids = boxes.Guids
+    if len(guids) == 0:
+        logging.error("No boxes in box file. Terminating process")
+        sys.exit("No boxes in box file. Terminating process")
+    if args.boxFile:
+        grid = boxIndex.BoxGrid(boxes)
+
+    logging.info(f'Read {len(guids)} boxes from {inputFiles[0]}')
+    print(f'Read {len(guids)} boxes from {inputFiles[0]}')
+
+    pointCounts = fragmentPointCloud(args.pcd, guids, grid, args.outDir, args.workers, args.memory)
+
+    logging.info(f"Wrote {sum(pointCounts.values())} points into {len(pointCounts)} files in {time.time()-start} seconds")
+    print(f"Wrote {sum(pointCounts.values())} points into {len(pointCounts)} files in {time.time()-start} seconds")
+
+    logging.info("Finished Program")
+    print("Finished Program")
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,71 @@
+import numpy as np
+
+from faceExtraction import boxFile
+
+
+class BoxGrid:
+    # Uniform grid over the axis aligned boxes around the oriented boxes. Every cell stores the boxes touching it
+    # (compressed as CellStart / CellBoxes), so the candidate boxes of all points of a chunk are found
+    # with a few array operations
+
+    def __init__(self, boxes, maxCells=1 << 22):
+        self.Boxes = boxes
+        extents = boxFile.getAxisAlignedExtents(boxes)
+        boxMin, boxMax = boxes.Centers - extents, boxes.Centers + extents
+
+        self.Origin = boxMin.min(axis=0)
+        size = np.maximum(boxMax.max(axis=0) - self.Origin, 1e-6)
+        # cells about the size of a typical box, but not more than maxCells
+        self.CellSize = max(float(np.median((2 * extents).max(axis=1))), float(np.cbrt(np.prod(size) / maxCells)), 1e-3)
+        self.Dims = (np.floor(size / self.CellSize).astype(np.int64) + 1)
+
+        low = np.floor((boxMin - self.Origin) / self.CellSize).astype(np.int64)
+        high = np.minimum(np.floor((boxMax - self.Origin) / self.CellSize).astype(np.int64), self.Dims - 1)
+        cellIds, boxIds = [], []
+        for i in range(len(boxes.Guids)):
+            cells = np.mgrid[low[i, 0]:high[i, 0] + 1, low[i, 1]:high[i, 1] + 1, low[i, 2]:high[i, 2] + 1].reshape(3, -1)
+            cellIds.append(np.ravel_multi_index(cells, self.Dims))
+            boxIds.append(np.full(cells.shape[1], i, dtype=np.int64))
+
+        cellIds = np.concatenate(cellIds) if cellIds else np.empty(0, dtype=np.int64)
+        boxIds = np.concatenate(boxIds) if boxIds else np.empty(0, dtype=np.int64)
+        order = np.argsort(cellIds, kind='stable')
+        self.CellBoxes = boxIds[order]
+        self.CellStart = np.concatenate([[0], np.cumsum(np.bincount(cellIds, minlength=int(np.prod(self.Dims))))])
+
+    def getCandidateCounts(self, points):
+        cells = np.floor((points - self.Origin) / self.CellSize).astype(np.int64)
+        inside = np.all((cells >= 0) & (cells < self.Dims), axis=1)
+        cellIds = np.zeros(len(points), dtype=np.int64)
+        cellIds[inside] = np.ravel_multi_index(cells[inside].T, self.Dims)
+        counts = np.where(inside, self.CellStart[cellIds + 1] - self.CellStart[cellIds], 0)
+        return cellIds, counts
+
+    def getCandidatePairs(self, cellIds, counts, pointOffset=0):
+        pointIds = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        firstPair = np.repeat(np.cumsum(counts) - counts, counts)
+        within = np.arange(len(pointIds), dtype=np.int64) - firstPair
+        boxIds = self.CellBoxes[np.repeat(self.CellStart[cellIds], counts) + within]
+        return pointIds + pointOffset, boxIds
+
+    def findPointsInBoxes(self, points, maxPairs=1 << 22):
+        # [pointIds, boxIds] of all points inside a box, a point inside several boxes is returned for each of them.
+        # The candidate pairs are tested in batches of about maxPairs to bound the memory
+        cellIds, counts = self.getCandidateCounts(points)
+        cumulative = np.cumsum(counts)
+        pointIdsList, boxIdsList = [], []
+        start = 0
+        while start < len(points):
+            done = cumulative[start - 1] if start > 0 else 0
+            end = max(int(np.searchsorted(cumulative, done + maxPairs, side='right')), start + 1)
+            pointIds, boxIds = self.getCandidatePairs(cellIds[start:end], counts[start:end], start)
+            if len(pointIds) > 0:
+                local = np.einsum('nij,nj->ni', self.Boxes.Axes[boxIds], points[pointIds] - self.Boxes.Centers[boxIds])
+                isInside = np.all(np.abs(local) <= self.Boxes.HalfSizes[boxIds], axis=1)
+                pointIdsList.append(pointIds[isInside])
+                boxIdsList.append(boxIds[isInside])
+            start = end
+
+        if not pointIdsList:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(pointIdsList), np.concatenate(boxIdsList)
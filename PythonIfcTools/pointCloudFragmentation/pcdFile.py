@@ -0,0 +1,123 @@
+import collections
+
+import numpy as np
+
+PCD_TYPES = {('F', 4): 'f4', ('F', 8): 'f8', ('U', 1): 'u1', ('U', 2): 'u2', ('U', 4): 'u4', ('U', 8): 'u8',
+             ('I', 1): 'i1', ('I', 2): 'i2', ('I', 4): 'i4', ('I', 8): 'i8'}
+
+# the point counts of written files are patched when the file is closed, so they are padded to a fixed width
+COUNT_WIDTH = 20
+
+PcdHeader = collections.namedtuple('PcdHeader', ['Fields', 'Sizes', 'Types', 'Counts', 'Width', 'Height', 'Viewpoint', 'Points', 'Data'])
+
+
+def readHeader(f):
+    # returns the header and the byte offset of the point data
+    values = {}
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError('PCD header without DATA line')
+        line = line.decode('ascii').strip()
+        if not line or line.startswith('#'):
+            continue
+        key, *entries = line.split()
+        values[key.upper()] = entries
+        if key.upper() == 'DATA':
+            break
+
+    fields = values['FIELDS']
+    counts = [int(x) for x in values.get('COUNT', ['1'] * len(fields))]
+    width, height = int(values['WIDTH'][0]), int(values.get('HEIGHT', ['1'])[0])
+    header = PcdHeader(fields, [int(x) for x in values['SIZE']], values['TYPE'], counts, width, height,
+                       ' '.join(values.get('VIEWPOINT', ['0 0 0 1 0 0 0'])),
+                       int(values.get('POINTS', [width * height])[0]), values['DATA'][0].lower())
+    return header, f.tell()
+
+
+def getDtype(header):
+    # PCL pads records with fields called '_', they get unique names here
+    names = [x if x != '_' else f'_{i}' for i, x in enumerate(header.Fields)]
+    return np.dtype([(name, '<' + PCD_TYPES[(pcdType, size)], (count,) if count > 1 else ())
+                     for name, pcdType, size, count in zip(names, header.Types, header.Sizes, header.Counts)])
+
+
+def getHeaderString(header, numPoints):
+    lines = ['# .PCD v0.7 - Point Cloud Data file format',
+             'VERSION 0.7',
+             'FIELDS ' + ' '.join(header.Fields),
+             'SIZE ' + ' '.join(str(x) for x in header.Sizes),
+             'TYPE ' + ' '.join(header.Types),
+             'COUNT ' + ' '.join(str(x) for x in header.Counts),
+             'WIDTH ' + str(numPoints).ljust(COUNT_WIDTH),
+             'HEIGHT 1',
+             'VIEWPOINT ' + header.Viewpoint,
+             'POINTS ' + str(numPoints).ljust(COUNT_WIDTH),
+             'DATA binary']
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+class PcdReader:
+    # Binary files are memory mapped and read chunk by chunk, ascii files are parsed chunk by chunk
+
+    def __init__(self, path):
+        self.Path = path
+        with open(path, 'rb') as f:
+            self.Header, self.DataOffset = readHeader(f)
+        self.Dtype = getDtype(self.Header)
+        self.NumPoints = self.Header.Points
+
+        if self.Header.Data not in ('binary', 'ascii'):
+            raise ValueError(f'PCD data type {self.Header.Data} is not supported, convert the file to binary or ascii')
+        if not {'x', 'y', 'z'}.issubset(self.Dtype.names):
+            raise ValueError(f'{path} has no x, y and z fields')
+
+        self.Map = None
+        if self.Header.Data == 'binary' and self.NumPoints > 0:
+            self.Map = np.memmap(path, dtype=self.Dtype, mode='r', offset=self.DataOffset, shape=(self.NumPoints,))
+
+    def readChunk(self, start, count):
+        # copy of the records [start, start + count) of a binary file
+        return np.array(self.Map[start:start + count])
+
+    def iterChunks(self, chunkSize):
+        # yields [start, records]
+        if self.Header.Data == 'binary':
+            for start in range(0, self.NumPoints, chunkSize):
+                yield start, self.readChunk(start, chunkSize)
+            return
+
+        with open(self.Path, 'r') as f:
+            f.seek(self.DataOffset)
+            start = 0
+            while start < self.NumPoints:
+                records = np.atleast_1d(np.loadtxt(f, dtype=self.Dtype, max_rows=min(chunkSize, self.NumPoints - start)))
+                if len(records) == 0:
+                    break
+                yield start, records
+                start += len(records)
+
+    def close(self):
+        self.Map = None
+
+
+class PcdWriter:
+    # Appends binary records without keeping the file open, so thousands of outputs can be written at once
+
+    def __init__(self, path, header):
+        self.Path = path
+        self.Header = header
+        self.NumPoints = 0
+        with open(self.Path, 'wb') as f:
+            f.write(getHeaderString(self.Header, 0))
+
+    def append(self, records):
+        if len(records) == 0:
+            return
+        with open(self.Path, 'ab') as f:
+            f.write(np.ascontiguousarray(records).tobytes())
+        self.NumPoints += len(records)
+
+    def close(self):
+        with open(self.Path, 'r+b') as f:
+            f.write(getHeaderString(self.Header, self.NumPoints))
@@ -0,0 +1,16 @@
+import pytest
+
+from common.extractionError import ExtractionError
+from extractionService import extractionApi
+
+
+def test_invalid_options_raise_instead_of_exiting(tmp_path):
+    with pytest.raises(ExtractionError, match='No output type specified'):
+        extractionApi.extractFacesAndBoxes(str(tmp_path / 'model.ifc'))
+    with pytest.raises(ExtractionError, match='The box tree needs -boxes'):
+        extractionApi.extractFacesAndBoxes(str(tmp_path / 'model.ifc'), faces=True, boxTree=True)
+
+
+def test_contour_without_storey_raises_instead_of_exiting(tmp_path):
+    with pytest.raises(ExtractionError, match='Either -s, -allStoreys or -heights is required'):
+        extractionApi.calculateContour(str(tmp_path / 'model.ifc'), str(tmp_path), 0, s=None)
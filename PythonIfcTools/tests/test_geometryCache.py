@@ -0,0 +1,45 @@
+import os
+
+from ifcopenshell import geom
+
+from common import geometryCache
+
+
+def createCache(tmp_path, maxSizeMB=1.0):
+    ifcPath = tmp_path / 'model.ifc'
+    if not ifcPath.exists():
+        ifcPath.write_text('ISO-10303-21;')
+    return geometryCache.GeometryCache(str(tmp_path / 'cache'), str(ifcPath), geom.settings(), maxSizeMB)
+
+
+def test_entry_evicted_by_another_process_after_reading_is_a_hit(tmp_path, monkeypatch):
+    cache = createCache(tmp_path)
+    cache.store('guid', [1, 2, 3])
+
+    def evictedInBetween(path, times):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, 'utime', evictedInBetween)
+    assert cache.load('guid') == (True, [1, 2, 3])
+
+
+def test_cache_is_only_walked_when_the_tracked_size_exceeds_the_limit(tmp_path, monkeypatch):
+    cache = createCache(tmp_path)
+    cache.store('a', b'x' * 1000)
+    cache.close()
+    trackedSize = cache.readTrackedSize()
+    assert trackedSize > 1000
+
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(os, 'walk', lambda *args: walks.append(args) or walk(*args))
+    cache = createCache(tmp_path)
+    cache.store('b', b'x' * 1000)
+    cache.close()
+    assert walks == [] and cache.readTrackedSize() > trackedSize
+
+    cache = createCache(tmp_path, 1500 / (1024 * 1024))
+    cache.store('c', b'x' * 1000)
+    assert cache.evict() == 2
+    assert len(walks) == 1 and cache.readTrackedSize() < 1500
+    assert cache.load('c')[0] and not cache.load('a')[0]
@@ -0,0 +1,42 @@
+import numpy as np
+
+from faceExtraction import meshFaceExtraction
+
+
+def getQuadMesh(z):
+    # 1 x 1 m quad split along the diagonal from vertex 0 to 2, z: the heights of the 4 corners
+    vertices = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [1.0, 1.0, 0.0], [0.0, 1.0, 0.0]])
+    vertices[:, 2] = z
+    return vertices, np.array([[0, 1, 2], [0, 2, 3]])
+
+
+def getFoldedQuadMesh(slope, fold, height=3.0):
+    # the slopes of the two triangles in x and y are slope + fold and slope - fold
+    return getQuadMesh(height + np.array([0.0, slope + fold, 2 * slope, 2 * slope - (slope - fold)]))
+
+
+def test_coplanar_quad_across_a_rounding_boundary_is_one_face():
+    # the normals of the triangles are on both sides of a multiple of half the normal tolerance
+    slope = 0.5 * meshFaceExtraction.NORMAL_TOLERANCE
+    vertices, triangles = getFoldedQuadMesh(slope, 1e-6)
+    normals, offsets, valid = meshFaceExtraction.getTrianglePlanes(vertices, triangles)
+    assert np.round(normals[0, 0] / meshFaceExtraction.NORMAL_TOLERANCE) != np.round(normals[1, 0] / meshFaceExtraction.NORMAL_TOLERANCE)
+
+    faces = meshFaceExtraction.getFaceRingsForMesh((vertices, triangles))
+    assert len(faces) == 1
+    faceId, (outer, inners) = faces[0]
+    assert len(outer) == 4 and inners == []
+
+
+def test_noisy_coplanar_quad_is_one_face():
+    rng = np.random.default_rng(0)
+    for noise in rng.uniform(-2e-5, 2e-5, (50, 4)):
+        faces = meshFaceExtraction.getFaceRingsForMesh(getQuadMesh(3.0 + noise))
+        assert len(faces) == 1
+        assert len(faces[0][1][0]) == 4
+
+
+def test_folded_quad_is_split():
+    faces = meshFaceExtraction.getFaceRingsForMesh(getFoldedQuadMesh(0.0, 0.01))
+    assert len(faces) == 2
+    assert all(len(outer) == 3 for faceId, (outer, inners) in faces)
@@ -0,0 +1,47 @@
+from common import metrics
+
+
+def recordProducts(recorder, times):
+    for guid, wallTime in times:
+        recorder.setProductType(guid, 'IfcWall' if wallTime > 1 else 'IfcSlab')
+        recorder.addProductTime(guid, 'geometry iteration', wallTime, 0.5 * wallTime)
+        recorder.addProductTiming(guid, metrics.ProductTiming(FaceWallTime=1.0, FaceCPUTime=1.0))
+        recorder.finishProduct(guid)
+
+
+def test_finished_products_are_summed_and_only_the_slowest_kept():
+    recorder = metrics.MetricsRecorder('test', slowestCount=2)
+    recordProducts(recorder, [('a', 0.5), ('b', 3.0), ('c', 2.0), ('d', 0.1), ('e', 4.0)])
+    assert recorder.Products == {}
+    assert len(recorder.Slowest) == 2
+
+    result = recorder.toDict()
+    assert [x['guid'] for x in result['slowestProducts']] == ['e', 'b']
+    assert result['slowestProducts'][0]['wallTime'] == 5.0
+    assert result['productStages']['geometry iteration']['count'] == 5
+    assert result['productStages']['face extraction']['wallTime'] == 5.0
+    assert result['entityTypes']['IfcWall']['count'] == 3
+    assert result['entityTypes']['IfcSlab']['count'] == 2
+
+
+def test_unfinished_products_are_included_by_toDict():
+    recorder = metrics.MetricsRecorder('test')
+    recorder.addProductTime('a', 'write', 1.0, 1.0)
+    assert [x['guid'] for x in recorder.toDict()['slowestProducts']] == ['a']
+
+
+def test_without_recordProducts_no_product_is_kept():
+    recorder = metrics.MetricsRecorder('test', recordProducts=False)
+    assert list(recorder.timeIterator(range(3), 'geometry iteration', lambda x: (str(x), 'IfcWall'))) == [0, 1, 2]
+    recordProducts(recorder, [('a', 0.5)])
+    result = recorder.toDict()
+    assert recorder.Products == {}
+    assert result['productStages'] == {} and result['slowestProducts'] == []
+
+
+def test_products_of_several_sources_with_the_same_guid_are_kept_apart():
+    recorder = metrics.MetricsRecorder('test')
+    recordProducts(recorder, [(('ARC', 'a'), 2.0), (('STR', 'a'), 3.0)])
+    result = recorder.toDict()
+    assert [(x['source'], x['guid']) for x in result['slowestProducts']] == [('STR', 'a'), ('ARC', 'a')]
+    assert result['productStages']['geometry iteration']['count'] == 2
@@ -0,0 +1,20 @@
+from faceExtraction import resultWriter
+
+OPTIONS = resultWriter.getOutputOptions(True, 0.1, 3, 'wkt', False)
+
+
+def test_output_options_are_stored_with_the_files(tmp_path):
+    for outputFormat, extension in [('csv', '.csv'), ('binary', '.bin')]:
+        faceFile, boxFile = str(tmp_path / ('faces' + extension)), str(tmp_path / ('boxes' + extension))
+        resultWriter.openResultWriter(outputFormat, faceFile, boxFile, outputOptions=OPTIONS).close()
+        assert resultWriter.readOutputOptions(faceFile, outputFormat) == OPTIONS
+        assert resultWriter.readOutputOptions(boxFile, outputFormat) == OPTIONS
+
+
+def test_files_written_without_options_have_none(tmp_path):
+    faceFile = str(tmp_path / 'faces.csv')
+    resultWriter.openResultWriter('csv', faceFile, outputOptions=OPTIONS).close()
+    resultWriter.CsvResultWriter(faceFile, sourceColumn=True).close()
+    assert resultWriter.readOutputOptions(faceFile, 'csv') is None
+    resultWriter.openResultWriter('binary', str(tmp_path / 'faces.bin')).close()
+    assert resultWriter.readOutputOptions(str(tmp_path / 'faces.bin'), 'binary') is None